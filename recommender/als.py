@@ -0,0 +1,151 @@
+"""
+Implicit ALS Module
+Matrix Factorization cho implicit feedback (Hu, Koren & Volinsky 2008) - engine CF thay thế
+cho neighborhood CF, bật bằng settings.RECOMMENDER_CF_ENGINE = 'als'.
+
+- Confidence: c_ui = 1 + alpha * r_ui, preference p_ui = 1 với mọi interaction đã quan sát
+- Mỗi nửa vòng lặp giải (YᵀY + Yᵀ(C_u - I)Y + λI) x_u = Yᵀ C_u p_u cho tất cả users (rồi items)
+  bằng vài bước Conjugate Gradient, vectorized theo block users:
+  phép nhân P @ YᵀY là GEMM -> chạy đa luồng qua BLAS của NumPy
+- Serving: score của user = U[u] @ Vᵀ, hotel tương tự = dot product giữa item factors đã normalize
+"""
+from typing import Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from django.conf import settings
+
+# Số interactions tối đa xử lý mỗi block CG (giới hạn bộ nhớ tạm nnz x factors)
+ALS_BLOCK_NNZ = 500_000
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _row_blocks(indptr: np.ndarray, block_nnz: int):
+    """Chia các hàng thành block liên tiếp, mỗi block ~block_nnz phần tử khác 0."""
+    n_rows = indptr.shape[0] - 1
+    start = 0
+    while start < n_rows:
+        stop = int(np.searchsorted(indptr, indptr[start] + block_nnz, side='right')) - 1
+        stop = min(max(stop, start + 1), n_rows)
+        yield start, stop
+        start = stop
+
+
+def _cg_block(confidence: csr_matrix, X: np.ndarray, Y: np.ndarray, gram: np.ndarray, cg_steps: int) -> np.ndarray:
+    """Conjugate Gradient cho 1 block hàng, mỗi hàng là 1 hệ phương trình độc lập (alpha/beta theo hàng)."""
+    rows = np.repeat(np.arange(confidence.shape[0]), np.diff(confidence.indptr))
+    Y_obs = Y[confidence.indices]
+    conf_minus_one = confidence.data - 1.0
+
+    def apply_a(P: np.ndarray) -> np.ndarray:
+        # (YᵀY + λI) p + Yᵀ (C - I) Y p, phần sparse chỉ tính trên các interactions đã quan sát
+        weights = conf_minus_one * np.einsum('ij,ij->i', Y_obs, P[rows])
+        return P @ gram + csr_matrix((weights, confidence.indices, confidence.indptr), shape=confidence.shape) @ Y
+
+    # b = Yᵀ C_u p_u (p = 1 cho interactions đã quan sát)
+    B = confidence @ Y
+    R = B - apply_a(X)
+    P = R.copy()
+    rs_old = np.einsum('ij,ij->i', R, R)
+
+    for _ in range(cg_steps):
+        AP = apply_a(P)
+        p_ap = np.einsum('ij,ij->i', P, AP)
+        alpha = np.divide(rs_old, p_ap, out=np.zeros_like(rs_old), where=p_ap > 1e-12)
+        X += alpha[:, None] * P
+        R -= alpha[:, None] * AP
+        rs_new = np.einsum('ij,ij->i', R, R)
+        beta = np.divide(rs_new, rs_old, out=np.zeros_like(rs_new), where=rs_old > 1e-12)
+        P = R + beta[:, None] * P
+        rs_old = rs_new
+
+    return X
+
+
+def solve_factors(
+    confidence: csr_matrix,
+    X: np.ndarray,
+    Y: np.ndarray,
+    regularization: float,
+    cg_steps: int,
+    block_nnz: int = ALS_BLOCK_NNZ
+) -> np.ndarray:
+    """Cập nhật X (in-place) với Y cố định cho tất cả hàng của ma trận confidence."""
+    gram = Y.T @ Y + regularization * np.eye(Y.shape[1])
+    for start, stop in _row_blocks(confidence.indptr, block_nnz):
+        X[start:stop] = _cg_block(confidence[start:stop], X[start:stop], Y, gram, cg_steps)
+    return X
+
+
+def train_als(
+    ratings: csr_matrix,
+    factors: int = None,
+    regularization: float = None,
+    alpha: float = None,
+    iterations: int = None,
+    cg_steps: int = None,
+    random_state: int = 42
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Train implicit ALS trên User-Item ratings (Users x Hotels).
+    Tham số None -> lấy từ settings RECOMMENDER_ALS_*.
+
+    Returns:
+        (user_factors, item_factors) float32, shape (Users x F), (Hotels x F)
+    """
+    factors = factors or _setting('RECOMMENDER_ALS_FACTORS', 32)
+    regularization = regularization if regularization is not None else _setting('RECOMMENDER_ALS_REGULARIZATION', 0.05)
+    alpha = alpha if alpha is not None else _setting('RECOMMENDER_ALS_ALPHA', 10.0)
+    iterations = iterations or _setting('RECOMMENDER_ALS_ITERATIONS', 10)
+    cg_steps = cg_steps or _setting('RECOMMENDER_ALS_CG_STEPS', 3)
+
+    confidence = csr_matrix(ratings, dtype=np.float64, copy=True)
+    confidence.data = 1.0 + alpha * confidence.data
+    confidence_t = confidence.T.tocsr()
+
+    rng = np.random.default_rng(random_state)
+    user_factors = rng.normal(scale=0.01, size=(confidence.shape[0], factors))
+    item_factors = rng.normal(scale=0.01, size=(confidence.shape[1], factors))
+
+    for _ in range(iterations):
+        solve_factors(confidence, user_factors, item_factors, regularization, cg_steps)
+        solve_factors(confidence_t, item_factors, user_factors, regularization, cg_steps)
+
+    return user_factors.astype(np.float32), item_factors.astype(np.float32)
+
+
+def item_gram(item_factors: np.ndarray) -> np.ndarray:
+    """YᵀY (F x F) - lưu cùng model để fold-in user mới không phải tính lại."""
+    item_factors = item_factors.astype(np.float64)
+    return item_factors.T @ item_factors
+
+
+def fold_in_user(
+    ratings_row: csr_matrix,
+    item_factors: np.ndarray,
+    gram: np.ndarray,
+    regularization: float = None,
+    alpha: float = None
+) -> np.ndarray:
+    """
+    Tính factor cho 1 user từ ratings hiện tại với item factors cố định (giải chính xác F x F),
+    dùng cho user mới / user có events mới trong delta buffer.
+    """
+    regularization = regularization if regularization is not None else _setting('RECOMMENDER_ALS_REGULARIZATION', 0.05)
+    alpha = alpha if alpha is not None else _setting('RECOMMENDER_ALS_ALPHA', 10.0)
+
+    confidence = 1.0 + alpha * np.asarray(ratings_row.data, dtype=np.float64)
+    Y_obs = item_factors[ratings_row.indices].astype(np.float64)
+    a = gram + (Y_obs.T * (confidence - 1.0)) @ Y_obs + regularization * np.eye(gram.shape[0])
+    b = Y_obs.T @ confidence
+    return np.linalg.solve(a, b)
+
+
+def similar_item_scores(item_factors: np.ndarray, h_idx: int) -> np.ndarray:
+    """Cosine giữa item factors của hotel `h_idx` và tất cả hotels."""
+    norms = np.linalg.norm(item_factors, axis=1)
+    norms[norms == 0] = 1.0
+    return (item_factors @ item_factors[h_idx]) / (norms * norms[h_idx])
@@ -0,0 +1,310 @@
+"""
+ANN Index Module
+Approximate nearest neighbours (IVF - Inverted File) thuần NumPy cho mọi tập vectors của recommender:
+TF-IDF rows (Content-Based), item vectors (Item-Based CF), item factors (ALS).
+
+- Coarse quantizer: spherical k-means trên vectors (sparse / nhiều chiều -> random projection
+  xuống PROJECTION_DIM chiều trước), mỗi vector thuộc 1 list (cluster)
+- Query: chọn `nprobe` lists gần nhất, tính score CHÍNH XÁC (dot product trên vectors gốc)
+  chỉ với các vectors trong các lists đó -> chi phí ~ nprobe / n_lists của brute force
+- nprobe là núm vặn recall / latency (RECOMMENDER_ANN_NPROBE), measure_recall() đo recall
+  so với exact search trên 1 sample queries
+
+Vectors nên được L2-normalize để dot product chính là cosine similarity.
+"""
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import issparse
+from django.conf import settings
+
+from .neighbors import MAX_BLOCK_ELEMENTS, build_topk_neighbors
+from .ranking import top_k_rows
+
+PROJECTION_DIM = 64
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 20_000
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def should_use_ann(n_items: int) -> bool:
+    """Dùng ANN khi số vectors đủ lớn (RECOMMENDER_ANN_MIN_ITEMS), nhỏ hơn thì exact search rẻ hơn."""
+    return n_items >= _setting('RECOMMENDER_ANN_MIN_ITEMS', 20_000)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _dense(matrix) -> np.ndarray:
+    matrix = matrix.toarray() if issparse(matrix) else np.asarray(matrix)
+    return matrix.astype(np.float32, copy=False)
+
+
+def _row_chunks(n_rows: int, n_cols: int):
+    step = max(1, MAX_BLOCK_ELEMENTS // max(n_cols, 1))
+    for start in range(0, n_rows, step):
+        yield start, min(start + step, n_rows)
+
+
+def _spherical_kmeans(vectors: np.ndarray, n_lists: int, rng: np.random.Generator) -> np.ndarray:
+    """K-means trên mặt cầu đơn vị (cosine), trả về centroids đã normalize."""
+    centroids = vectors[rng.choice(vectors.shape[0], n_lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = ~sums.any(axis=1)
+        # Cluster rỗng -> lấy lại 1 vector ngẫu nhiên
+        sums[empty] = vectors[rng.choice(vectors.shape[0], int(empty.sum()))]
+        centroids = _normalize_rows(sums)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """
+    Inverted File index: centroids + items được nhóm liên tiếp theo list.
+
+    Attributes:
+        centroids: float32 (n_lists x d) - centroids đã normalize trong không gian coarse
+        offsets: int64 (n_lists + 1) - items của list l là items[offsets[l]:offsets[l+1]]
+        items: int32 (N) - index của vectors, sắp xếp theo list
+        projection: float32 (D x d) hoặc None - random projection cho coarse space
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, items: np.ndarray,
+                 projection: Optional[np.ndarray] = None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.items = items
+        self.projection = projection
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, vectors, n_lists: Optional[int] = None, projection_dim: int = PROJECTION_DIM,
+              random_state: int = 42) -> 'IVFIndex':
+        """
+        Build index trên `vectors` (dense hoặc sparse, mỗi hàng 1 item).
+
+        Args:
+            n_lists: Số lists (mặc định ~ 4 * sqrt(N))
+        """
+        rng = np.random.default_rng(random_state)
+        n_items, dim = vectors.shape
+
+        projection = None
+        if issparse(vectors) or dim > projection_dim:
+            projection = (rng.standard_normal((dim, projection_dim)) / np.sqrt(projection_dim)).astype(np.float32)
+
+        index = cls(np.empty((0, 0), dtype=np.float32), np.zeros(1, dtype=np.int64),
+                    np.empty(0, dtype=np.int32), projection)
+        n_lists = int(n_lists or max(1, round(4 * np.sqrt(n_items))))
+        n_lists = max(1, min(n_lists, n_items))
+
+        sample = rng.choice(n_items, min(n_items, KMEANS_SAMPLE_SIZE), replace=False)
+        n_lists = min(n_lists, sample.size)
+        index.centroids = _spherical_kmeans(index._coarse(vectors[sample]), n_lists, rng)
+
+        assignments = np.empty(n_items, dtype=np.int64)
+        for start, stop in _row_chunks(n_items, n_lists):
+            assignments[start:stop] = np.argmax(index._coarse(vectors[start:stop]) @ index.centroids.T, axis=1)
+
+        index.items = np.argsort(assignments, kind='stable').astype(np.int32)
+        index.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))]).astype(np.int64)
+        return index
+
+    def _coarse(self, vectors) -> np.ndarray:
+        """Vectors trong không gian coarse (projection nếu có) đã normalize."""
+        if self.projection is not None:
+            projected = vectors @ self.projection
+            coarse = projected if not issparse(projected) else projected.toarray()
+        else:
+            coarse = _dense(vectors)
+        return _normalize_rows(np.asarray(coarse, dtype=np.float32))
+
+    def _probes(self, queries, nprobe: int) -> np.ndarray:
+        probes = np.empty((queries.shape[0], nprobe), dtype=np.int64)
+        for start, stop in _row_chunks(queries.shape[0], self.n_lists):
+            probes[start:stop] = top_k_rows(self._coarse(queries[start:stop]) @ self.centroids.T, nprobe)[0]
+        return probes
+
+    def _search(self, vectors, queries, k: int, nprobe: Optional[int], self_ids: Optional[np.ndarray],
+                support_matrix=None, min_support: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        n_queries = queries.shape[0]
+        out_idx = np.full((n_queries, k), -1, dtype=np.int32)
+        out_scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        if k == 0 or n_queries == 0:
+            return out_idx, np.zeros((n_queries, k), dtype=np.float32)
+
+        nprobe = int(nprobe or _setting('RECOMMENDER_ANN_NPROBE', 8))
+        nprobe = max(1, min(nprobe, self.n_lists))
+        probes = self._probes(queries, nprobe)
+
+        # Inverted gather: cặp (query, list đã probe) gom theo list -> mỗi query chỉ được score
+        # với items của đúng `nprobe` lists của nó, top-K gộp dần qua các lists
+        pair_lists = probes.ravel()
+        pair_queries = np.repeat(np.arange(n_queries), nprobe)
+        order = np.argsort(pair_lists, kind='stable')
+        pair_lists, pair_queries = pair_lists[order], pair_queries[order]
+        bounds = np.flatnonzero(np.diff(pair_lists)) + 1
+        starts = np.concatenate([[0], bounds])
+        use_support = support_matrix is not None and min_support > 0 and self_ids is not None
+
+        for l, group in zip(pair_lists[starts].tolist(), np.split(pair_queries, bounds)):
+            candidates = self.items[self.offsets[l]:self.offsets[l + 1]]
+            if candidates.size == 0:
+                continue
+            candidates_t = vectors[candidates].T
+            support_t = support_matrix[candidates].T if use_support else None
+
+            for start, stop in _row_chunks(group.size, candidates.size):
+                rows = group[start:stop]
+                # Rerank chính xác trên vectors gốc
+                scores = _dense(queries[rows] @ candidates_t)
+                if self_ids is not None:
+                    scores[self_ids[rows][:, None] == candidates[None, :]] = -np.inf
+                if use_support:
+                    support = _dense(support_matrix[self_ids[rows]] @ support_t)
+                    scores[support < min_support] = -np.inf
+
+                top, top_scores = top_k_rows(scores, k)
+                # Gộp với top-K từ các lists đã duyệt của cùng query
+                merged_idx = np.concatenate([out_idx[rows], candidates[top]], axis=1)
+                best, out_scores[rows] = top_k_rows(np.concatenate([out_scores[rows], top_scores], axis=1), k)
+                out_idx[rows] = np.take_along_axis(merged_idx, best, axis=1)
+
+        invalid = ~np.isfinite(out_scores)
+        out_idx[invalid] = -1
+        out_scores[invalid] = 0
+        return out_idx, out_scores
+
+    def search(self, vectors, queries, k: int, nprobe: Optional[int] = None,
+               exclude_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-K vectors (trong `vectors` đã dùng để build index) cho mỗi query.
+
+        Args:
+            exclude_ids: Index (trong `vectors`) cần bỏ cho từng query, vd: chính item đó
+
+        Returns:
+            (indices int32, scores float32) shape (Q, K), ô trống = -1 / 0
+        """
+        self_ids = np.asarray(exclude_ids) if exclude_ids is not None else None
+        return self._search(vectors, queries, k, nprobe, self_ids)
+
+    def neighbor_table(self, vectors, k: int, nprobe: Optional[int] = None,
+                       support_matrix=None, min_support: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """Bảng top-K neighbors cho mọi item (giống neighbors.build_topk_neighbors, nhưng xấp xỉ)."""
+        n_items = vectors.shape[0]
+        k = max(0, min(int(k), n_items - 1))
+        return self._search(vectors, vectors, k, nprobe, np.arange(n_items),
+                            support_matrix=support_matrix, min_support=min_support)
+
+    def with_items(self, vectors, positions: np.ndarray, new_items: np.ndarray) -> 'IVFIndex':
+        """
+        Index sau khi các vectors đổi vị trí / có thêm vectors mới (compaction CF), giữ nguyên centroids.
+
+        Args:
+            positions: Vị trí mới (trong `vectors`) của từng vector cũ
+            new_items: Vị trí các vectors mới -> gán vào list có centroid gần nhất
+        """
+        assignments = np.repeat(np.arange(self.n_lists), np.diff(self.offsets))
+        items = positions[self.items]
+        if len(new_items):
+            new_assignments = np.argmax(self._coarse(vectors[new_items]) @ self.centroids.T, axis=1)
+            assignments = np.concatenate([assignments, new_assignments])
+            items = np.concatenate([items, new_items])
+
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=self.n_lists))]).astype(np.int64)
+        return IVFIndex(self.centroids, offsets, items[order].astype(np.int32), self.projection)
+
+    # --- LƯU TRONG MODEL SNAPSHOT / ARTIFACT ---
+
+    def to_arrays(self, prefix: str) -> Dict[str, Any]:
+        arrays = {
+            f'{prefix}_centroids': self.centroids,
+            f'{prefix}_offsets': self.offsets,
+            f'{prefix}_items': self.items,
+        }
+        if self.projection is not None:
+            arrays[f'{prefix}_projection'] = self.projection
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, data, prefix: str) -> Optional['IVFIndex']:
+        if data.get(f'{prefix}_centroids') is None:
+            return None
+        return cls(data[f'{prefix}_centroids'], data[f'{prefix}_offsets'], data[f'{prefix}_items'],
+                   data.get(f'{prefix}_projection'))
+
+
+def exact_search(vectors, queries, k: int, exclude_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Brute force top-K (dùng làm chuẩn để đo recall)."""
+    n_queries = queries.shape[0]
+    k = min(k, vectors.shape[0])
+    out_idx = np.empty((n_queries, k), dtype=np.int64)
+    out_scores = np.empty((n_queries, k), dtype=np.float32)
+    vectors_t = vectors.T
+    for start, stop in _row_chunks(n_queries, vectors.shape[0]):
+        scores = _dense(queries[start:stop] @ vectors_t)
+        if exclude_ids is not None:
+            scores[np.arange(stop - start), exclude_ids[start:stop]] = -np.inf
+        out_idx[start:stop], out_scores[start:stop] = top_k_rows(scores, k)
+    return out_idx, out_scores
+
+
+def measure_recall(index: IVFIndex, vectors, k: int = 10, nprobe: Optional[int] = None,
+                   sample_size: int = 200, random_state: int = 0) -> float:
+    """
+    Recall@K của index so với exact search trên 1 sample các vectors (query = chính vector đó).
+
+    Returns:
+        Tỉ lệ neighbors chính xác (score > 0) được ANN tìm thấy, trong [0, 1]
+    """
+    n_items = vectors.shape[0]
+    k = max(1, min(k, n_items - 1))
+    rng = np.random.default_rng(random_state)
+    sample = rng.choice(n_items, min(sample_size, n_items), replace=False)
+    queries = vectors[sample]
+
+    approx, _ = index.search(vectors, queries, k, nprobe=nprobe, exclude_ids=sample)
+    exact, exact_scores = exact_search(vectors, queries, k, exclude_ids=sample)
+
+    found = total = 0
+    for approx_row, exact_row, score_row in zip(approx, exact, exact_scores):
+        relevant = set(exact_row[score_row > 0].tolist())
+        total += len(relevant)
+        found += len(relevant & set(approx_row.tolist()))
+    return found / total if total else 1.0
+
+
+def build_neighbor_table(vectors, k: int, support_matrix=None, min_support: int = 0,
+                         label: str = 'items') -> Tuple[np.ndarray, np.ndarray, Optional[float]]:
+    """
+    Bảng top-K neighbors: exact (block-wise) khi ít vectors, IVF index khi vượt RECOMMENDER_ANN_MIN_ITEMS.
+
+    Returns:
+        (neighbor_idx, neighbor_scores, recall) - recall đo được của ANN, None nếu dùng exact
+    """
+    if not should_use_ann(vectors.shape[0]):
+        neighbor_idx, neighbor_scores = build_topk_neighbors(
+            vectors, k, support_matrix=support_matrix, min_support=min_support
+        )
+        return neighbor_idx, neighbor_scores, None
+
+    index = IVFIndex.build(vectors)
+    neighbor_idx, neighbor_scores = index.neighbor_table(
+        vectors, k, support_matrix=support_matrix, min_support=min_support
+    )
+    recall = measure_recall(index, vectors, k=min(k, 10))
+    print(f"  🔎 ANN neighbors ({label}): {index.n_lists} lists, recall@10 = {recall:.3f}")
+    return neighbor_idx, neighbor_scores, round(recall, 4)
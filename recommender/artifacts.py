@@ -0,0 +1,231 @@
+"""
+Model Artifacts Module
+Lưu / load trạng thái đã train (Content-Based + CF) xuống đĩa theo định dạng có version.
+
+Cấu trúc thư mục (RECOMMENDER_ARTIFACT_DIR):
+    CURRENT                      <- tên version đang dùng (cập nhật atomic)
+    20260101T120000000000-ab12cd/
+        manifest.json            <- format_version, created_at, danh sách keys của từng section
+        content.neighbor_idx.npy
+        cf.user_item_matrix_sparse.data.npy
+        ...
+
+- NumPy arrays và Sparse Matrices (data/indices/indptr) lưu dạng .npy
+  -> worker load bằng mmap_mode='r' trong vài ms, các workers dùng chung page cache của OS.
+- DataFrame (catalog hotels) lưu bằng pickle.
+- Training là 1 bước riêng (manage.py train_models) ghi ra artifact mới.
+"""
+import json
+import os
+import secrets
+import shutil
+import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, issparse
+from django.conf import settings
+
+ARTIFACT_FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+CURRENT_FILE = 'CURRENT'
+
+
+def get_artifact_root() -> Path:
+    default_dir = Path(settings.BASE_DIR) / 'model_artifacts'
+    return Path(getattr(settings, 'RECOMMENDER_ARTIFACT_DIR', default_dir))
+
+
+def _new_version() -> str:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    # Timestamp tới microsecond -> sort theo tên = sort theo thời gian
+    return f"{now.strftime('%Y%m%dT%H%M%S%f')}-{secrets.token_hex(3)}"
+
+
+# --- SERIALIZE TỪNG GIÁ TRỊ ---
+
+def _save_value(directory: Path, name: str, value: Any) -> Dict[str, Any]:
+    """Ghi 1 giá trị xuống `directory`, trả về entry mô tả cho manifest."""
+    if issparse(value):
+        value = csr_matrix(value)
+        for part in ('data', 'indices', 'indptr'):
+            np.save(directory / f'{name}.{part}.npy', getattr(value, part))
+        return {'kind': 'csr', 'shape': list(value.shape)}
+
+    if isinstance(value, np.ndarray):
+        np.save(directory / f'{name}.npy', value)
+        return {'kind': 'ndarray'}
+
+    if isinstance(value, pd.DataFrame):
+        value.to_pickle(directory / f'{name}.pkl')
+        return {'kind': 'frame'}
+
+    if isinstance(value, pd.Series):
+        np.save(directory / f'{name}.index.npy', value.index.to_numpy())
+        np.save(directory / f'{name}.values.npy', value.to_numpy())
+        return {'kind': 'series'}
+
+    if isinstance(value, list):
+        np.save(directory / f'{name}.npy', np.asarray(value))
+        return {'kind': 'list'}
+
+    # Scalars / dict nhỏ -> lưu thẳng trong manifest
+    return {'kind': 'json', 'value': _json_value(name, value)}
+
+
+def _json_value(name: str, value: Any) -> Any:
+    """
+    Giá trị lưu trong manifest: NumPy scalars -> Python scalars (.item()), dict duyệt đệ quy.
+
+    Raises:
+        TypeError: kiểu không lưu được (không tự chuyển thành string -> load lại sẽ sai kiểu)
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, dict):
+        return {str(key): _json_value(f'{name}.{key}', item) for key, item in value.items()}
+    raise TypeError(f"Không lưu được '{name}' vào artifact: kiểu {type(value).__name__} không được hỗ trợ")
+
+
+def _load_value(directory: Path, name: str, entry: Dict[str, Any], mmap_mode: Optional[str]) -> Any:
+    kind = entry['kind']
+
+    if kind == 'csr':
+        parts = [np.load(directory / f'{name}.{part}.npy', mmap_mode=mmap_mode)
+                 for part in ('data', 'indices', 'indptr')]
+        return csr_matrix(tuple(parts), shape=tuple(entry['shape']), copy=False)
+
+    if kind == 'ndarray':
+        return np.load(directory / f'{name}.npy', mmap_mode=mmap_mode)
+
+    if kind == 'frame':
+        return pd.read_pickle(directory / f'{name}.pkl')
+
+    if kind == 'series':
+        index = np.load(directory / f'{name}.index.npy')
+        values = np.load(directory / f'{name}.values.npy')
+        return pd.Series(values, index=index)
+
+    if kind == 'list':
+        return np.load(directory / f'{name}.npy').tolist()
+
+    if kind == 'json':
+        return entry['value']
+
+    raise ValueError(f"Unknown artifact entry kind: {kind}")
+
+
+# --- PUBLIC API ---
+
+def save_artifact(sections: Dict[str, Dict[str, Any]]) -> str:
+    """
+    Ghi 1 artifact mới và đánh dấu là CURRENT.
+
+    Args:
+        sections: {section_name: {key: value}}, vd: {'content': {...}, 'cf': {...}}
+
+    Returns:
+        Tên version của artifact vừa ghi
+    """
+    root = get_artifact_root()
+    root.mkdir(parents=True, exist_ok=True)
+
+    version = _new_version()
+    tmp_dir = root / f'.tmp-{version}'
+    tmp_dir.mkdir()
+
+    try:
+        manifest = {
+            'format_version': ARTIFACT_FORMAT_VERSION,
+            'version': version,
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'sections': {}
+        }
+        for section, values in sections.items():
+            manifest['sections'][section] = {
+                key: _save_value(tmp_dir, f'{section}.{key}', value)
+                for key, value in values.items()
+            }
+        with open(tmp_dir / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        # Rename thư mục + ghi CURRENT bằng os.replace -> workers không bao giờ thấy artifact dở dang
+        os.rename(tmp_dir, root / version)
+        tmp_pointer = root / f'.{CURRENT_FILE}.{version}'
+        tmp_pointer.write_text(version, encoding='utf-8')
+        os.replace(tmp_pointer, root / CURRENT_FILE)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    prune_artifacts()
+    print(f"💾 Đã lưu model artifact: {version}")
+    return version
+
+
+def current_version() -> Optional[str]:
+    """Version đang được đánh dấu CURRENT (None nếu chưa có artifact nào)."""
+    try:
+        return (get_artifact_root() / CURRENT_FILE).read_text(encoding='utf-8').strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_artifact(
+    version: Optional[str] = None,
+    mmap: bool = True
+) -> Optional[Tuple[str, Dict[str, Dict[str, Any]]]]:
+    """
+    Load artifact (mặc định: CURRENT).
+
+    Returns:
+        (version, sections) hoặc None nếu không có artifact / sai format version
+    """
+    version = version or current_version()
+    if not version:
+        return None
+
+    directory = get_artifact_root() / version
+    try:
+        with open(directory / MANIFEST_FILE, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        print(f"⚠️ Không tìm thấy artifact {version}")
+        return None
+
+    if manifest.get('format_version') != ARTIFACT_FORMAT_VERSION:
+        print(f"⚠️ Artifact {version} có format_version={manifest.get('format_version')}, "
+              f"cần {ARTIFACT_FORMAT_VERSION} -> bỏ qua")
+        return None
+
+    mmap_mode = 'r' if mmap else None
+    sections = {
+        section: {
+            key: _load_value(directory, f'{section}.{key}', entry, mmap_mode)
+            for key, entry in entries.items()
+        }
+        for section, entries in manifest['sections'].items()
+    }
+    return version, sections
+
+
+def prune_artifacts(keep: Optional[int] = None) -> None:
+    """
+    Xóa các artifact cũ, chỉ giữ lại `keep` bản mới nhất (luôn giữ CURRENT).
+    Workers đang mmap artifact cũ vẫn đọc được vì file chỉ bị unlink.
+    """
+    keep = keep if keep is not None else getattr(settings, 'RECOMMENDER_ARTIFACT_KEEP', 3)
+    root = get_artifact_root()
+    current = current_version()
+
+    versions = sorted(
+        (p.name for p in root.iterdir() if (p / MANIFEST_FILE).is_file() and not p.name.startswith('.')),
+        reverse=True
+    )
+    for name in versions[keep:]:
+        if name != current:
+            shutil.rmtree(root / name, ignore_errors=True)
@@ -0,0 +1,352 @@
+"""
+Hotel Catalog Module
+Bản sao trong RAM của các thông tin hotel dùng để enrich kết quả recommendations
+(name, address, stars, rating, location, thumbnail, giá phòng thấp nhất).
+
+- Lưu dạng cột (NumPy arrays) sort theo hotel_id -> tra cứu 1 batch ids bằng searchsorted
+- Catalog bất biến, refresh tạo bản mới rồi swap reference (giống snapshot.py)
+- Refresh incremental tối đa 1 lần mỗi RECOMMENDER_CATALOG_REFRESH_SECONDS:
+    * Hotels có updated_at >= watermark -> load lại các hàng đó
+    * Rooms có updated_at >= watermark -> tính lại min_room_price của hotels liên quan
+    * HotelImages (Thumbnail) có id > id lớn nhất đã thấy
+  Load lại toàn bộ mỗi RECOMMENDER_CATALOG_FULL_REFRESH_SECONDS (bắt được hotels / ảnh bị xóa)
+- Cây Locations (id -> parent_id) load cùng lần full refresh; index Euler tour + posting lists hotels
+  theo location (locations.py) build 1 lần cho mỗi catalog -> lọc / xếp hạng theo vùng không cần query đệ quy
+- Endpoints enrich kết quả từ catalog -> không còn query DB mỗi request
+"""
+import math
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Min
+
+# Cột của catalog: tên -> kind ('str' = object array, 'int' / 'float' = float64 với NaN = NULL)
+COLUMNS = {
+    'name': 'str',
+    'address': 'str',
+    'star_rating': 'int',
+    'average_rating': 'float',
+    'total_reviews': 'int',
+    'type': 'str',
+    'price_per_night_from': 'float',
+    'location_id': 'int',
+    'location_name': 'str',
+    'parent_location_name': 'str',
+    'thumbnail': 'str',
+    'min_room_price': 'float',
+}
+
+# Field Hotels (ORM) tương ứng với từng cột lấy trực tiếp từ bảng hotels
+_HOTEL_FIELDS = {
+    'name': 'name',
+    'address': 'address',
+    'star_rating': 'star_rating',
+    'average_rating': 'average_rating',
+    'total_reviews': 'total_reviews',
+    'type': 'type',
+    'price_per_night_from': 'price_per_night_from',
+    'location_id': 'location_id',
+    'location_name': 'location__name',
+    'parent_location_name': 'location__parent__name',
+}
+
+
+def _empty_column(kind: str, n: int) -> np.ndarray:
+    if kind == 'str':
+        return np.full(n, None, dtype=object)
+    return np.full(n, np.nan, dtype=np.float64)
+
+
+class HotelCatalog:
+    """
+    Catalog hotels dạng cột, bất biến.
+
+    Attributes:
+        ids: Hotel ids (int64, tăng dần)
+        columns: {tên cột: array cùng thứ tự với ids}
+        watermarks: Mốc cho lần refresh incremental tiếp theo
+        locations: Cây Locations {location_id: parent_id hoặc None}
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        columns: Dict[str, np.ndarray],
+        watermarks: Dict[str, Any],
+        loaded_at: float,
+        locations: Optional[Dict[int, Optional[int]]] = None
+    ):
+        self.ids = ids
+        self.columns = columns
+        self.watermarks = watermarks
+        self.loaded_at = loaded_at
+        self.locations = locations or {}
+        # LocationIndex của catalog, tính lazily
+        self._location_index = None
+        for array in (ids, *columns.values()):
+            array.flags.writeable = False
+        # tên cột -> (codes, {giá trị: code}), tính lazily
+        self._codes = {}
+
+    def __len__(self) -> int:
+        return self.ids.size
+
+    def positions(self, hotel_ids) -> np.ndarray:
+        """Vị trí của `hotel_ids` trong catalog (-1 nếu không có)."""
+        hotel_ids = np.asarray(list(hotel_ids) if not isinstance(hotel_ids, np.ndarray) else hotel_ids, dtype=np.int64)
+        if self.ids.size == 0:
+            return np.full(hotel_ids.shape, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.ids, hotel_ids), self.ids.size - 1)
+        return np.where(self.ids[pos] == hotel_ids, pos, -1)
+
+    def codes(self, name: str) -> Tuple[np.ndarray, Dict[Any, int]]:
+        """
+        Cột 'str' `name` mã hóa thành int codes (tính 1 lần cho mỗi catalog).
+
+        Returns:
+            (codes cùng thứ tự với ids, {giá trị: code}) - NULL cũng là 1 giá trị
+        """
+        cached = self._codes.get(name)
+        if cached is None:
+            mapping = {}
+            codes = np.fromiter(
+                (mapping.setdefault(value, len(mapping)) for value in self.columns[name].tolist()),
+                dtype=np.int64, count=len(self)
+            )
+            codes.flags.writeable = False
+            cached = self._codes[name] = (codes, mapping)
+        return cached
+
+    def location_index(self):
+        """Index cây Locations + posting lists hotels theo location (locations.LocationIndex), build 1 lần."""
+        from .locations import LocationIndex
+
+        index = self._location_index
+        if index is None:
+            index = self._location_index = LocationIndex(self.locations, self.columns['location_id'])
+        return index
+
+    def values(self, name: str, hotel_ids) -> List[Any]:
+        """Giá trị cột `name` của các hotels (Python types, None nếu NULL / hotel không có trong catalog)."""
+        pos = self.positions(hotel_ids)
+        found = pos >= 0
+        values = _empty_column(COLUMNS[name], pos.size)
+        values[found] = self.columns[name][pos[found]]
+        return _to_python(values, COLUMNS[name])
+
+    def lookup(self, name: str, hotel_ids) -> Dict[int, Any]:
+        """{hotel_id: giá trị} của cột `name`, bỏ hotels NULL / không có trong catalog."""
+        hotel_ids = list(hotel_ids)
+        return {hid: value for hid, value in zip(hotel_ids, self.values(name, hotel_ids)) if value is not None}
+
+    def records(self, hotel_ids, fields: Dict[str, str]) -> List[Dict[str, Any]]:
+        """
+        1 dict cho mỗi hotel.
+
+        Args:
+            fields: {tên key trong kết quả: tên cột catalog}
+        """
+        hotel_ids = list(hotel_ids)
+        columns = {key: self.values(column, hotel_ids) for key, column in fields.items()}
+        return [{key: columns[key][i] for key in fields} for i in range(len(hotel_ids))]
+
+
+def _to_python(values: np.ndarray, kind: str) -> List[Any]:
+    if kind == 'str':
+        return values.tolist()
+    if kind == 'int':
+        return [None if math.isnan(v) else int(v) for v in values.tolist()]
+    return [None if math.isnan(v) else v for v in values.tolist()]
+
+
+def _column_from_values(kind: str, values: List[Any]) -> np.ndarray:
+    if kind == 'str':
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+
+
+# --- LOAD TỪ DATABASE ---
+
+def _hotel_rows(queryset) -> Dict[int, Dict[str, Any]]:
+    rows = queryset.values('id', 'updated_at', *_HOTEL_FIELDS.values())
+    return {row['id']: row for row in rows}
+
+
+def _min_prices(hotel_ids=None) -> Dict[int, float]:
+    from .models import Rooms
+
+    rooms = Rooms.objects.filter(price__isnull=False)
+    if hotel_ids is not None:
+        rooms = rooms.filter(hotel_id__in=list(hotel_ids))
+    return dict(rooms.values('hotel_id').annotate(min_price=Min('price')).values_list('hotel_id', 'min_price'))
+
+
+def _thumbnails(min_image_id: int = 0):
+    """({hotel_id: image_url}, id ảnh lớn nhất) của ảnh Thumbnail có id > min_image_id."""
+    from .models import HotelImages
+
+    images = HotelImages.objects.filter(caption='Thumbnail', id__gt=min_image_id).order_by('id').values_list(
+        'id', 'hotel_id', 'image_url'
+    )
+    thumbnails, max_id = {}, min_image_id
+    for image_id, hotel_id, image_url in images:
+        thumbnails[hotel_id] = image_url  # ảnh mới hơn ghi đè
+        max_id = image_id
+    return thumbnails, max_id
+
+
+def _locations() -> Dict[int, Optional[int]]:
+    from .models import Locations
+
+    return dict(Locations.objects.values_list('id', 'parent_id'))
+
+
+def _build(
+    hotels: Dict[int, Dict[str, Any]],
+    thumbnails: Dict[int, str],
+    min_prices: Dict[int, float],
+    watermarks: Dict[str, Any],
+    base: Optional[HotelCatalog] = None,
+    locations: Optional[Dict[int, Optional[int]]] = None
+) -> HotelCatalog:
+    """
+    Tạo catalog mới: hàng của `base` + ghi đè các giá trị mới
+    (hotels: toàn bộ cột hotels, thumbnails / min_prices: chỉ cột tương ứng).
+    """
+    base_ids = base.ids if base is not None else np.empty(0, dtype=np.int64)
+    changed_ids = np.fromiter(set(hotels) | set(thumbnails) | set(min_prices), dtype=np.int64)
+    if base is None:
+        changed_ids = np.fromiter(hotels, dtype=np.int64)
+    ids = np.union1d(base_ids, changed_ids)
+
+    columns = {}
+    for name, kind in COLUMNS.items():
+        column = _empty_column(kind, ids.size)
+        if base is not None and base_ids.size:
+            column[np.searchsorted(ids, base_ids)] = base.columns[name]
+        columns[name] = column
+
+    def assign(name: str, updates: Dict[int, Any]) -> None:
+        if not updates or ids.size == 0:
+            return
+        keys = np.fromiter(updates, dtype=np.int64, count=len(updates))
+        pos = np.searchsorted(ids, keys)
+        keep = (pos < ids.size) & (ids[np.minimum(pos, ids.size - 1)] == keys)
+        values = _column_from_values(COLUMNS[name], list(updates.values()))
+        columns[name][pos[keep]] = values[keep]
+
+    for name, field in _HOTEL_FIELDS.items():
+        assign(name, {hid: row[field] for hid, row in hotels.items()})
+    assign('thumbnail', thumbnails)
+    assign('min_room_price', min_prices)
+
+    if locations is None and base is not None:
+        locations = base.locations
+    return HotelCatalog(ids, columns, watermarks, loaded_at=time.monotonic(), locations=locations)
+
+
+def load_full() -> HotelCatalog:
+    """Load toàn bộ catalog (5 queries)."""
+    from .models import Hotels, Rooms
+
+    hotels = _hotel_rows(Hotels.objects.select_related('location__parent'))
+    thumbnails, max_image_id = _thumbnails()
+    watermarks = {
+        'hotels_updated_at': max((r['updated_at'] for r in hotels.values() if r['updated_at']), default=None),
+        'rooms_updated_at': Rooms.objects.aggregate(latest=Max('updated_at'))['latest'],
+        'image_id': max_image_id,
+        'full_loaded_at': time.monotonic(),
+    }
+    return _build(hotels, thumbnails, _min_prices(), watermarks, locations=_locations())
+
+
+def load_incremental(base: HotelCatalog) -> HotelCatalog:
+    """Catalog mới = `base` + các thay đổi từ watermarks của `base`."""
+    from .models import Hotels, Rooms
+
+    watermarks = dict(base.watermarks)
+
+    hotels = {}
+    if watermarks['hotels_updated_at'] is not None:
+        # >= : hàng cùng timestamp commit sau lần refresh trước vẫn được lấy (load lại là idempotent)
+        hotels = _hotel_rows(Hotels.objects.select_related('location__parent').filter(
+            updated_at__gte=watermarks['hotels_updated_at']
+        ))
+        watermarks['hotels_updated_at'] = max(
+            (r['updated_at'] for r in hotels.values() if r['updated_at']), default=watermarks['hotels_updated_at']
+        )
+
+    min_prices = {}
+    if watermarks['rooms_updated_at'] is not None:
+        changed_rooms = Rooms.objects.filter(updated_at__gte=watermarks['rooms_updated_at'])
+        changed = changed_rooms.aggregate(latest=Max('updated_at'))['latest']
+        room_hotel_ids = set(changed_rooms.values_list('hotel_id', flat=True).distinct())
+        if room_hotel_ids:
+            min_prices = _min_prices(room_hotel_ids)
+            # Hotel không còn phòng có giá -> NULL
+            min_prices.update({hid: None for hid in room_hotel_ids - set(min_prices)})
+        watermarks['rooms_updated_at'] = changed or watermarks['rooms_updated_at']
+
+    thumbnails, watermarks['image_id'] = _thumbnails(watermarks['image_id'])
+
+    if not hotels and not min_prices and not thumbnails:
+        return HotelCatalog(base.ids, base.columns, watermarks, loaded_at=time.monotonic(), locations=base.locations)
+    return _build(hotels, thumbnails, min_prices, watermarks, base=base)
+
+
+# --- CATALOG DÙNG CHUNG ---
+
+_refresh_lock = threading.Lock()
+# Giữ từ lúc request khởi động refresh nền tới khi thread chạy xong -> tối đa 1 thread mỗi lúc
+_background_lock = threading.Lock()
+_current: Optional[HotelCatalog] = None
+
+
+def refresh(full: bool = False) -> HotelCatalog:
+    """Refresh catalog (incremental, hoặc full nếu chưa có / đến hạn) và publish bản mới."""
+    global _current
+
+    with _refresh_lock:
+        base = _current
+        full_interval = getattr(settings, 'RECOMMENDER_CATALOG_FULL_REFRESH_SECONDS', 3600)
+        if full or base is None or time.monotonic() - base.watermarks['full_loaded_at'] >= full_interval:
+            catalog = load_full()
+            print(f"✅ Đã load hotel catalog: {len(catalog)} hotels")
+        else:
+            catalog = load_incremental(base)
+        _current = catalog
+        return catalog
+
+
+def _refresh_in_background() -> None:
+    try:
+        refresh()
+    except Exception as e:
+        print(f"⚠️ Không thể refresh hotel catalog: {e}")
+    finally:
+        _background_lock.release()
+
+
+def get_catalog() -> HotelCatalog:
+    """
+    Catalog hiện tại. Lần đầu load đồng bộ; sau đó refresh incremental ở background thread
+    tối đa 1 lần mỗi RECOMMENDER_CATALOG_REFRESH_SECONDS (request không chờ, dùng bản đang có).
+    """
+    catalog = _current
+    if catalog is None:
+        return refresh()
+
+    interval = getattr(settings, 'RECOMMENDER_CATALOG_REFRESH_SECONDS', 60)
+    if time.monotonic() - catalog.loaded_at >= interval and _background_lock.acquire(blocking=False):
+        threading.Thread(target=_refresh_in_background, name='hotel-catalog-refresh', daemon=True).start()
+    return catalog
+
+
+def get_values(name: str, hotel_ids: Iterable[int]) -> Dict[int, Any]:
+    """Shortcut: {hotel_id: giá trị cột `name`} từ catalog hiện tại."""
+    return get_catalog().lookup(name, hotel_ids)
@@ -5,12 +5,20 @@ dựa trên hành vi của users tương tự.
 """
 import pandas as pd
 import numpy as np
-from scipy.sparse import csr_matrix, coo_matrix
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy.sparse import csr_matrix, coo_matrix, diags, vstack
+from sklearn.preprocessing import normalize
+from collections import OrderedDict
+import threading
+from dataclasses import dataclass, fields
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.db.models import Avg, F
 from django.utils import timezone
 from typing import List, Dict, Any, Optional, Tuple
 import datetime
+from .neighbors import MAX_BLOCK_ELEMENTS
+from .ranking import top_k, top_k_rows, top_k_sparse_rows
+from . import als, ann, snapshot
 
 # --- CONSTANTS ---
 WEIGHT_VIEW_BASE = 2.0
@@ -27,14 +35,89 @@ BONUS_CLICK_FAVORITE = 1.0
 DECAY_RATE = 0.05  # Score giảm 5% mỗi ngày
 MIN_DECAY_FACTOR = 0.1  # Score không bao giờ giảm dưới 10% giá trị gốc
 
-# --- GLOBAL CACHE ---
-cf_global_data: Dict[str, Any] = {}
+MAX_VIEW_SCORE = 5.0
+
+# Số dòng đọc từ DB mỗi query khi build User-Item Matrix
+EXTRACT_CHUNK_SIZE = 20_000
+
+# Số similar users dùng để dự đoán rating (User-Based CF)
+USER_NEIGHBORS_K = 20
+
+# CF engines (settings.RECOMMENDER_CF_ENGINE)
+CF_ENGINE_NEIGHBORHOOD = 'neighborhood'
+CF_ENGINE_ALS = 'als'
+CF_ENGINES = (CF_ENGINE_NEIGHBORHOOD, CF_ENGINE_ALS)
+
+SECONDS_PER_DAY = 86400
+# Ngày tương tác khi không có timestamp -> days_ago luôn = 0 (không decay)
+NO_INTERACTION_DAY = np.iinfo(np.int32).max
+
+
+@dataclass(frozen=True)
+class CFWeightConfig:
+    """
+    Trọng số rating + time decay cho User-Item Matrix.
+    Mặc định lấy từ các hằng số ở trên, override bằng settings.RECOMMENDER_CF_WEIGHTS
+    (dict cùng tên field, vd: {'decay_rate': 0.03}). Được kiểm tra ngay khi load module.
+    """
+    view_base: float = WEIGHT_VIEW_BASE
+    favorite: float = WEIGHT_FAVORITE
+    booking: float = WEIGHT_BOOKING
+    review_default: float = WEIGHT_REVIEW_DEFAULT
+    bonus_duration_60s: float = BONUS_DURATION_60S
+    bonus_duration_180s: float = BONUS_DURATION_180S
+    bonus_click_booking: float = BONUS_CLICK_BOOKING
+    bonus_click_favorite: float = BONUS_CLICK_FAVORITE
+    max_view_score: float = MAX_VIEW_SCORE
+    decay_rate: float = DECAY_RATE
+    min_decay_factor: float = MIN_DECAY_FACTOR
+
+    def __post_init__(self):
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or not np.isfinite(value):
+                raise ImproperlyConfigured(f"RECOMMENDER_CF_WEIGHTS['{f.name}'] phải là số hữu hạn, nhận {value!r}")
+            if value < 0:
+                raise ImproperlyConfigured(f"RECOMMENDER_CF_WEIGHTS['{f.name}'] không được âm, nhận {value!r}")
+        if not 0 < self.min_decay_factor <= 1:
+            raise ImproperlyConfigured("RECOMMENDER_CF_WEIGHTS['min_decay_factor'] phải nằm trong (0, 1]")
+        if self.max_view_score < self.view_base:
+            raise ImproperlyConfigured("RECOMMENDER_CF_WEIGHTS['max_view_score'] phải >= view_base")
+
+    @classmethod
+    def from_settings(cls) -> 'CFWeightConfig':
+        overrides = dict(getattr(settings, 'RECOMMENDER_CF_WEIGHTS', None) or {})
+        unknown = set(overrides) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ImproperlyConfigured(f"RECOMMENDER_CF_WEIGHTS có key không hợp lệ: {sorted(unknown)}")
+        return cls(**overrides)
+
+
+CF_WEIGHTS = CFWeightConfig.from_settings()
+
+
+def get_cf_engine() -> str:
+    engine = getattr(settings, 'RECOMMENDER_CF_ENGINE', CF_ENGINE_NEIGHBORHOOD)
+    if engine not in CF_ENGINES:
+        raise ImproperlyConfigured(f"RECOMMENDER_CF_ENGINE phải là 1 trong {CF_ENGINES}, nhận {engine!r}")
+    return engine
+
+# --- MODEL (CACHE) ---
+# CF model nằm trong snapshot bất biến (snapshot.py): snapshot.current().cf
+
+
+def __getattr__(name):
+    # Tương thích ngược: collaborative.cf_global_data = CF model của snapshot hiện tại (read-only)
+    if name == 'cf_global_data':
+        return snapshot.current().cf
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def calculate_time_decay(interaction_time: datetime.datetime) -> float:
     """
     Tính hệ số time decay dựa trên thời gian tương tác.
     Formula: 1 / (1 + decay_rate * days_ago)
+    (Bản scalar - khi xử lý nhiều interactions dùng time_decay_factors)
     """
     if not interaction_time:
         return 1.0
@@ -43,217 +126,843 @@ def calculate_time_decay(interaction_time: datetime.datetime) -> float:
     delta = now - interaction_time
     days_ago = max(0, delta.days)
     
-    decay_factor = 1 / (1 + DECAY_RATE * days_ago)
-    return max(decay_factor, MIN_DECAY_FACTOR)
+    decay_factor = 1 / (1 + CF_WEIGHTS.decay_rate * days_ago)
+    return max(decay_factor, CF_WEIGHTS.min_decay_factor)
+
+
+def time_decay_factors(
+    timestamps: np.ndarray,
+    now_ts: float,
+    config: CFWeightConfig = CF_WEIGHTS
+) -> np.ndarray:
+    """
+    Time decay vectorized cho cả 1 cột timestamps.
+
+    Args:
+        timestamps: Epoch seconds (float), NaN = không có thời gian (decay = 1.0)
+        now_ts: Thời điểm tham chiếu (epoch seconds), dùng chung cho cả cột
+
+    Returns:
+        Mảng hệ số decay = max(1 / (1 + decay_rate * days_ago), min_decay_factor)
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    days_ago = np.floor(np.maximum(now_ts - timestamps, 0) / SECONDS_PER_DAY)
+    decay = _decay_for_days_ago(days_ago, config)
+    return np.where(np.isnan(timestamps), 1.0, decay)
+
+
+def _decay_for_days_ago(days_ago: np.ndarray, config: CFWeightConfig) -> np.ndarray:
+    return np.maximum(1.0 / (1.0 + config.decay_rate * days_ago), config.min_decay_factor)
+
+
+def epoch_days(timestamps: np.ndarray) -> np.ndarray:
+    """Epoch seconds -> số ngày kể từ epoch (int32), NaN -> NO_INTERACTION_DAY."""
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    missing = np.isnan(timestamps)
+    days = np.floor(np.where(missing, 0, timestamps) / SECONDS_PER_DAY).astype(np.int32)
+    days[missing] = NO_INTERACTION_DAY
+    return days
+
+
+def day_decay_factors(
+    days: np.ndarray,
+    now_day: int,
+    config: CFWeightConfig = CF_WEIGHTS
+) -> np.ndarray:
+    """Time decay theo ngày tương tác (epoch days) so với ngày tham chiếu `now_day`."""
+    days_ago = np.maximum(now_day - np.asarray(days, dtype=np.int64), 0)
+    return _decay_for_days_ago(days_ago, config)
+
+
+def view_engagement_scores(
+    durations: np.ndarray,
+    clicked_booking: np.ndarray,
+    clicked_favorite: np.ndarray,
+    config: CFWeightConfig = CF_WEIGHTS
+) -> np.ndarray:
+    """Score của ViewHistories (base + engagement bonuses, chặn ở max_view_score) - vectorized."""
+    score = np.full(durations.shape, config.view_base, dtype=np.float64)
+    score += np.where(durations > 60, config.bonus_duration_60s, 0.0)
+    score += np.where(durations > 180, config.bonus_duration_180s, 0.0)
+    score += np.where(clicked_booking, config.bonus_click_booking, 0.0)
+    score += np.where(clicked_favorite, config.bonus_click_favorite, 0.0)
+    return np.minimum(score, config.max_view_score)
+
+
+class _InteractionBuffer:
+    """
+    Buffer NumPy có kiểu cố định cho (user_id, hotel_id, rating, day).
+    rating là base score (chưa decay), day là ngày tương tác (epoch days).
+    Tự tăng gấp đôi kích thước khi đầy -> không tạo 1 Python object cho mỗi interaction.
+    """
+
+    COLUMNS = ('user_id', 'hotel_id', 'rating', 'day')
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.user_id = np.empty(capacity, dtype=np.int64)
+        self.hotel_id = np.empty(capacity, dtype=np.int64)
+        self.rating = np.empty(capacity, dtype=np.float64)
+        self.day = np.empty(capacity, dtype=np.int32)
+
+    def _grow(self, needed: int) -> None:
+        capacity = self.user_id.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        for name in self.COLUMNS:
+            old = getattr(self, name)
+            new = np.empty(new_capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def extend(
+        self,
+        user_id: np.ndarray,
+        hotel_id: np.ndarray,
+        rating: np.ndarray,
+        day: Optional[np.ndarray] = None
+    ) -> int:
+        """Thêm 1 chunk (bỏ các dòng thiếu user/hotel), trả về số dòng đã thêm."""
+        if day is None:
+            day = np.full(user_id.shape, NO_INTERACTION_DAY, dtype=np.int32)
+        valid = (user_id > 0) & (hotel_id > 0)
+        n = int(valid.sum())
+        self._grow(self.size + n)
+        end = self.size + n
+        self.user_id[self.size:end] = user_id[valid]
+        self.hotel_id[self.size:end] = hotel_id[valid]
+        self.rating[self.size:end] = rating[valid]
+        self.day[self.size:end] = day[valid]
+        self.size = end
+        return n
+
+    def max_by_pair(self, now_day: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        De-duplicate (user, hotel) bằng vectorized max:
+        sort theo (user, hotel, score giảm dần) rồi giữ dòng đầu của mỗi cặp.
+        Score để so sánh = rating đã decay tại `now_day` (None -> so sánh rating gốc).
+
+        Returns:
+            (user_id, hotel_id, rating gốc, day) của event thắng cho mỗi cặp, sort theo (user, hotel)
+        """
+        user_id = self.user_id[:self.size]
+        hotel_id = self.hotel_id[:self.size]
+        rating = self.rating[:self.size]
+        day = self.day[:self.size]
+
+        score = rating if now_day is None else rating * day_decay_factors(day, now_day)
+        order = np.lexsort((-score, hotel_id, user_id))
+        user_id, hotel_id, rating, day = user_id[order], hotel_id[order], rating[order], day[order]
+
+        first = np.ones(self.size, dtype=bool)
+        first[1:] = (user_id[1:] != user_id[:-1]) | (hotel_id[1:] != hotel_id[:-1])
+        return user_id[first], hotel_id[first], rating[first], day[first]
+
+
+def _iter_value_chunks(queryset, fields: Tuple[str, ...], chunk_size: int = EXTRACT_CHUNK_SIZE):
+    """
+    Đọc queryset theo từng chunk bằng keyset pagination trên primary key.
+    Backend MySQL/TiDB của Django không stream được kết quả (iterator() vẫn load cả bảng),
+    nên mỗi chunk là 1 query `WHERE id > last_id ORDER BY id LIMIT chunk_size`.
+
+    Yields:
+        Tuple các cột (mỗi cột là 1 tuple giá trị) của từng chunk, không gồm id
+    """
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id).order_by('id').values_list('id', *fields)[:chunk_size]
+        )
+        if not rows:
+            return
+        columns = tuple(zip(*rows))
+        yield columns[1:]
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def _int_column(values) -> np.ndarray:
+    return np.fromiter((v or 0 for v in values), dtype=np.int64, count=len(values))
+
+
+def _float_column(values) -> np.ndarray:
+    return np.fromiter((v or 0.0 for v in values), dtype=np.float64, count=len(values))
+
+
+def _bool_column(values) -> np.ndarray:
+    return np.fromiter((bool(v) for v in values), dtype=bool, count=len(values))
+
+
+_EPOCH = pd.Timestamp(0, tz='UTC')
+
+
+def _timestamp_column(values) -> np.ndarray:
+    """datetime -> epoch seconds (float64), None -> NaN."""
+    timestamps = pd.to_datetime(pd.Series(values, dtype=object), utc=True)
+    return (timestamps - _EPOCH).dt.total_seconds().to_numpy(dtype=np.float64)
 
 
 def build_user_item_matrix() -> Optional[pd.DataFrame]:
     """
-    Xây dựng User-Item Rating Matrix trực tiếp (Memory Efficient).
-    Sử dụng approach "List of Dicts" -> DataFrame để de-duplicate,
-    sau đó chuyển sang Sparse Matrix.
+    Xây dựng User-Item Rating Matrix (Memory Efficient, Streaming).
+    Đọc từng nguồn theo chunk (values_list), ghi thẳng vào buffer NumPy có kiểu,
+    de-duplicate (user, hotel) bằng vectorized max thay vì DataFrame.groupby.
+
+    Returns:
+        DataFrame (user_id, hotel_id, rating, base_rating, interaction_day):
+        base_rating/interaction_day là score gốc + ngày của event có score decay cao nhất,
+        rating = base_rating đã decay tại thời điểm build (dùng cho evaluation).
     """
     from .models import ViewHistories, FavoriteHotels, Bookings, HotelReviews
     
-    print("🔄 Đang xây dựng User-Item Matrix (Optimized with Time Decay)...")
+    print("🔄 Đang xây dựng User-Item Matrix (Streaming with Time Decay)...")
     
-    # Store tuples: (user_id, hotel_id, rating, source)
-    ratings_data: List[Dict[str, Any]] = []
+    buffer = _InteractionBuffer()
+    config = CF_WEIGHTS
+    # 1 thời điểm tham chiếu cho toàn bộ lần build
+    # Decay KHÔNG nhân vào rating lưu trữ - chỉ dùng để chọn event thắng, áp dụng lại lúc query
+    now_day = int(timezone.now().timestamp() // SECONDS_PER_DAY)
     
     # 1. ViewHistories - Engagement-based scoring with Time Decay
-    # Optimize query: chỉ lấy fields cần thiết
-    view_qs = ViewHistories.objects.all().values(
-        'account_id', 'hotel_id', 
-        'view_duration_seconds', 'clicked_booking', 'clicked_favorite',
-        'viewed_at'
-    )
-    
     count_views = 0
-    for view in view_qs:
-        if not view['hotel_id'] or not view['account_id']:
-            continue
-            
-        score = WEIGHT_VIEW_BASE
-        
-        # Engagement Bonuses
-        duration = view['view_duration_seconds'] or 0
-        if duration > 60:
-            score += BONUS_DURATION_60S
-        if duration > 180:
-            score += BONUS_DURATION_180S
-        if view['clicked_booking']:
-            score += BONUS_CLICK_BOOKING
-        if view['clicked_favorite']:
-            score += BONUS_CLICK_FAVORITE
-            
-        score = min(score, 5.0)
-        
-        # Apply Time Decay
-        decay = calculate_time_decay(view['viewed_at'])
-        final_score = score * decay
-        
-        ratings_data.append({
-            'user_id': view['account_id'],
-            'hotel_id': view['hotel_id'],
-            'rating': final_score,
-            'source': 'view'
-        })
-        count_views += 1
-
+    view_fields = ('account_id', 'hotel_id', 'view_duration_seconds',
+                   'clicked_booking', 'clicked_favorite', 'viewed_at')
+    for account_ids, hotel_ids, durations, clicked_bookings, clicked_favorites, viewed_ats in \
+            _iter_value_chunks(ViewHistories.objects.all(), view_fields):
+        scores = view_engagement_scores(
+            _float_column(durations), _bool_column(clicked_bookings), _bool_column(clicked_favorites), config
+        )
+        days = epoch_days(_timestamp_column(viewed_ats))
+        count_views += buffer.extend(_int_column(account_ids), _int_column(hotel_ids), scores, days)
     print(f"  📍 ViewHistories: {count_views} records")
     
     # 2. FavoriteHotels
-    fav_qs = FavoriteHotels.objects.all().values('account_id', 'hotel_id', 'created_at')
-    for fav in fav_qs:
-        decay = calculate_time_decay(fav['created_at'])
-        ratings_data.append({
-            'user_id': fav['account_id'],
-            'hotel_id': fav['hotel_id'],
-            'rating': WEIGHT_FAVORITE * decay,
-            'source': 'favorite'
-        })
-    print(f"  ❤️ FavoriteHotels: {len(fav_qs)} records")
+    count_favorites = 0
+    for account_ids, hotel_ids, created_ats in \
+            _iter_value_chunks(FavoriteHotels.objects.all(), ('account_id', 'hotel_id', 'created_at')):
+        days = epoch_days(_timestamp_column(created_ats))
+        scores = np.full(days.shape, config.favorite)
+        count_favorites += buffer.extend(_int_column(account_ids), _int_column(hotel_ids), scores, days)
+    print(f"  ❤️ FavoriteHotels: {count_favorites} records")
     
     # 3. Bookings
+    count_bookings = 0
     booking_qs = Bookings.objects.filter(
         room__isnull=False,
         status__in=['CONFIRMED', 'COMPLETED']
-    ).select_related('room__hotel').values('user_id', 'room__hotel_id', 'created_at')
-    
-    for booking in booking_qs:
-        if booking['room__hotel_id']:
-            decay = calculate_time_decay(booking['created_at'])
-            ratings_data.append({
-                'user_id': booking['user_id'],
-                'hotel_id': booking['room__hotel_id'],
-                'rating': WEIGHT_BOOKING * decay,
-                'source': 'booking'
-            })
-    print(f"  🏨 Bookings: {len(booking_qs)} records")
+    )
+    for user_ids, hotel_ids, created_ats in \
+            _iter_value_chunks(booking_qs, ('user_id', 'room__hotel_id', 'created_at')):
+        days = epoch_days(_timestamp_column(created_ats))
+        scores = np.full(days.shape, config.booking)
+        count_bookings += buffer.extend(_int_column(user_ids), _int_column(hotel_ids), scores, days)
+    print(f"  🏨 Bookings: {count_bookings} records")
     
     # 4. Reviews
-    review_qs = HotelReviews.objects.filter(
-        average_rating__isnull=False
-    ).values('user_id', 'hotel_id', 'average_rating', 'created_at')
-    
-    for review in review_qs:
-        decay = calculate_time_decay(review['created_at'])
-        ratings_data.append({
-            'user_id': review['user_id'],
-            'hotel_id': review['hotel_id'],
-            'rating': float(review['average_rating']) * decay,
-            'source': 'review'
-        })
-    print(f"  ⭐ HotelReviews: {len(review_qs)} records")
-    
-    if not ratings_data:
+    count_reviews = 0
+    review_qs = HotelReviews.objects.filter(average_rating__isnull=False)
+    for user_ids, hotel_ids, avg_ratings, created_ats in \
+            _iter_value_chunks(review_qs, ('user_id', 'hotel_id', 'average_rating', 'created_at')):
+        days = epoch_days(_timestamp_column(created_ats))
+        count_reviews += buffer.extend(_int_column(user_ids), _int_column(hotel_ids), _float_column(avg_ratings), days)
+    print(f"  ⭐ HotelReviews: {count_reviews} records")
+    
+    if buffer.size == 0:
         print("⚠️ Không có dữ liệu user behavior!")
         return None
-        
-    # Convert to DataFrame to handle duplicates (User-Item collision)
-    # Nếu 1 user vừa view vừa book hotel -> Lấy max score
-    df = pd.DataFrame(ratings_data)
-    df_agg = df.groupby(['user_id', 'hotel_id'])['rating'].max().reset_index()
+    
+    # Nếu 1 user vừa view vừa book hotel -> Lấy event có score (đã decay) cao nhất
+    user_id, hotel_id, base_rating, day = buffer.max_by_pair(now_day)
+    df_agg = pd.DataFrame({
+        'user_id': user_id,
+        'hotel_id': hotel_id,
+        'rating': base_rating * day_decay_factors(day, now_day, config),
+        'base_rating': base_rating,
+        'interaction_day': day,
+    })
     
     print(f"✅ Tổng cộng: {len(df_agg)} unique interactions. Sparse Matrix Size: {df_agg['user_id'].nunique()}x{df_agg['hotel_id'].nunique()}")
     return df_agg
 
 
-def train_collaborative_model() -> bool:
+def _pairs_to_csr(
+    rows: np.ndarray,
+    cols: np.ndarray,
+    shape: Tuple[int, int],
+    *columns: np.ndarray
+) -> List[csr_matrix]:
+    """
+    Tạo các CSR Matrices dùng chung cấu trúc từ các cặp (row, col) không trùng.
+    Không qua COO -> không cộng dồn / bỏ explicit zeros, `.data` của các matrices luôn song song.
+    """
+    order = np.lexsort((cols, rows))
+    indices = cols[order].astype(np.int32)
+    indptr = np.zeros(shape[0] + 1, dtype=np.int32)
+    np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+    return [csr_matrix((values[order], indices, indptr), shape=shape) for values in columns]
+
+
+def decayed_ratings(
+    cf_data: Dict[str, Any],
+    rows=None,
+    now_ts: Optional[float] = None
+) -> csr_matrix:
+    """
+    User-Item ratings đã áp dụng time decay tại thời điểm query (vectorized trên `.data`).
+
+    Args:
+        cf_data: CF model (user_item_matrix_sparse + interaction_day_sparse)
+        rows: Chỉ tính cho các hàng (users) này - int, list hoặc array; None = toàn bộ matrix
+        now_ts: Thời điểm tham chiếu (epoch seconds), mặc định là hiện tại
+    """
+    now_ts = timezone.now().timestamp() if now_ts is None else now_ts
+    ratings = _decayed(cf_data.get('user_item_matrix_sparse'), cf_data.get('interaction_day_sparse'), rows, now_ts)
+
+    # Merge on read: events mới trong delta buffer (xem delta.merged_cf) -> lấy max
+    delta_matrix = cf_data.get('delta_matrix_sparse')
+    if delta_matrix is not None:
+        ratings = ratings.maximum(_decayed(delta_matrix, cf_data.get('delta_day_sparse'), rows, now_ts)).tocsr()
+    return ratings
+
+
+def _decayed(base: csr_matrix, days: Optional[csr_matrix], rows, now_ts: float) -> csr_matrix:
+    if rows is not None:
+        base = base[rows]
+    if days is None:
+        # Artifact cũ: decay đã nhân sẵn vào ratings lúc train
+        return base
+    if rows is not None:
+        days = days[rows]
+
+    now_day = int(now_ts // SECONDS_PER_DAY)
+    data = base.data * day_decay_factors(days.data, now_day)
+    return csr_matrix((data, base.indices, base.indptr), shape=base.shape)
+
+
+def _with_delta(cf_data: Dict[str, Any]) -> Dict[str, Any]:
+    from . import delta
+    return delta.merged_cf(cf_data)
+
+
+def _binary(matrix: csr_matrix) -> csr_matrix:
+    """Ma trận 0/1 cùng cấu trúc (dùng đếm co-occurrence)."""
+    return csr_matrix((np.ones_like(matrix.data, dtype=np.float32), matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def _item_min_support() -> int:
+    return getattr(settings, 'RECOMMENDER_ITEM_MIN_SUPPORT', 2)
+
+
+def build_collaborative_model() -> Optional[Dict[str, Any]]:
     """
     Train collaborative filtering model efficiently using Sparse Matrices.
     Tránh sử dụng pivot_table() vì nó tạo Dense Matrix gây tốn RAM.
+    Trả về dict model mới (chưa publish), None nếu không có dữ liệu.
     """
     print("\n🔄 Đang huấn luyện Collaborative Filtering Model (Optimized)...")
     
+    # Data cut-off: events ghi vào DB trước thời điểm này đã có trong model (materialized.py so sánh với mốc này)
+    data_cutoff = timezone.now().timestamp()
     df = build_user_item_matrix()
     
     if df is None or df.empty:
         print("⚠️ Không thể train CF model - không có dữ liệu!")
-        return False
+        return None
     
-    # Map UserIDs và HotelIDs sang indices liên tục (0, 1, 2, ...)
-    user_ids = sorted(df['user_id'].unique())
-    hotel_ids = sorted(df['hotel_id'].unique())
+    # Rating gốc (chưa decay) + ngày tương tác -> decay áp dụng lúc query
+    if 'base_rating' in df and 'interaction_day' in df:
+        base_data = df['base_rating'].to_numpy(dtype=np.float64)
+        day_data = df['interaction_day'].to_numpy(dtype=np.int32)
+    else:
+        base_data = df['rating'].to_numpy(dtype=np.float64)
+        day_data = np.full(len(df), NO_INTERACTION_DAY, dtype=np.int32)
     
-    user_map = {uid: i for i, uid in enumerate(user_ids)}
-    hotel_map = {hid: i for i, hid in enumerate(hotel_ids)}
+    cf_model = cf_model_from_interactions(df['user_id'].values, df['hotel_id'].values, base_data, day_data)
+    cf_model['data_cutoff'] = data_cutoff
     
-    # Tạo coordinates cho Sparse Matrix
-    row_indices = df['user_id'].map(user_map).values
-    col_indices = df['hotel_id'].map(hotel_map).values
-    data = df['rating'].values
+    print(f"✅ CF Model đã sẵn sàng!")
+    print(f"   - Users: {len(cf_model['user_ids'])}")
+    print(f"   - Hotels: {len(cf_model['hotel_ids'])}")
+    return cf_model
+
+
+def cf_model_from_interactions(
+    user_id: np.ndarray,
+    hotel_id: np.ndarray,
+    base_rating: np.ndarray,
+    day: np.ndarray
+) -> Dict[str, Any]:
+    """
+    Tạo CF model (matrices + similarities) từ các interactions đã de-duplicate theo (user, hotel).
+    Train đầy đủ - compaction delta buffer dùng fold_in_interactions (chỉ tính lại phần bị ảnh hưởng).
+    """
+    # Map UserIDs và HotelIDs sang indices liên tục (0, 1, 2, ...) -> coordinates cho Sparse Matrix
+    # np.unique trả về ids đã sort -> delta.py lookup bằng searchsorted
+    user_id_arr, row_indices = np.unique(user_id, return_inverse=True)
+    hotel_id_arr, col_indices = np.unique(hotel_id, return_inverse=True)
+    user_ids = user_id_arr.tolist()
+    hotel_ids = hotel_id_arr.tolist()
     
-    # Tạo CSR Matrix trực tiếp
+    # Tạo CSR Matrix trực tiếp - 2 matrices dùng chung cấu trúc (indices/indptr)
     n_users = len(user_ids)
     n_hotels = len(hotel_ids)
-    sparse_matrix = csr_matrix((data, (row_indices, col_indices)), shape=(n_users, n_hotels))
+    sparse_matrix, day_matrix = _pairs_to_csr(row_indices, col_indices, (n_users, n_hotels), base_rating, day)
     
-    # Tính Similarities
-    # User Similarity: Cosine similarity giữa các hàng (users)
-    user_similarity = cosine_similarity(sparse_matrix, dense_output=False)
+    # Tính Similarities trên ratings đã decay tại thời điểm train
+    decayed_matrix = decayed_ratings({'user_item_matrix_sparse': sparse_matrix, 'interaction_day_sparse': day_matrix})
     
-    # Item Similarity: Cosine similarity giữa các cột (hotels)
-    # Transpose matrix để rows là items
-    item_matrix = sparse_matrix.T
-    item_similarity = cosine_similarity(item_matrix, dense_output=False)
+    if get_cf_engine() == CF_ENGINE_ALS:
+        # Latent factors thay cho neighborhood structures
+        user_factors, item_factors = als.train_als(decayed_matrix)
+        als_model = {}
+        if ann.should_use_ann(n_hotels):
+            # Hotels tương tự: ANN trên item factors đã normalize thay vì so với mọi hotel
+            item_vectors = normalize(item_factors, norm='l2', axis=1)
+            index = ann.IVFIndex.build(item_vectors)
+            als_model = {
+                'als_item_vectors_normalized': item_vectors,
+                'ann_recall': round(ann.measure_recall(index, item_vectors), 4),
+                **index.to_arrays('als_ann'),
+            }
+        return {
+            **als_model,
+            'engine': CF_ENGINE_ALS,
+            'user_item_matrix_sparse': sparse_matrix,
+            'interaction_day_sparse': day_matrix,
+            'als_user_factors': user_factors,
+            'als_item_factors': item_factors,
+            'als_item_gram': als.item_gram(item_factors),
+            'user_ids': user_ids,
+            'hotel_ids': hotel_ids,
+        }
     
-    # Lưu vào global cache
-    # Lưu ý: user_similarity va item_similarity giờ là Sparse Matrices
-    cf_global_data['user_item_matrix_sparse'] = sparse_matrix
-    cf_global_data['user_similarity_sparse'] = user_similarity
-    cf_global_data['item_similarity_sparse'] = item_similarity
+    # User vectors: L2-normalize từng hàng -> cosine(u, v) = dot product,
+    # neighbors của 1 user tính lúc request (không lưu matrix users x users)
+    user_vectors = normalize(decayed_matrix, norm='l2', axis=1).astype(np.float32)
     
-    # Lưu mappings để lookup ngược lại
-    cf_global_data['user_ids'] = user_ids
-    cf_global_data['hotel_ids'] = hotel_ids
-    
-    # Để tương thích ngược với code cũ (nếu cần lookup nhanh score 1 user-item)
-    # Chúng ta lưu thêm dict hoặc dùng sparse indexing
-    # Ở đây ta sẽ dùng sparse indexing trong hàm get_recs để tiết kiệm RAM
-    
-    print(f"✅ CF Model đã sẵn sàng!")
-    print(f"   - Users: {n_users}")
-    print(f"   - Hotels: {n_hotels}")
+    # Item neighbors: top-K hotels tương tự cho mỗi hotel (cosine giữa các cột),
+    # bỏ các cặp có ít hơn min_support users chung -> bảng int32/float32 (Hotels x K)
+    item_matrix = normalize(decayed_matrix.T.tocsr(), norm='l2', axis=1)
+    item_neighbor_idx, item_neighbor_scores, ann_recall = ann.build_neighbor_table(
+        item_matrix,
+        getattr(settings, 'RECOMMENDER_ITEM_TOP_K', 50),
+        support_matrix=_binary(item_matrix),
+        min_support=_item_min_support(),
+        label='item CF',
+    )
     
+    # Lưu mappings (user_ids, hotel_ids) để lookup ngược lại
+    return {
+        'engine': CF_ENGINE_NEIGHBORHOOD,
+        'user_item_matrix_sparse': sparse_matrix,
+        'interaction_day_sparse': day_matrix,
+        'user_vectors_normalized': user_vectors,
+        'item_neighbor_idx': item_neighbor_idx,
+        'item_neighbor_scores': item_neighbor_scores,
+        'ann_recall': ann_recall,
+        'user_ids': user_ids,
+        'hotel_ids': hotel_ids,
+    }
+
+
+def _remap_csr(matrix: csr_matrix, row_positions: np.ndarray, col_positions: np.ndarray, shape) -> csr_matrix:
+    """
+    Đặt hàng / cột của CSR Matrix vào vị trí mới trong matrix lớn hơn (users / hotels mới chen vào).
+    Maps tăng dần -> indices của mỗi hàng vẫn sort, `.data` dùng chung (không copy).
+    """
+    counts = np.zeros(shape[0], dtype=np.int64)
+    counts[row_positions] = np.diff(matrix.indptr)
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+    return csr_matrix((matrix.data, col_positions[matrix.indices], indptr), shape=shape)
+
+
+def _replace_rows(matrices: List[csr_matrix], rows: np.ndarray, replacements: List[csr_matrix]) -> List[csr_matrix]:
+    """
+    Thay các hàng `rows` (tăng dần) của các CSR Matrices dùng chung cấu trúc bằng các hàng của `replacements`
+    (cũng dùng chung cấu trúc). 1 lần merge tuyến tính, không sort lại toàn bộ entries.
+    """
+    base, replacement = matrices[0], replacements[0]
+    entry_rows = np.repeat(np.arange(base.shape[0]), np.diff(base.indptr))
+    replaced = np.zeros(base.shape[0], dtype=bool)
+    replaced[rows] = True
+    keep = ~replaced[entry_rows]
+
+    all_rows = np.concatenate([entry_rows[keep], rows[np.repeat(np.arange(rows.size), np.diff(replacement.indptr))]])
+    # 2 đoạn đã sort theo hàng -> stable sort chỉ merge 2 runs
+    order = np.argsort(all_rows, kind='stable')
+    indices = np.concatenate([base.indices[keep], replacement.indices])[order]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(all_rows, minlength=base.shape[0]))])
+    return [
+        csr_matrix((np.concatenate([matrix.data[keep], new.data])[order], indices, indptr), shape=base.shape)
+        for matrix, new in zip(matrices, replacements)
+    ]
+
+
+def _column_similarities(cf_data: Dict[str, Any], cols: np.ndarray, now_ts: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cosine (+ min_support) giữa các hotels `cols` và mọi hotel, chỉ đọc ratings của users đã tương tác với `cols`.
+
+    Returns:
+        (hàng, cột, similarity) các cặp > 0, không gồm cặp (hotel, chính nó)
+    """
+    decayed = decayed_ratings(cf_data, now_ts=now_ts)
+    n_hotels = decayed.shape[1]
+    norms = np.sqrt(np.bincount(decayed.indices, weights=np.square(decayed.data), minlength=n_hotels))
+    inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+
+    touched = np.zeros(n_hotels, dtype=bool)
+    touched[cols] = True
+    entry_rows = np.repeat(np.arange(decayed.shape[0]), np.diff(decayed.indptr))
+    ratings = decayed[np.unique(entry_rows[touched[decayed.indices]])]
+
+    binary = _binary(ratings)
+    support = binary[:, cols].T.dot(binary)
+    dot = ratings[:, cols].T.dot(ratings).multiply(support >= _item_min_support())
+    sim = diags(inv_norms[cols]).dot(dot).dot(diags(inv_norms)).tocoo()
+
+    rows = cols[sim.row]
+    keep = (sim.data > 0) & (rows != sim.col)
+    return rows[keep], sim.col[keep].astype(np.int64), sim.data[keep]
+
+
+def _patch_item_neighbors(
+    cf_data: Dict[str, Any],
+    model: Dict[str, Any],
+    hotel_pos: np.ndarray,
+    cols: np.ndarray,
+    now_ts: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Bảng item neighbors sau compaction: giữ nguyên các hàng không liên quan,
+    tính lại similarities của các hotels có events mới (`cols`) và top-K lại các hàng chứa / nhận các hotels này.
+    Ô cũ trỏ tới `cols` bị thay bằng similarity mới -> hàng có thể thiếu ứng viên ngoài top-K cũ tới lần train sau.
+    """
+    old_idx, old_scores = cf_data['item_neighbor_idx'], cf_data['item_neighbor_scores']
+    n_hotels = len(model['hotel_ids'])
+    k = max(0, min(int(getattr(settings, 'RECOMMENDER_ITEM_TOP_K', 50)), n_hotels - 1))
+    width = min(k, old_idx.shape[1])
+
+    neighbor_idx = np.full((n_hotels, k), -1, dtype=np.int32)
+    neighbor_scores = np.zeros((n_hotels, k), dtype=np.float32)
+    neighbor_idx[hotel_pos, :width] = np.where(old_idx[:, :width] >= 0, hotel_pos[old_idx[:, :width]], -1)
+    neighbor_scores[hotel_pos, :width] = old_scores[:, :width]
+    if k == 0:
+        return neighbor_idx, neighbor_scores
+
+    touched = np.zeros(n_hotels, dtype=bool)
+    touched[cols] = True
+    entry_rows = np.repeat(np.arange(n_hotels), k)
+    entry_cols, entry_scores = neighbor_idx.ravel(), neighbor_scores.ravel()
+    valid = entry_cols >= 0
+    entry_rows, entry_cols, entry_scores = entry_rows[valid], entry_cols[valid], entry_scores[valid]
+
+    # Similarity đối xứng: (c, j) cho hàng c và (j, c) cho hàng j
+    sim_rows, sim_cols, sim_data = _column_similarities(model, cols, now_ts)
+    mirror = ~touched[sim_cols]
+
+    affected = touched.copy()
+    affected[entry_rows[touched[entry_cols]]] = True
+    affected[sim_cols] = True
+    keep = affected[entry_rows] & ~touched[entry_rows] & ~touched[entry_cols]
+
+    cand_rows = np.concatenate([entry_rows[keep], sim_rows, sim_cols[mirror]])
+    cand_cols = np.concatenate([entry_cols[keep], sim_cols, sim_rows[mirror]])
+    cand_scores = np.concatenate([entry_scores[keep], sim_data, sim_data[mirror]])
+
+    affected_rows = np.flatnonzero(affected)
+    candidates = csr_matrix(
+        (cand_scores, (np.searchsorted(affected_rows, cand_rows), cand_cols)), shape=(affected_rows.size, n_hotels)
+    )
+    neighbor_idx[affected_rows] = -1
+    neighbor_scores[affected_rows] = 0
+    for row, (idx, scores) in zip(affected_rows.tolist(), top_k_sparse_rows(candidates, k, threshold=0)):
+        neighbor_idx[row, :idx.size] = idx
+        neighbor_scores[row, :idx.size] = scores
+    return neighbor_idx, neighbor_scores
+
+
+def _fold_in_als(
+    cf_data: Dict[str, Any],
+    model: Dict[str, Any],
+    rows: np.ndarray,
+    user_pos: np.ndarray,
+    hotel_pos: np.ndarray,
+    now_ts: float
+) -> Dict[str, Any]:
+    """
+    ALS sau compaction: fold-in lại factors của users có events mới (item factors cố định),
+    hotels mới fold-in từ user factors (cùng công thức, đổi vai users / items).
+    """
+    n_users, n_hotels = len(model['user_ids']), len(model['hotel_ids'])
+    old_user_factors, old_item_factors = cf_data['als_user_factors'], cf_data['als_item_factors']
+
+    user_factors = np.zeros((n_users, old_user_factors.shape[1]), dtype=np.float32)
+    user_factors[user_pos[:old_user_factors.shape[0]]] = old_user_factors
+    item_factors = np.zeros((n_hotels, old_item_factors.shape[1]), dtype=np.float32)
+    item_factors[hotel_pos[:old_item_factors.shape[0]]] = old_item_factors
+    has_factors = np.zeros(n_hotels, dtype=bool)
+    has_factors[hotel_pos[:old_item_factors.shape[0]]] = True
+
+    # Hotels chưa có factor (hàng 0) không đóng góp vào fold-in
+    gram = cf_data.get('als_item_gram')
+    gram = gram if gram is not None else als.item_gram(old_item_factors)
+    ratings = decayed_ratings(model, rows=rows, now_ts=now_ts)
+    for i, row in enumerate(rows.tolist()):
+        user_factors[row] = als.fold_in_user(ratings[i], item_factors, gram)
+
+    # Hotels mới chỉ có ratings từ users có events mới (`rows`)
+    new_items = np.flatnonzero(~has_factors)
+    if new_items.size:
+        row_factors = user_factors[rows]
+        user_gram = als.item_gram(user_factors)
+        item_ratings = ratings[:, new_items].T.tocsr()
+        for i, col in enumerate(new_items.tolist()):
+            item_factors[col] = als.fold_in_user(item_ratings[i], row_factors, user_gram)
+
+    updates = {
+        'als_user_factors': user_factors,
+        'als_item_factors': item_factors,
+        'als_item_gram': als.item_gram(item_factors),
+    }
+    index = ann.IVFIndex.from_arrays(cf_data, 'als_ann')
+    if index is not None:
+        item_vectors = normalize(item_factors, norm='l2', axis=1)
+        updates['als_item_vectors_normalized'] = item_vectors
+        updates.update(index.with_items(item_vectors, hotel_pos, new_items).to_arrays('als_ann'))
+    return updates
+
+
+def fold_in_interactions(
+    cf_data: Dict[str, Any],
+    user_id: np.ndarray,
+    hotel_id: np.ndarray,
+    base_rating: np.ndarray,
+    day: np.ndarray,
+    now_day: int
+) -> Dict[str, Any]:
+    """
+    Gộp interactions mới (compaction delta buffer, xem delta.py) vào CF model `cf_data` mà không train lại:
+    - User-Item Matrix: chỉ dựng lại hàng của users có events mới (cặp trùng lấy score decay cao nhất tại `now_day`),
+      users / hotels mới chen vào đúng thứ tự sort của ids
+    - Neighborhood: tính lại user vectors của các users đó + vá bảng item neighbors quanh các hotels có events mới
+    - ALS: fold-in users có events mới và hotels mới
+    Train lại toàn bộ similarities / ALS vẫn do train job (jobs.py).
+
+    Args:
+        user_id, hotel_id, base_rating, day: Events đã de-duplicate theo (user, hotel)
+    """
+    base_matrix = cf_data.get('user_item_matrix_sparse') if cf_data else None
+    if base_matrix is None:
+        # Chưa có model base -> model chỉ gồm events mới
+        return cf_model_from_interactions(user_id, hotel_id, base_rating, day)
+
+    base_user_ids = np.asarray(cf_data['user_ids'], dtype=np.int64)
+    base_hotel_ids = np.asarray(cf_data['hotel_ids'], dtype=np.int64)
+    user_ids = np.union1d(base_user_ids, user_id)
+    hotel_ids = np.union1d(base_hotel_ids, hotel_id)
+    user_pos = np.searchsorted(user_ids, base_user_ids)
+    hotel_pos = np.searchsorted(hotel_ids, base_hotel_ids)
+    shape = (user_ids.size, hotel_ids.size)
+
+    base_days = cf_data.get('interaction_day_sparse')
+    if base_days is None:
+        base_days = csr_matrix(
+            (np.full(base_matrix.nnz, NO_INTERACTION_DAY, dtype=np.int32), base_matrix.indices, base_matrix.indptr),
+            shape=base_matrix.shape
+        )
+    matrix = _remap_csr(base_matrix, user_pos, hotel_pos, shape)
+    days = _remap_csr(base_days, user_pos, hotel_pos, shape)
+
+    # Hàng của users có events mới: ratings cũ + events -> max theo cặp (user, hotel)
+    rows = np.unique(np.searchsorted(user_ids, user_id))
+    old, old_days = matrix[rows], days[rows]
+    interactions = _InteractionBuffer(capacity=old.nnz + user_id.size)
+    interactions.extend(
+        user_ids[rows[np.repeat(np.arange(rows.size), np.diff(old.indptr))]], hotel_ids[old.indices],
+        np.asarray(old.data, dtype=np.float64), np.asarray(old_days.data, dtype=np.int32),
+    )
+    interactions.extend(user_id, hotel_id, base_rating, day)
+    pair_users, pair_hotels, pair_ratings, pair_days = interactions.max_by_pair(now_day)
+    replacements = _pairs_to_csr(
+        np.searchsorted(rows, np.searchsorted(user_ids, pair_users)), np.searchsorted(hotel_ids, pair_hotels),
+        (rows.size, shape[1]), pair_ratings, pair_days
+    )
+    matrix, days = _replace_rows([matrix, days], rows, replacements)
+
+    model = dict(cf_data)
+    model.update({
+        'user_item_matrix_sparse': matrix,
+        'interaction_day_sparse': days,
+        'user_ids': user_ids.tolist(),
+        'hotel_ids': hotel_ids.tolist(),
+    })
+    now_ts = float(now_day * SECONDS_PER_DAY)
+
+    if cf_data.get('engine') == CF_ENGINE_ALS:
+        model.update(_fold_in_als(cf_data, model, rows, user_pos, hotel_pos, now_ts))
+        return model
+
+    user_vectors = cf_data.get('user_vectors_normalized')
+    if user_vectors is not None:
+        fresh = normalize(decayed_ratings(model, rows=rows, now_ts=now_ts), norm='l2', axis=1).astype(np.float32)
+        model['user_vectors_normalized'] = _replace_rows(
+            [_remap_csr(user_vectors, user_pos, hotel_pos, shape)], rows, [fresh]
+        )[0]
+    if cf_data.get('item_neighbor_idx') is not None:
+        cols = np.unique(np.searchsorted(hotel_ids, hotel_id))
+        model['item_neighbor_idx'], model['item_neighbor_scores'] = _patch_item_neighbors(
+            cf_data, model, hotel_pos, cols, now_ts
+        )
+    return model
+
+
+def train_collaborative_model() -> bool:
+    """Train CF model và publish snapshot mới (giữ nguyên Content-Based model)."""
+    cf_model = build_collaborative_model()
+    if cf_model is None:
+        return False
+    snapshot.publish(cf=cf_model)
     return True
 
 
-def get_user_based_recommendations(user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+class _NeighborCache:
     """
-    User-Based Collaborative Filtering (Optimized for Sparse Matrix)
+    LRU cache (giới hạn kích thước) cho neighbors của các users được request nhiều.
+    Gắn với 1 matrix user vectors - tự reset khi snapshot CF mới được publish.
     """
-    if not cf_global_data:
-        return []
-    
-    user_ids = cf_global_data.get('user_ids', [])
-    hotel_ids = cf_global_data.get('hotel_ids', [])
-    sparse_matrix = cf_global_data.get('user_item_matrix_sparse')
-    user_similarity = cf_global_data.get('user_similarity_sparse')
-    
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._owner = None
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, owner, key):
+        with self._lock:
+            if owner is not self._owner or key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, owner, key, value) -> None:
+        with self._lock:
+            if owner is not self._owner:
+                self._owner = owner
+                self._entries.clear()
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+_user_neighbor_cache = _NeighborCache(getattr(settings, 'RECOMMENDER_USER_NEIGHBOR_CACHE_SIZE', 1024))
+
+
+def _user_vectors(cf_data: Dict[str, Any]) -> csr_matrix:
+    vectors = cf_data.get('user_vectors_normalized')
+    if vectors is None:
+        # Artifact cũ (chưa có user vectors) -> normalize lúc request
+        vectors = normalize(decayed_ratings(cf_data), norm='l2', axis=1)
+    return vectors
+
+
+def find_similar_users(
+    cf_data: Dict[str, Any],
+    u_idx: int,
+    k: int = USER_NEIGHBORS_K,
+    cache_owner=None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-K similar users của user `u_idx`: 1 phép nhân sparse matrix x row vector + top_k.
+
+    Args:
+        cache_owner: Object định danh model base (user vectors của snapshot) để cache kết quả,
+            None = không cache (vd: user có events mới trong delta buffer)
+
+    Returns:
+        (user indices, cosine similarities) sort giảm dần, bỏ chính user đó và similarity = 0
+    """
+    if cache_owner is not None:
+        cached = _user_neighbor_cache.get(cache_owner, (u_idx, k))
+        if cached is not None:
+            return cached
+
+    vectors = _user_vectors(cf_data)
+    if u_idx in cf_data.get('delta_user_rows', ()):
+        # User vừa có action mới (delta buffer) -> vector từ ratings đã merge
+        target = normalize(decayed_ratings(cf_data, [u_idx]), norm='l2', axis=1)
+    else:
+        target = vectors[u_idx]
+
+    # (Users x Hotels) . (Hotels x 1) -> cosine similarity với tất cả users
+    sim_scores = vectors.dot(target.T).toarray().ravel()
+    result = top_k(sim_scores, k, exclude=[u_idx], threshold=0)
+
+    if cache_owner is not None:
+        _user_neighbor_cache.put(cache_owner, (u_idx, k), result)
+    return result
+
+
+def _als_user_scores(cf_data: Dict[str, Any], u_idx: int, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+    """ALS: score tất cả hotels = U[u] @ Vᵀ, bỏ hotels user đã tương tác."""
+    user_factors = cf_data['als_user_factors']
+    item_factors = cf_data['als_item_factors']
+    n_items = item_factors.shape[0]
+
+    rated = decayed_ratings(cf_data, u_idx)
+    if u_idx >= user_factors.shape[0] or u_idx in cf_data.get('delta_user_rows', ()):
+        # User mới / có events mới trong delta buffer -> fold-in factor từ ratings đã merge
+        # (hotels mới chưa có factors -> bỏ qua cột của chúng)
+        known = rated[:, :n_items]
+        user_vector = als.fold_in_user(known, item_factors, cf_data['als_item_gram'])
+    else:
+        user_vector = user_factors[u_idx]
+
+    scores = item_factors @ user_vector.astype(np.float32)
+    rated_items = rated.indices[rated.indices < n_items]
+    return top_k(scores, limit, exclude=rated_items, threshold=0)
+
+
+def _empty_scores() -> Tuple[np.ndarray, np.ndarray]:
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+
+def user_based_scores(
+    cf_data: Dict[str, Any],
+    user_id: int,
+    limit: int = 10,
+    base_cf: Optional[Dict[str, Any]] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    User-Based CF dạng arrays (không tạo dicts).
+
+    Args:
+        cf_data: CF model đã merge delta buffer
+        base_cf: CF model base của snapshot (định danh cache neighbors), mặc định = cf_data
+
+    Returns:
+        (vị trí hotels trong cf_data['hotel_ids'], scores) giảm dần; rỗng nếu user không có trong model
+    """
+    user_ids = cf_data.get('user_ids', []) if cf_data else []
     if user_id not in user_ids:
-        return []
+        return _empty_scores()
     
     # Lấy index của target user
     u_idx = user_ids.index(user_id)
     
-    # Lấy vector similarity của user này với tất cả users khác
-    # user_similarity là sparse matrix (N x N)
-    # Ta lấy row tương ứng -> result là sparse matrix (1 x N)
-    sim_scores_sparse = user_similarity[u_idx]
-    
-    # Convert sang dense array chỉ cho row này để sort (N is usually manageable, N^2 is not)
-    sim_scores = sim_scores_sparse.toarray().flatten()
-    
-    # Lấy indices của top similar users (bỏ chính nó - index u_idx)
-    # argsort returns indices that would sort the array
-    top_indices = np.argsort(sim_scores)[::-1]
+    if cf_data.get('engine') == CF_ENGINE_ALS:
+        return _als_user_scores(cf_data, u_idx, limit)
     
-    # Filter out self and 0 similarity
-    similar_user_indices = [i for i in top_indices if i != u_idx and sim_scores[i] > 0][:20]  # Top 20 similar users
+    # Lấy top 20 similar users (bỏ chính nó - index u_idx, bỏ similarity = 0)
+    # Chỉ cache khi user không có events mới trong delta buffer
+    base_cf = base_cf if base_cf is not None else cf_data
+    cache_owner = None if u_idx in cf_data.get('delta_user_rows', ()) else base_cf.get('user_vectors_normalized')
+    similar_user_indices, similar_scores = find_similar_users(cf_data, u_idx, cache_owner=cache_owner)
     
-    if not similar_user_indices:
-        return []
+    if similar_user_indices.size == 0:
+        return _empty_scores()
 
     # Dự đoán rating
     # Prediction formula: P(u, i) = sum(sim(u, v) * r(v, i)) / sum(|sim(u, v)|)
@@ -262,11 +971,11 @@ def get_user_based_recommendations(user_id: int, limit: int = 10) -> List[Dict[s
     # 2. Construct vector of similarities (M users x 1)
     # 3. Weighted sum
     
-    # Lấy ratings của similar users -> Sub-matrix (K x Items)
-    similar_users_ratings = sparse_matrix[similar_user_indices]  # Returns CSR matrix
+    # Lấy ratings của similar users (decay tại thời điểm query) -> Sub-matrix (K x Items)
+    similar_users_ratings = decayed_ratings(cf_data, similar_user_indices)  # Returns CSR matrix
     
     # Weights (similarities)
-    weights = sim_scores[similar_user_indices].reshape(-1, 1)  # K x 1
+    weights = similar_scores.astype(np.float64).reshape(-1, 1)  # K x 1
     
     # Weighted Sum: weights.T * ratings -> (1 x Items)
     # scikit-learn cosine_similarity returns values usually 0-1
@@ -290,78 +999,353 @@ def get_user_based_recommendations(user_id: int, limit: int = 10) -> List[Dict[s
     if sum_weights > 0:
         prediction_scores /= sum_weights
         
-    # Filter out items user already rated
-    user_rated_items_indices = sparse_matrix[u_idx].nonzero()[1]
-    prediction_scores[user_rated_items_indices] = 0
-    
-    # Get top item indices
-    top_item_indices = np.argsort(prediction_scores)[::-1][:limit]
-    
-    recommendations = []
-    for idx in top_item_indices:
-        score = prediction_scores[idx]
-        if score > 0:
-            recommendations.append({
-                'hotel_id': hotel_ids[idx],
-                'cf_score': round(float(score), 4)
-            })
-            
-    return recommendations
+    # Filter out items user already rated + get top item indices
+    user_rated_items_indices = decayed_ratings(cf_data, u_idx).nonzero()[1]
+    return top_k(prediction_scores, limit, exclude=user_rated_items_indices, threshold=0)
 
 
-def get_item_based_recommendations(hotel_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+def get_user_based_recommendations(
+    user_id: int,
+    limit: int = 10,
+    snap: Optional[snapshot.ModelSnapshot] = None
+) -> List[Dict[str, Any]]:
     """
-    Item-Based Collaborative Filtering (Optimized)
+    User-Based Collaborative Filtering (Optimized for Sparse Matrix)
     """
-    if not cf_global_data:
+    base_cf = (snap or snapshot.current()).cf
+    cf_data = _with_delta(base_cf)
+    if not cf_data:
         return []
     
-    hotel_ids = cf_global_data.get('hotel_ids', [])
-    item_similarity = cf_global_data.get('item_similarity_sparse')
+    hotel_ids = cf_data.get('hotel_ids', [])
+    top_item_indices, top_scores = user_based_scores(cf_data, user_id, limit, base_cf=base_cf)
+    
+    return [{
+        'hotel_id': hotel_ids[idx],
+        'cf_score': round(float(score), 4)
+    } for idx, score in zip(top_item_indices, top_scores)]
+
+
+def _batch_user_vectors(cf_data: Dict[str, Any], rows: np.ndarray) -> Tuple[csr_matrix, csr_matrix]:
+    """(user vectors của model, vectors của các users `rows`) - users có events trong delta buffer lấy từ ratings đã merge."""
+    vectors = _user_vectors(cf_data)
+    targets = vectors[rows]
+
+    delta_rows = cf_data.get('delta_user_rows', ())
+    is_delta = np.fromiter((row in delta_rows for row in rows.tolist()), dtype=bool, count=rows.size)
+    if is_delta.any():
+        fresh = normalize(decayed_ratings(cf_data, rows[is_delta]), norm='l2', axis=1)
+        order = np.arange(rows.size)
+        order[is_delta] = rows.size + np.arange(fresh.shape[0])
+        targets = vstack([targets, fresh]).tocsr()[order]
+    return vectors, targets
+
+
+def _neighborhood_scores_batch(
+    cf_data: Dict[str, Any],
+    rows: np.ndarray,
+    limit: int,
+    allowed: Optional[np.ndarray] = None
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """User-Based CF cho cả batch bằng 2 phép nhân Sparse Matrix x Sparse Matrix."""
+    vectors, targets = _batch_user_vectors(cf_data, rows)
+
+    # (B x Hotels) . (Hotels x Users) -> cosine similarity của B users với tất cả users, bỏ chính user đó
+    sims = csr_matrix(targets.dot(vectors.T))
+    entry_rows = np.repeat(np.arange(rows.size), np.diff(sims.indptr))
+    sims.data[sims.indices == rows[entry_rows]] = 0
+    neighbors = top_k_sparse_rows(sims, USER_NEIGHBORS_K, threshold=0)
+
+    # Ma trận weights (B x Users), mỗi hàng K similar users -> chỉ lấy ratings của các users này
+    neighbor_rows = np.concatenate([idx for idx, _ in neighbors])
+    neighbor_ids, neighbor_cols = np.unique(neighbor_rows, return_inverse=True)
+    indptr = np.concatenate([[0], np.cumsum([idx.size for idx, _ in neighbors])])
+    weights = csr_matrix(
+        (np.concatenate([scores for _, scores in neighbors]).astype(np.float64), neighbor_cols, indptr),
+        shape=(rows.size, neighbor_ids.size)
+    )
+
+    # P = W . R / sum(W) -> (B x Hotels), cùng công thức với get_user_based_recommendations
+    prediction = weights.dot(decayed_ratings(cf_data, neighbor_ids))
+    sum_weights = np.asarray(weights.sum(axis=1)).ravel()
+    prediction = csr_matrix(diags(np.divide(1.0, sum_weights, out=np.zeros_like(sum_weights), where=sum_weights > 0)).dot(prediction))
+
+    # Bỏ hotels user đã rate (score = 0 -> bị loại bởi threshold)
+    rated = _binary(decayed_ratings(cf_data, rows))
+    prediction = csr_matrix(prediction - prediction.multiply(rated))
+    if allowed is not None:
+        prediction.data[~allowed[prediction.indices]] = 0
+    return top_k_sparse_rows(prediction, limit, threshold=0)
+
+
+def _als_scores_batch(
+    cf_data: Dict[str, Any],
+    rows: np.ndarray,
+    limit: int,
+    allowed: Optional[np.ndarray] = None
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """ALS cho cả batch: block users x item factors (GEMM), fold-in cho users mới / có events trong delta buffer."""
+    user_factors = cf_data['als_user_factors']
+    item_factors = cf_data['als_item_factors']
+    n_items = item_factors.shape[0]
+
+    rated = decayed_ratings(cf_data, rows)[:, :n_items].tocsr()
+    vectors = np.empty((rows.size, item_factors.shape[1]), dtype=np.float32)
+    delta_rows = cf_data.get('delta_user_rows', ())
+    for i, row in enumerate(rows.tolist()):
+        if row >= user_factors.shape[0] or row in delta_rows:
+            vectors[i] = als.fold_in_user(rated[i], item_factors, cf_data['als_item_gram'])
+        else:
+            vectors[i] = user_factors[row]
+
+    results = []
+    block = max(1, MAX_BLOCK_ELEMENTS // max(n_items, 1))
+    for start in range(0, rows.size, block):
+        stop = min(start + block, rows.size)
+        scores = vectors[start:stop] @ item_factors.T
+        block_rated = rated[start:stop]
+        scores[np.repeat(np.arange(stop - start), np.diff(block_rated.indptr)), block_rated.indices] = -np.inf
+        if allowed is not None:
+            scores[:, ~allowed[:n_items]] = -np.inf
+        top_idx, top_scores = top_k_rows(scores, limit)
+        for idx_row, score_row in zip(top_idx, top_scores):
+            keep = score_row > 0
+            results.append((idx_row[keep], score_row[keep]))
+    return results
+
+
+def get_user_based_recommendations_batch(
+    user_ids: List[int],
+    limit: int = 10,
+    snap: Optional[snapshot.ModelSnapshot] = None,
+    hotel_filter: Any = None
+) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    User-Based CF cho nhiều users trong 1 lần: score cả batch bằng phép nhân Sparse Matrix
+    (neighborhood) hoặc GEMM trên factors (ALS) thay vì gọi get_user_based_recommendations từng user.
+
+    Args:
+        hotel_filter: Optional filters.HotelFilter - chỉ chọn top-K trong các hotels thỏa filter
+
+    Returns:
+        {user_id: list recommendations (cùng format get_user_based_recommendations)},
+        users không có trong model -> list rỗng
+    """
+    results = {user_id: [] for user_id in user_ids}
+    cf_data = _with_delta((snap or snapshot.current()).cf)
+    if not cf_data:
+        return results
+
+    positions = {user_id: idx for idx, user_id in enumerate(cf_data.get('user_ids', []))}
+    known = [user_id for user_id in results if user_id in positions]
+    if not known:
+        return results
+
+    rows = np.array([positions[user_id] for user_id in known], dtype=np.int64)
+    hotel_ids = cf_data.get('hotel_ids', [])
+    allowed = hotel_filter.allows(hotel_ids) if hotel_filter else None
+    if cf_data.get('engine') == CF_ENGINE_ALS:
+        scored = _als_scores_batch(cf_data, rows, limit, allowed)
+    else:
+        scored = _neighborhood_scores_batch(cf_data, rows, limit, allowed)
+
+    for user_id, (top_item_indices, top_scores) in zip(known, scored):
+        results[user_id] = [{
+            'hotel_id': hotel_ids[idx],
+            'cf_score': round(float(score), 4)
+        } for idx, score in zip(top_item_indices, top_scores)]
+    return results
+
+
+def _item_exclusion(h_idx: int, allowed: Optional[np.ndarray]):
+    """Exclusion cho Item-Based CF: chính hotel đó + hotels không thỏa filter (`allowed`)."""
+    if allowed is None:
+        return [h_idx]
+    exclude = ~allowed
+    exclude[h_idx] = True
+    return exclude
+
+
+# (CF model base, ngày, CSC ratings base, bình phương norm cột đã decay) - xem _item_norms_sq
+_base_item_columns_cache = None
+# (CF model đã merge delta, ngày, bình phương norm cột đã decay)
+_item_norms_cache = None
+
+
+def _base_item_columns(base_cf: Dict[str, Any], now_ts: float) -> Tuple[Any, np.ndarray]:
+    """CSC của ratings base (users theo từng hotel) + bình phương norm từng cột, cache theo snapshot base + ngày."""
+    global _base_item_columns_cache
+
+    now_day = int(now_ts // SECONDS_PER_DAY)
+    cache = _base_item_columns_cache
+    if cache is not None and cache[0] is base_cf and cache[1] == now_day:
+        return cache[2], cache[3]
+
+    base_matrix = base_cf.get('user_item_matrix_sparse')
+    if base_matrix is None:
+        columns, norms_sq = None, np.zeros(0)
+    else:
+        decayed = _decayed(base_matrix, base_cf.get('interaction_day_sparse'), None, now_ts)
+        columns = base_matrix.tocsc()
+        norms_sq = np.bincount(decayed.indices, weights=np.square(decayed.data), minlength=base_matrix.shape[1])
+    _base_item_columns_cache = (base_cf, now_day, columns, norms_sq)
+    return columns, norms_sq
+
+
+def _column_users(cf_data: Dict[str, Any], columns, cols) -> np.ndarray:
+    """Users (hàng) có rating ở các cột `cols` - trong ratings base (CSC) hoặc delta buffer."""
+    cols = np.asarray(cols, dtype=np.int64)
+    parts = []
+    if columns is not None:
+        base_cols = cols[cols < columns.shape[1]]
+        starts, stops = columns.indptr[base_cols], columns.indptr[base_cols + 1]
+        parts.extend(columns.indices[start:stop] for start, stop in zip(starts.tolist(), stops.tolist()))
+    delta_matrix = cf_data.get('delta_matrix_sparse')
+    if delta_matrix is not None:
+        delta_rows = np.repeat(np.arange(delta_matrix.shape[0]), np.diff(delta_matrix.indptr))
+        parts.append(delta_rows[np.isin(delta_matrix.indices, cols)])
+    return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+
+def _item_norms_sq(cf_data: Dict[str, Any], now_ts: float) -> Tuple[Any, np.ndarray]:
+    """
+    Bình phương L2 norm từng cột (hotel) của ratings đã decay + merge delta, cache theo CF model đã merge + ngày.
+    Cột không có trong delta buffer giữ norm của model base, chỉ tính lại các cột `delta_hotel_cols`.
+    """
+    global _item_norms_cache
+
+    base_cf = cf_data.get('delta_base_cf', cf_data)
+    columns, base_norms_sq = _base_item_columns(base_cf, now_ts)
+    now_day = int(now_ts // SECONDS_PER_DAY)
+    cache = _item_norms_cache
+    if cache is not None and cache[0] is cf_data and cache[1] == now_day:
+        return columns, cache[2]
+
+    norms_sq = np.zeros(len(cf_data['hotel_ids']))
+    norms_sq[:base_norms_sq.size] = base_norms_sq
+    delta_cols = np.fromiter(cf_data.get('delta_hotel_cols', ()), dtype=np.int64)
+    if delta_cols.size:
+        ratings = decayed_ratings(cf_data, rows=_column_users(cf_data, columns, delta_cols), now_ts=now_ts)
+        norms_sq[delta_cols] = np.asarray(ratings[:, delta_cols].power(2).sum(axis=0)).ravel()
+    _item_norms_cache = (cf_data, now_day, norms_sq)
+    return columns, norms_sq
+
+
+def _similar_items_from_ratings(
+    cf_data: Dict[str, Any],
+    h_idx: int,
+    k: int,
+    allowed: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-K hotels tương tự `h_idx` tính trực tiếp từ ratings (cùng cosine + min_support như lúc train).
+    Chỉ đọc ratings của các users đã tương tác với `h_idx` (cột target) thay vì normalize toàn bộ matrix.
+    """
+    now_ts = timezone.now().timestamp()
+    columns, norms_sq = _item_norms_sq(cf_data, now_ts)
+    if norms_sq[h_idx] <= 0:
+        return _empty_scores()
+
+    # Cột target dot với mọi cột: chỉ các users có rating ở h_idx đóng góp
+    ratings = decayed_ratings(cf_data, rows=_column_users(cf_data, columns, [h_idx]), now_ts=now_ts)
+    target = ratings[:, h_idx].toarray().ravel()
+    dot = ratings.T.dot(target)
+    norms = np.sqrt(norms_sq)
+    sim_scores = np.divide(dot, norms * norms[h_idx], out=np.zeros_like(dot), where=norms > 0)
+
+    # Support = số users chung (cùng có rating ở h_idx và hotel j)
+    support = np.bincount(ratings.indices, minlength=sim_scores.size)
+    sim_scores[support < _item_min_support()] = 0
+    return top_k(sim_scores, k, exclude=_item_exclusion(h_idx, allowed), threshold=0)
+
+
+def item_based_scores(
+    cf_data: Dict[str, Any],
+    hotel_id: int,
+    limit: int = 10,
+    allowed: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Item-Based CF dạng arrays (không tạo dicts) trên CF model đã merge delta buffer.
+
+    Args:
+        allowed: Optional boolean mask trên cột CF - chỉ chọn top-K trong các hotels thỏa filter
+
+    Returns:
+        (vị trí hotels trong cf_data['hotel_ids'], scores) giảm dần; rỗng nếu hotel không có trong model
+    """
+    hotel_ids = cf_data.get('hotel_ids', []) if cf_data else []
+    neighbor_idx = cf_data.get('item_neighbor_idx') if cf_data else None
     
     if hotel_id not in hotel_ids:
-        return []
+        return _empty_scores()
     
     h_idx = hotel_ids.index(hotel_id)
     
-    # Lấy similarity row cho hotel này
-    sim_scores = item_similarity[h_idx].toarray().flatten()
+    item_factors = cf_data.get('als_item_factors')
+    als_index = ann.IVFIndex.from_arrays(cf_data, 'als_ann')
+    if cf_data.get('engine') == CF_ENGINE_ALS and als_index is not None and h_idx < item_factors.shape[0] \
+            and allowed is None:
+        # ALS + catalog lớn: ANN trên item factors đã normalize
+        item_vectors = cf_data['als_item_vectors_normalized']
+        idx, scores = als_index.search(item_vectors, item_vectors[[h_idx]], limit, exclude_ids=[h_idx])
+        valid = (idx[0] >= 0) & (scores[0] > 0)
+        top_indices, top_scores = idx[0][valid], scores[0][valid]
+    elif cf_data.get('engine') == CF_ENGINE_ALS and h_idx < item_factors.shape[0]:
+        # ALS: cosine giữa item factors (có filter -> exact trên hotels thỏa filter thay vì ANN)
+        top_indices, top_scores = top_k(
+            als.similar_item_scores(item_factors, h_idx), limit,
+            exclude=_item_exclusion(h_idx, None if allowed is None else allowed[:item_factors.shape[0]]), threshold=0
+        )
+    elif neighbor_idx is None or h_idx in cf_data.get('delta_hotel_cols', ()):
+        # Hotel có action mới (delta buffer) / artifact cũ -> tính trên ratings đã merge
+        top_indices, top_scores = _similar_items_from_ratings(cf_data, h_idx, limit, allowed)
+    else:
+        # Slice O(K) từ bảng neighbors (bỏ ô trống / similarity = 0)
+        top_indices, top_scores = top_k(
+            cf_data['item_neighbor_scores'][h_idx], limit,
+            exclude=None if allowed is None else ~allowed,
+            candidates=neighbor_idx[h_idx], threshold=0
+        )
+    return top_indices, top_scores
+
+
+def get_item_based_recommendations(
+    hotel_id: int,
+    limit: int = 10,
+    snap: Optional[snapshot.ModelSnapshot] = None
+) -> List[Dict[str, Any]]:
+    """
+    Item-Based Collaborative Filtering (Optimized)
+    """
+    cf_data = _with_delta((snap or snapshot.current()).cf)
+    if not cf_data:
+        return []
     
-    # Sort
-    top_indices = np.argsort(sim_scores)[::-1]
+    hotel_ids = cf_data.get('hotel_ids', [])
+    top_indices, top_scores = item_based_scores(cf_data, hotel_id, limit)
     
-    recommendations = []
-    # Skip self (index 0 implies max score usually)
-    for idx in top_indices:
-        if idx == h_idx:
-            continue
-            
-        score = sim_scores[idx]
-        if score > 0:
-            recommendations.append({
-                'hotel_id': hotel_ids[idx],
-                'cf_score': round(float(score), 4)
-            })
-            if len(recommendations) >= limit:
-                break
-                
-    return recommendations
+    return [{
+        'hotel_id': hotel_ids[idx],
+        'cf_score': round(float(score), 4)
+    } for idx, score in zip(top_indices, top_scores)]
 
 
-def get_cf_recommendations(user_id=None, hotel_id=None, limit=10):
+def get_cf_recommendations(user_id=None, hotel_id=None, limit=10, snap=None):
     """
     Main entry point cho CF recommendations
     """
+    snap = snap or snapshot.current()
     results = []
     
     if user_id:
-        user_recs = get_user_based_recommendations(user_id, limit)
+        user_recs = get_user_based_recommendations(user_id, limit, snap=snap)
         for rec in user_recs:
             rec['cf_type'] = 'user_based'
         results.extend(user_recs)
     
     if hotel_id:
-        item_recs = get_item_based_recommendations(hotel_id, limit)
+        item_recs = get_item_based_recommendations(hotel_id, limit, snap=snap)
         for rec in item_recs:
             rec['cf_type'] = 'item_based'
         results.extend(item_recs)
@@ -380,9 +1364,3 @@ def get_cf_recommendations(user_id=None, hotel_id=None, limit=10):
     
     return results
 
-
-# Auto-train khi import (nếu có dữ liệu)
-try:
-    train_collaborative_model()
-except Exception as e:
-    print(f"⚠️ Chưa thể train CF model: {e}")
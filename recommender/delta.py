@@ -0,0 +1,239 @@
+"""
+CF Delta Buffer Module
+Cập nhật Collaborative Filtering gần real-time từ track_user_action.
+
+- Mỗi action mới (user, hotel, rating, ngày) được ghi vào delta buffer trong RAM
+- Khi score, user-based / item-based CF merge delta buffer vào model base (merge on read):
+  users / hotels mới được thêm vào cuối, cặp (user, hotel) trùng lấy score decay cao nhất
+- Compaction: gộp delta vào CSR Matrix base và publish CF snapshot mới,
+  chạy ở background khi buffer vượt RECOMMENDER_CF_DELTA_MAX_EVENTS
+  hoặc sau mỗi RECOMMENDER_CF_DELTA_COMPACT_SECONDS.
+  Chỉ tính lại phần bị ảnh hưởng (collaborative.fold_in_interactions) - train lại đầy đủ do jobs.py
+
+Lưu ý: buffer nằm trong từng process (mỗi gunicorn worker có buffer riêng).
+Actions vẫn được ghi vào DB -> lần retrain tiếp theo tất cả workers đều thấy.
+"""
+import time
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from django.conf import settings
+from django.utils import timezone
+
+from . import collaborative, snapshot
+
+_lock = threading.Lock()
+_compact_lock = threading.Lock()
+_buffer = collaborative._InteractionBuffer()
+# Tăng mỗi khi buffer thay đổi -> invalidate overlay đã cache
+_generation = 0
+_last_compact = time.monotonic()
+# (generation, cf base, merged cf) của lần merge gần nhất
+_overlay_cache = None
+
+
+def _max_events() -> int:
+    return getattr(settings, 'RECOMMENDER_CF_DELTA_MAX_EVENTS', 5000)
+
+
+def _compact_interval() -> int:
+    return getattr(settings, 'RECOMMENDER_CF_DELTA_COMPACT_SECONDS', 300)
+
+
+def _today() -> int:
+    return int(timezone.now().timestamp() // collaborative.SECONDS_PER_DAY)
+
+
+def pending_events() -> int:
+    """Số events trong delta buffer chưa được compaction."""
+    return _buffer.size
+
+
+def add_event(user_id: int, hotel_id: int, rating: float, day: Optional[int] = None) -> int:
+    """
+    Ghi 1 action vào delta buffer.
+
+    Args:
+        rating: Base score (chưa decay), cùng thang điểm với build_user_item_matrix
+        day: Ngày tương tác (epoch days), mặc định hôm nay
+
+    Returns:
+        Số events đang chờ compaction
+    """
+    global _generation
+
+    day = _today() if day is None else day
+    with _lock:
+        _buffer.extend(
+            np.array([user_id], dtype=np.int64),
+            np.array([hotel_id], dtype=np.int64),
+            np.array([rating], dtype=np.float64),
+            np.array([day], dtype=np.int32),
+        )
+        _generation += 1
+        return _buffer.size
+
+
+def _take(n: Optional[int] = None):
+    """Copy n events đầu tiên (mặc định tất cả) của buffer."""
+    with _lock:
+        n = _buffer.size if n is None else min(n, _buffer.size)
+        return n, tuple(getattr(_buffer, name)[:n].copy() for name in _buffer.COLUMNS)
+
+
+def _drop(n: int) -> None:
+    """Bỏ n events đầu tiên (đã được compaction), giữ các events đến sau."""
+    global _buffer, _generation
+
+    with _lock:
+        remaining = collaborative._InteractionBuffer(capacity=max(_buffer.size - n, 1024))
+        remaining.extend(*(getattr(_buffer, name)[n:_buffer.size] for name in _buffer.COLUMNS))
+        _buffer = remaining
+        _generation += 1
+
+
+def clear() -> None:
+    _drop(_buffer.size)
+
+
+# --- MERGE ON READ ---
+
+def _lookup(sorted_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Vị trí của `ids` trong `sorted_ids` (-1 nếu không có)."""
+    if sorted_ids.size == 0:
+        return np.full(ids.shape, -1, dtype=np.int64)
+    pos = np.searchsorted(sorted_ids, ids)
+    pos_clipped = np.minimum(pos, sorted_ids.size - 1)
+    return np.where(sorted_ids[pos_clipped] == ids, pos_clipped, -1)
+
+
+def _pad_csr(matrix: Optional[csr_matrix], shape) -> Optional[csr_matrix]:
+    """Mở rộng CSR Matrix thêm hàng / cột rỗng (không copy data / indices)."""
+    if matrix is None:
+        return None
+    extra_rows = shape[0] - matrix.shape[0]
+    indptr = np.concatenate([matrix.indptr, np.full(extra_rows, matrix.indptr[-1], dtype=matrix.indptr.dtype)])
+    return csr_matrix((matrix.data, matrix.indices, indptr), shape=shape)
+
+
+def _build_overlay(cf_data, user_id, hotel_id, rating, day) -> Dict[str, Any]:
+    """
+    CF model đã merge delta: ids mới nối vào cuối user_ids / hotel_ids,
+    delta lưu thành CSR riêng (delta_matrix_sparse) cùng shape để decayed_ratings lấy max.
+    """
+    base_user_ids = np.asarray(cf_data.get('user_ids', []), dtype=np.int64)
+    base_hotel_ids = np.asarray(cf_data.get('hotel_ids', []), dtype=np.int64)
+
+    new_user_ids = np.setdiff1d(user_id, base_user_ids)
+    new_hotel_ids = np.setdiff1d(hotel_id, base_hotel_ids)
+    shape = (base_user_ids.size + new_user_ids.size, base_hotel_ids.size + new_hotel_ids.size)
+
+    rows = _lookup(base_user_ids, user_id)
+    rows = np.where(rows >= 0, rows, base_user_ids.size + _lookup(new_user_ids, user_id))
+    cols = _lookup(base_hotel_ids, hotel_id)
+    cols = np.where(cols >= 0, cols, base_hotel_ids.size + _lookup(new_hotel_ids, hotel_id))
+
+    delta_matrix, delta_days = collaborative._pairs_to_csr(rows, cols, shape, rating, day)
+
+    base_matrix = cf_data.get('user_item_matrix_sparse')
+    if base_matrix is None:
+        # Chưa có CF model base (chưa đủ dữ liệu để train) -> model chỉ gồm delta
+        base_matrix, base_days = csr_matrix(shape), csr_matrix(shape, dtype=np.int32)
+    else:
+        base_matrix, base_days = _pad_csr(base_matrix, shape), _pad_csr(cf_data.get('interaction_day_sparse'), shape)
+
+    merged = dict(cf_data)
+    merged.update({
+        'user_ids': list(cf_data.get('user_ids', [])) + new_user_ids.tolist(),
+        'hotel_ids': list(cf_data.get('hotel_ids', [])) + new_hotel_ids.tolist(),
+        'user_item_matrix_sparse': base_matrix,
+        'interaction_day_sparse': base_days,
+        # Users mới có vector rỗng -> chưa là neighbor của ai cho tới khi compaction
+        'user_vectors_normalized': _pad_csr(cf_data.get('user_vectors_normalized'), shape),
+        'delta_matrix_sparse': delta_matrix,
+        'delta_day_sparse': delta_days,
+        'delta_user_rows': frozenset(rows.tolist()),
+        'delta_hotel_cols': frozenset(cols.tolist()),
+        # CF model base (chưa merge) -> cache theo từng snapshot base (vd: norms cột của Item-Based CF)
+        'delta_base_cf': cf_data,
+    })
+    return merged
+
+
+def merged_cf(cf_data) -> Dict[str, Any]:
+    """
+    CF model của snapshot `cf_data` đã merge delta buffer.
+    Trả về nguyên `cf_data` nếu buffer rỗng; kết quả được cache tới khi buffer / snapshot đổi.
+    """
+    global _overlay_cache
+
+    if _buffer.size == 0:
+        return cf_data
+
+    cache = _overlay_cache
+    if cache is not None and cache[0] == _generation and cache[1] is cf_data:
+        return cache[2]
+
+    with _lock:
+        generation = _generation
+        events = _buffer.max_by_pair(_today()) if _buffer.size else None
+    if events is None:
+        return cf_data
+
+    merged = _build_overlay(cf_data, *events)
+    _overlay_cache = (generation, cf_data, merged)
+    return merged
+
+
+# --- COMPACTION ---
+
+def compact() -> bool:
+    """
+    Gộp delta buffer vào CSR Matrix base, tính lại similarities / factors của users và hotels
+    có events mới rồi publish CF snapshot mới.
+    Không publish nếu snapshot đã bị thay trong lúc compaction (vd: reload artifact mới) -
+    events được giữ lại để merge vào snapshot mới.
+
+    Returns:
+        True nếu đã publish model mới
+    """
+    global _last_compact
+
+    if not _compact_lock.acquire(blocking=False):
+        return False
+    try:
+        _last_compact = time.monotonic()
+        snap = snapshot.current()
+        n, (user_id, hotel_id, rating, day) = _take()
+        if n == 0:
+            return False
+
+        events = collaborative._InteractionBuffer(capacity=n)
+        events.extend(user_id, hotel_id, rating, day)
+        now_day = _today()
+        cf_model = collaborative.fold_in_interactions(snap.cf, *events.max_by_pair(now_day), now_day=now_day)
+        if snapshot.publish(cf=cf_model, expected=snap) is None:
+            print("⚠️ Snapshot đã thay đổi trong lúc compaction -> giữ delta buffer")
+            return False
+
+        _drop(n)
+        print(f"✅ Đã compaction {n} CF events vào model base")
+        return True
+    except Exception as e:
+        print(f"⚠️ Lỗi compaction delta buffer: {e}")
+        return False
+    finally:
+        _compact_lock.release()
+
+
+def maybe_compact() -> bool:
+    """Chạy compaction ở background thread nếu buffer quá lớn hoặc đã đến lịch."""
+    size = _buffer.size
+    if size == 0 or _compact_lock.locked():
+        return False
+    if size < _max_events() and time.monotonic() - _last_compact < _compact_interval():
+        return False
+    threading.Thread(target=compact, name='cf-delta-compact', daemon=True).start()
+    return True
@@ -0,0 +1,186 @@
+"""
+Diversity Module
+Đa dạng hóa (re-rank) danh sách candidates trong RAM, không query DB.
+
+- Mode 'cap' (mặc định): greedy giới hạn số hotels cùng location / cùng type,
+  trên int codes của cột location_name / type trong hotel catalog (catalog.py)
+  * RECOMMENDER_DIVERSITY_REGION_DEPTH: giới hạn theo vùng (location tổ tiên ở độ sâu đó trong cây Locations,
+    region codes của LocationIndex - locations.py) thay vì theo tên location
+- Mode 'mmr': Maximal Marginal Relevance trên content embeddings
+    MMR(i) = λ * relevance(i) - (1 - λ) * max_{j đã chọn} cosine(i, j)
+  λ = RECOMMENDER_MMR_LAMBDA (1 = chỉ theo relevance, 0 = chỉ theo độ khác biệt)
+  * Embeddings = TF-IDF vectors của Content-Based model giảm xuống EMBEDDING_DIM chiều
+    (TruncatedSVD / LSA, tính lúc train) -> dense float32, cosine = dot product
+  * Mỗi bước chọn chỉ cần cosine với hotel vừa chọn: 1 phép nhân (candidates x d) . (d,)
+- DiversityFeatures lấy codes / vectors 1 lần cho cả batch, mỗi hàng candidates chỉ cắt theo vị trí
+"""
+from typing import Any, Optional
+
+import numpy as np
+from django.conf import settings
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+MODE_CAP = 'cap'
+MODE_MMR = 'mmr'
+MODES = (MODE_CAP, MODE_MMR)
+
+# Giá trị mặc định khi hotel không có trong catalog (giống meta mặc định trước đây)
+DEFAULT_LOCATION = 'Unknown'
+DEFAULT_TYPE = 'HOTEL'
+
+# Số chiều của content embeddings (MMR)
+EMBEDDING_DIM = 64
+
+
+def get_mode() -> str:
+    mode = getattr(settings, 'RECOMMENDER_DIVERSITY_MODE', MODE_CAP)
+    return mode if mode in MODES else MODE_CAP
+
+
+def get_mmr_lambda() -> float:
+    return getattr(settings, 'RECOMMENDER_MMR_LAMBDA', 0.7)
+
+
+def get_region_depth() -> Optional[int]:
+    return getattr(settings, 'RECOMMENDER_DIVERSITY_REGION_DEPTH', None)
+
+
+def hotel_codes(hotel_ids, cat=None, region_depth=None):
+    """
+    (location codes, type codes) của các hotels từ hotel catalog.
+    Hotel không có trong catalog -> code của DEFAULT_LOCATION / DEFAULT_TYPE.
+
+    Args:
+        region_depth: Location code = id vùng ở độ sâu này trong cây Locations
+            (mặc định RECOMMENDER_DIVERSITY_REGION_DEPTH; hotel không có vùng -> -1)
+    """
+    from . import catalog
+
+    cat = cat if cat is not None else catalog.get_catalog()
+    region_depth = get_region_depth() if region_depth is None else region_depth
+    pos = cat.positions(hotel_ids)
+    found = pos >= 0
+    result = []
+    for column, default in (('location_name', DEFAULT_LOCATION), ('type', DEFAULT_TYPE)):
+        if column == 'location_name' and region_depth is not None:
+            codes, default_code = cat.location_index().region_codes(region_depth), -1
+        else:
+            codes, mapping = cat.codes(column)
+            default_code = mapping.get(default, -1)
+        values = np.full(pos.size, default_code, dtype=np.int64)
+        values[found] = codes[pos[found]]
+        result.append(values)
+    return tuple(result)
+
+
+def build_embeddings(tfidf_matrix, dim: int = EMBEDDING_DIM) -> Optional[np.ndarray]:
+    """
+    Content embeddings (float32, L2-normalize) từ TF-IDF matrix - gọi lúc train Content-Based model.
+    None nếu vocabulary quá nhỏ để giảm chiều.
+    """
+    n_components = min(dim, tfidf_matrix.shape[1] - 1, tfidf_matrix.shape[0])
+    if n_components < 1 or tfidf_matrix.shape[0] < 2:
+        return None
+    embeddings = TruncatedSVD(n_components=n_components, random_state=42).fit_transform(tfidf_matrix)
+    return normalize(embeddings, norm='l2', axis=1).astype(np.float32)
+
+
+def content_vectors(hotel_ids, snap=None, index=None) -> Optional[np.ndarray]:
+    """
+    Content embeddings của các hotels - vector 0 nếu hotel không có trong Content-Based model.
+    None nếu model chưa có embeddings (artifact cũ).
+
+    Args:
+        index: HotelIndex caller đang dùng (mặc định: index của snapshot)
+    """
+    from . import hotel_index, snapshot
+
+    snap = snap or snapshot.current()
+    embeddings = snap.content.get('content_embeddings') if snap.content else None
+    if embeddings is None:
+        return None
+
+    index = index if index is not None else hotel_index.get_index(snap.content, snap.cf)
+    pos = index.positions(hotel_ids)
+    rows = np.where(pos >= 0, index.content_rows[np.maximum(pos, 0)], -1) if len(index) else np.full(pos.shape, -1)
+    vectors = np.asarray(embeddings)[np.maximum(rows, 0)]
+    vectors[rows < 0] = 0
+    return vectors
+
+
+def cap_select(location_codes, type_codes, limit, max_per_location=3, max_per_type=4):
+    """Greedy theo thứ tự: bỏ hotel khi location / type đã đủ số lượng. Trả về vị trí được giữ."""
+    location_count, type_count, selected = {}, {}, []
+    for i, (loc, hotel_type) in enumerate(zip(location_codes.tolist(), type_codes.tolist())):
+        if location_count.get(loc, 0) >= max_per_location or type_count.get(hotel_type, 0) >= max_per_type:
+            continue
+        selected.append(i)
+        location_count[loc] = location_count.get(loc, 0) + 1
+        type_count[hotel_type] = type_count.get(hotel_type, 0) + 1
+        if len(selected) >= limit:
+            break
+    return np.asarray(selected, dtype=np.int64)
+
+
+def mmr_select(vectors, relevance, limit, mmr_lambda=None):
+    """
+    Maximal Marginal Relevance: mỗi bước chọn candidate có MMR cao nhất (cùng MMR -> vị trí nhỏ hơn).
+
+    Args:
+        vectors: Vectors đã L2-normalize (dense, candidates x d)
+        relevance: Score của candidates (vd: hybrid_score)
+
+    Returns:
+        Vị trí được chọn, theo thứ tự chọn
+    """
+    mmr_lambda = get_mmr_lambda() if mmr_lambda is None else mmr_lambda
+    relevance = np.asarray(relevance, dtype=np.float64)
+    n = relevance.size
+    k = min(int(limit), n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    weighted = mmr_lambda * relevance
+    max_similarity = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    selected = np.empty(k, dtype=np.int64)
+    for step in range(k):
+        score = np.where(available, weighted - (1 - mmr_lambda) * max_similarity, -np.inf)
+        i = int(np.argmax(score))
+        selected[step] = i
+        available[i] = False
+        # Chỉ cần cosine của các candidates với hotel vừa chọn
+        np.maximum(max_similarity, vectors @ vectors[i], out=max_similarity)
+    return selected
+
+
+class DiversityFeatures:
+    """
+    Features diversity của 1 danh sách hotels (codes location/type hoặc content embeddings),
+    lấy 1 lần rồi dùng cho nhiều hàng candidates (vd: mọi hotel gốc của 1 batch smart recommendations).
+    """
+
+    def __init__(self, hotel_ids, mode: Optional[str] = None, snap: Any = None, index: Any = None):
+        self.mode = mode or get_mode()
+        self.vectors = content_vectors(hotel_ids, snap, index) if self.mode == MODE_MMR else None
+        if self.vectors is None:
+            # Artifact cũ chưa có content embeddings -> giới hạn theo location / type
+            self.mode = MODE_CAP
+            self.location, self.type = hotel_codes(hotel_ids)
+
+    def select(self, positions, relevance, limit, max_per_location=3, max_per_type=4, mmr_lambda=None) -> np.ndarray:
+        """
+        Args:
+            positions: Vị trí candidates (trong danh sách hotels lúc khởi tạo), đã sort theo relevance giảm dần
+            relevance: Score của từng candidate
+
+        Returns:
+            Các phần tử của `positions` được giữ lại, theo thứ tự kết quả
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if self.mode == MODE_MMR:
+            selected = mmr_select(self.vectors[positions], relevance, limit, mmr_lambda)
+        else:
+            selected = cap_select(self.location[positions], self.type[positions], limit, max_per_location, max_per_type)
+        return positions[selected]
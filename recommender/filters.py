@@ -0,0 +1,148 @@
+"""
+Filters Module
+Lọc recommendations theo giá / hạng sao / loại hotel / location trong RAM, trước bước chọn top-K.
+
+- Query params: max_price (so với giá phòng thấp nhất - Rooms.price), min_star, type
+  (1 hoặc nhiều loại, cách nhau bằng dấu phẩy), location (location_id, gồm cả location con trong cây Locations
+  - posting list của vùng trong LocationIndex, xem locations.py)
+- Filter = boolean mask trên các cột của hotel catalog (catalog.py), căn theo index hotel chung (hotel_index.py)
+  -> mỗi nguồn candidates (content neighbors, Item-Based / User-Based CF, popular) chỉ chọn top-K
+  trong các hotels thỏa filter, không lọc lại kết quả sau cùng
+- Content-Based: bảng neighbors chỉ giữ RECOMMENDER_CONTENT_TOP_K hotels mỗi hàng -> sau khi lọc còn ít hơn
+  `limit` thì tính exact cosine trên TF-IDF matrix (1 phép nhân Sparse Matrix x vector) cho các hotels thỏa filter
+- Hotel không có trong catalog / NULL ở cột đang lọc -> không thỏa filter
+"""
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Mapping, Optional, Tuple
+
+import numpy as np
+
+from .ranking import top_k
+
+# Query params được hỗ trợ
+PARAMS = ('max_price', 'min_star', 'type', 'location')
+
+
+@dataclass(frozen=True)
+class HotelFilter:
+    """Điều kiện lọc hotels (None / rỗng = không lọc theo điều kiện đó)."""
+
+    max_price: Optional[float] = None
+    min_star: Optional[int] = None
+    types: Tuple[str, ...] = ()
+    location_id: Optional[int] = None
+
+    def __bool__(self) -> bool:
+        return self.max_price is not None or self.min_star is not None or bool(self.types) \
+            or self.location_id is not None
+
+    def cache_key(self) -> str:
+        """Chuỗi định danh filter cho response cache."""
+        return f'{self.max_price!r}:{self.min_star!r}:{",".join(self.types)}:{self.location_id!r}'
+
+    def catalog_mask(self, cat) -> np.ndarray:
+        """Boolean mask cùng thứ tự với `cat.ids`."""
+        columns = cat.columns
+        mask = np.ones(len(cat), dtype=bool)
+        if self.max_price is not None:
+            mask &= columns['min_room_price'] <= self.max_price  # NaN (không có phòng có giá) -> False
+        if self.min_star is not None:
+            mask &= columns['star_rating'] >= self.min_star
+        if self.types:
+            codes, mapping = cat.codes('type')
+            mask &= np.isin(codes, [mapping[value] for value in self.types if value in mapping])
+        if self.location_id is not None:
+            in_region = np.zeros(len(cat), dtype=bool)
+            in_region[cat.location_index().hotels_in(self.location_id)] = True
+            mask &= in_region
+        return mask
+
+    def region_hotel_ids(self, cat=None) -> Optional[np.ndarray]:
+        """Hotel ids thuộc vùng `location_id` (posting list), None nếu filter không lọc theo location."""
+        from . import catalog
+
+        if self.location_id is None:
+            return None
+        cat = cat if cat is not None else catalog.get_catalog()
+        return cat.ids[cat.location_index().hotels_in(self.location_id)]
+
+    def _mask_at(self, cat, pos: np.ndarray) -> np.ndarray:
+        if len(cat) == 0:
+            return np.zeros(pos.shape, dtype=bool)
+        return (pos >= 0) & self.catalog_mask(cat)[np.maximum(pos, 0)]
+
+    def allows(self, hotel_ids, cat=None) -> np.ndarray:
+        """Boolean mask: từng hotel trong `hotel_ids` có thỏa filter không."""
+        from . import catalog
+
+        cat = cat if cat is not None else catalog.get_catalog()
+        return self._mask_at(cat, cat.positions(hotel_ids))
+
+    def index_mask(self, index, cat=None) -> np.ndarray:
+        """Boolean mask trên index hotel chung (HotelIndex)."""
+        from . import catalog
+
+        cat = cat if cat is not None else catalog.get_catalog()
+        return self._mask_at(cat, index.catalog_positions(cat))
+
+
+def _parse(params: Mapping[str, Any], name: str, cast: Callable[[str], Any]) -> Any:
+    raw = params.get(name)
+    if raw is None or str(raw).strip() == '':
+        return None
+    try:
+        value = cast(str(raw).strip())
+    except ValueError:
+        raise ValueError(f"'{name}' không hợp lệ: {raw}")
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError(f"'{name}' không hợp lệ: {raw}")
+    return value
+
+
+def from_query_params(params: Mapping[str, Any]) -> Optional[HotelFilter]:
+    """
+    Đọc filter từ query params của request.
+
+    Returns:
+        HotelFilter hoặc None nếu request không có filter nào
+
+    Raises:
+        ValueError: giá trị filter không hợp lệ (endpoint trả về 400)
+    """
+    raw_types = params.get('type') or ''
+    hotel_filter = HotelFilter(
+        max_price=_parse(params, 'max_price', float),
+        min_star=_parse(params, 'min_star', int),
+        types=tuple(dict.fromkeys(t.strip().upper() for t in str(raw_types).split(',') if t.strip())),
+        location_id=_parse(params, 'location', int),
+    )
+    return hotel_filter if hotel_filter else None
+
+
+def content_top_k(content: Mapping[str, Any], row: int, k: int, allowed_rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-K hotels tương tự hàng `row` của Content-Based model, chỉ trong các hàng `allowed_rows`.
+    Bảng neighbors không đủ K hotels thỏa filter -> exact cosine trên TF-IDF matrix
+    (artifact cũ chưa lưu TF-IDF matrix -> chỉ trả về các neighbors thỏa filter).
+
+    Args:
+        allowed_rows: Boolean mask trên các hàng df của Content-Based model
+
+    Returns:
+        (hàng df, similarity float64) giảm dần, không gồm chính `row`
+    """
+    neighbor_idx = np.asarray(content['neighbor_idx'][row])
+    valid = neighbor_idx >= 0
+    valid[valid] = allowed_rows[neighbor_idx[valid]]
+    scores = np.where(valid, content['neighbor_scores'][row], -np.inf)
+    top_rows, top_scores = top_k(scores, k, candidates=neighbor_idx)
+
+    n_allowed = int(np.count_nonzero(allowed_rows)) - int(allowed_rows[row])
+    tfidf_matrix = content.get('tfidf_matrix')
+    if top_rows.size < min(k, n_allowed) and tfidf_matrix is not None:
+        similarity = tfidf_matrix.dot(tfidf_matrix[row].T).toarray().ravel()
+        exclude = ~allowed_rows
+        exclude[row] = True
+        top_rows, top_scores = top_k(similarity, k, exclude=exclude)
+    return top_rows, top_scores.astype(np.float64)
@@ -0,0 +1,87 @@
+"""
+Hotel Index Module
+Không gian index hotel chung (canonical) cho tất cả models.
+
+- Content-Based đánh index hotels theo hàng của df (global_data['indices']),
+  CF theo vị trí trong cf['hotel_ids'] -> HotelIndex = hợp hotel ids của 2 models
+  (int64, tăng dần) + bảng map hàng content / cột CF sang vị trí canonical
+- Hybrid: content scores, CF scores, normalize, weighting, loại hotel gốc đều là
+  NumPy vectors trên index chung, chỉ top-K cuối cùng mới chuyển thành dicts
+- Vị trí canonical tăng theo hotel_id -> cùng score thì xếp theo vị trí = xếp theo hotel_id
+- Build 1 lần cho mỗi cặp (content model, CF model đã merge delta buffer), cache theo reference
+  (giữ vài cặp gần nhất: content endpoint dùng index không có CF, hybrid dùng CF đã merge)
+"""
+from typing import Any, Mapping, Optional
+
+import numpy as np
+
+
+class HotelIndex:
+    """
+    Index hotels chung, bất biến.
+
+    Attributes:
+        ids: Hotel ids (int64, tăng dần) - vị trí trong ids là index canonical
+        content_pos: Vị trí canonical của từng hàng content df
+        cf_pos: Vị trí canonical của từng cột CF (cf['hotel_ids'])
+        content_rows: Hàng content df của từng vị trí canonical (-1 nếu hotel không có trong content model)
+    """
+
+    def __init__(self, content_ids, cf_ids):
+        content_ids = np.asarray(content_ids, dtype=np.int64)
+        cf_ids = np.asarray(cf_ids, dtype=np.int64)
+        self.ids = np.union1d(content_ids, cf_ids)
+        self.content_pos = np.searchsorted(self.ids, content_ids)
+        self.cf_pos = np.searchsorted(self.ids, cf_ids)
+        self.content_rows = np.full(self.ids.size, -1, dtype=np.int64)
+        self.content_rows[self.content_pos[::-1]] = np.arange(content_ids.size)[::-1]  # id trùng -> hàng đầu tiên
+        for array in (self.ids, self.content_pos, self.cf_pos, self.content_rows):
+            array.flags.writeable = False
+        # (hotel catalog, vị trí trong catalog của từng vị trí canonical) của lần gọi gần nhất
+        self._catalog = None
+
+    def __len__(self) -> int:
+        return self.ids.size
+
+    def positions(self, hotel_ids) -> np.ndarray:
+        """Vị trí canonical của `hotel_ids` (-1 nếu không có trong model nào)."""
+        hotel_ids = np.asarray(list(hotel_ids) if not isinstance(hotel_ids, np.ndarray) else hotel_ids, dtype=np.int64)
+        if self.ids.size == 0:
+            return np.full(hotel_ids.shape, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.ids, hotel_ids), self.ids.size - 1)
+        return np.where(self.ids[pos] == hotel_ids, pos, -1)
+
+    def catalog_positions(self, cat) -> np.ndarray:
+        """Vị trí trong hotel catalog `cat` của từng vị trí canonical (-1 nếu không có), cache theo catalog."""
+        cached = self._catalog
+        if cached is None or cached[0] is not cat:
+            pos = cat.positions(self.ids)
+            pos.flags.writeable = False
+            cached = self._catalog = (cat, pos)
+        return cached[1]
+
+
+# Số cặp (content model, CF model) giữ index
+_CACHE_SIZE = 4
+
+# (content model, CF model, index) của các lần build gần nhất, mới nhất cuối
+_cache = []
+
+
+def get_index(content: Optional[Mapping[str, Any]], cf: Optional[Mapping[str, Any]]) -> HotelIndex:
+    """
+    Index chung của Content-Based model `content` và CF model `cf`
+    (truyền CF model đã merge delta buffer nếu cần cả hotels mới của buffer).
+    """
+    global _cache
+
+    for cached_content, cached_cf, index in _cache:
+        if cached_content is content and cached_cf is cf:
+            return index
+
+    df = content.get('df') if content else None
+    content_ids = df['id'].to_numpy() if df is not None else []
+    cf_ids = cf.get('hotel_ids', []) if cf else []
+    index = HotelIndex(content_ids, cf_ids)
+    _cache = [*_cache, (content, cf, index)][-_CACHE_SIZE:]
+    return index
@@ -1,8 +1,110 @@
 """
 Hybrid Recommendation Module - Phase 2
 Kết hợp Content-Based (Phase 1) và Collaborative Filtering (Phase 2)
+Scores của các models được gộp dạng NumPy vectors trên index hotel chung (hotel_index.py)
 """
 import math
+import numpy as np
+from .ranking import top_k
+from . import diversity, filters, hotel_index, snapshot
+
+_NO_CANDIDATES = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+
+
+def _cf_data(snap):
+    """CF model của snapshot đã merge delta buffer (snapshot chưa có CF model -> giữ nguyên)."""
+    from . import delta
+    return delta.merged_cf(snap.cf) if snap.cf else snap.cf
+
+
+def _content_candidates(snap, index, hotel_id, n_content, allowed_rows=None):
+    """
+    Content-Based candidates của `hotel_id` từ bảng neighbors (đã bỏ chính nó).
+    
+    Args:
+        allowed_rows: Optional boolean mask (filter) trên các hàng df của Content-Based model
+    
+    Returns:
+        (vị trí trong index chung, similarity)
+    """
+    if snap.content:
+        indices = snap.content.get('indices', {})
+        neighbor_idx = snap.content.get('neighbor_idx')
+        
+        if hotel_id in indices.index and neighbor_idx is not None:
+            idx = indices[hotel_id]
+            if allowed_rows is not None:
+                top_indices, top_scores = filters.content_top_k(snap.content, idx, n_content, allowed_rows)
+            else:
+                top_indices, top_scores = top_k(snap.content['neighbor_scores'][idx], n_content, candidates=neighbor_idx[idx])
+            return index.content_pos[top_indices], top_scores.astype(np.float64)
+    
+    return _NO_CANDIDATES
+
+
+def _cf_candidates(index, cols, scores):
+    """CF scores theo cột CF -> (vị trí trong index chung, cf_score làm tròn 4 chữ số như API CF)."""
+    return index.cf_pos[cols], _round4(scores)
+
+
+def _rec_candidates(index, recs, allowed=None):
+    """List CF recommendations (dicts) -> (vị trí trong index chung, cf_score), chỉ giữ hotels thỏa `allowed`."""
+    if not recs:
+        return _NO_CANDIDATES
+    pos = index.positions([rec['hotel_id'] for rec in recs])
+    scores = np.array([rec['cf_score'] for rec in recs], dtype=np.float64)
+    keep = pos >= 0
+    if allowed is not None:
+        keep[keep] = allowed[pos[keep]]
+    return pos[keep], scores[keep]
+
+
+def _rank_hybrid(index, hotel_id, content, collab, content_weight, collab_weight, limit):
+    """
+    Kết hợp Content-Based + CF (item-based, user-based) cho 1 hotel gốc,
+    tính trên vectors của index chung.
+    
+    Args:
+        content: (vị trí, score) Content-Based
+        collab: List (vị trí, score) của các nguồn CF
+    
+    Returns:
+        Top limit*2 kết quả (chưa áp dụng diversity), sort giảm dần theo hybrid_score
+    """
+    n_hotels = len(index)
+    content_score = np.zeros(n_hotels)
+    content_score[content[0]] = content[1]
+    has_content = np.zeros(n_hotels, dtype=bool)
+    has_content[content[0]] = True
+    
+    # Merge CF: lấy max score nếu hotel có trong cả item-based và user-based
+    collab_score = np.full(n_hotels, -np.inf)
+    for pos, scores in collab:
+        np.maximum.at(collab_score, pos, scores)
+    has_collab = collab_score > -np.inf
+    collab_score[~has_collab] = 0
+    
+    # Normalize scores (0-1)
+    _normalize(content_score, has_content)
+    _normalize(collab_score, has_collab)
+    
+    # Kết hợp với weighted average trên hợp 2 nguồn (thiếu ở 1 nguồn -> score 0), loại bỏ hotel gốc
+    candidates = np.flatnonzero(has_content | has_collab)
+    candidates = candidates[index.ids[candidates] != hotel_id]
+    content_score, collab_score = content_score[candidates], collab_score[candidates]
+    hybrid_score = _round4(content_weight * content_score + collab_weight * collab_score)
+    
+    # Sort và lấy nhiều hơn limit để diversity filter (cùng score -> hotel_id nhỏ hơn trước)
+    top = np.lexsort((candidates, -hybrid_score))[:limit * 2]
+    return [{
+        'hotel_id': hid,
+        'hybrid_score': hybrid,
+        'content_score': content_value,
+        'collab_score': collab_value,
+    } for hid, hybrid, content_value, collab_value in zip(
+        index.ids[candidates[top]].tolist(), hybrid_score[top].tolist(),
+        _round4(content_score[top]).tolist(), _round4(collab_score[top]).tolist()
+    )]
 
 
 def get_hybrid_recommendations(
@@ -10,12 +112,13 @@ def get_hybrid_recommendations(
     user_id=None,
     content_weight=0.5,
     collab_weight=0.5,
-    limit=10
+    limit=10,
+    snap=None
 ):
     """
     Hybrid Recommendations kết hợp:
-    - Content-Based: Từ global_data (views.py)
-    - Collaborative Filtering: Từ cf_global_data (collaborative.py)
+    - Content-Based: Từ snapshot.content (views.py)
+    - Collaborative Filtering: Từ snapshot.cf (collaborative.py)
     
     Args:
         hotel_id: Hotel ID để tìm recommendations tương tự
@@ -23,149 +126,272 @@ def get_hybrid_recommendations(
         content_weight: Trọng số Content-Based (α)
         collab_weight: Trọng số Collaborative Filtering (β)
         limit: Số lượng kết quả
+        snap: Snapshot models đã pin cho request (mặc định: snapshot hiện tại)
     
     Returns:
         List of hybrid recommendations với hybrid_score
     """
-    from . import views
     from . import collaborative
     
-    # 1. Lấy Content-Based recommendations (Phase 1)
-    content_recs = {}
+    snap = snap or snapshot.current()
+    cf_data = _cf_data(snap)
+    index = hotel_index.get_index(snap.content, cf_data)
     
-    if views.global_data:
-        indices = views.global_data.get('indices', {})
-        cosine_sim = views.global_data.get('sim')
-        df = views.global_data.get('df')
-        
-        if hotel_id in indices.index and cosine_sim is not None:
-            idx = indices[hotel_id]
-            sim_scores = list(enumerate(cosine_sim[idx]))
-            sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-            
-            # Lấy top recommendations (bỏ chính nó)
-            for i, score in sim_scores[1:limit*2]:  # Lấy nhiều hơn để merge
-                rec_hotel_id = df.iloc[i]['id']
-                content_recs[rec_hotel_id] = float(score)
+    # 1. Lấy Content-Based recommendations (lấy nhiều hơn để merge)
+    content = _content_candidates(snap, index, hotel_id, limit * 2 - 1)
     
     # 2. Lấy Collaborative Filtering recommendations
-    collab_recs = {}
-    
-    if collaborative.cf_global_data:
+    collab = []
+    if cf_data:
         # Item-Based CF từ hotel_id
-        item_recs = collaborative.get_item_based_recommendations(hotel_id, limit*2)
-        for rec in item_recs:
-            collab_recs[rec['hotel_id']] = rec['cf_score']
+        collab.append(_cf_candidates(index, *collaborative.item_based_scores(cf_data, hotel_id, limit*2)))
         
         # User-Based CF nếu có user_id
         if user_id:
-            user_recs = collaborative.get_user_based_recommendations(user_id, limit*2)
-            for rec in user_recs:
-                hid = rec['hotel_id']
-                # Merge: lấy max score nếu đã có
-                if hid not in collab_recs or rec['cf_score'] > collab_recs[hid]:
-                    collab_recs[hid] = rec['cf_score']
-    
-    # 3. Normalize scores (0-1)
-    def normalize_scores(scores_dict):
-        if not scores_dict:
-            return {}
-        max_score = max(scores_dict.values())
-        min_score = min(scores_dict.values())
-        range_score = max_score - min_score if max_score != min_score else 1
-        return {k: (v - min_score) / range_score for k, v in scores_dict.items()}
+            collab.append(_cf_candidates(
+                index, *collaborative.user_based_scores(cf_data, user_id, limit*2, base_cf=snap.cf)
+            ))
     
-    content_recs = normalize_scores(content_recs)
-    collab_recs = normalize_scores(collab_recs)
+    # 3. Normalize + weighted average
+    sorted_results = _rank_hybrid(index, hotel_id, content, collab, content_weight, collab_weight, limit)
     
-    # 4. Kết hợp với weighted average
-    all_hotel_ids = set(content_recs.keys()) | set(collab_recs.keys())
-    all_hotel_ids.discard(hotel_id)  # Loại bỏ hotel gốc
+    # 4. Apply diversity
+    diverse_results = apply_diversity(sorted_results, limit, snap=snap, index=index)
     
-    hybrid_scores = {}
-    for hid in all_hotel_ids:
-        content_score = content_recs.get(hid, 0)
-        collab_score = collab_recs.get(hid, 0)
-        
-        # Weighted combination
-        hybrid_score = (content_weight * content_score) + (collab_weight * collab_score)
-        
-        hybrid_scores[hid] = {
-            'hotel_id': hid,
-            'hybrid_score': round(hybrid_score, 4),
-            'content_score': round(content_score, 4),
-            'collab_score': round(collab_score, 4),
-        }
+    return diverse_results
+
+
+def get_multi_seed_hybrid_batch(
+    seeds_by_user,
+    user_recs_by_user,
+    content_weight=0.5,
+    collab_weight=0.5,
+    limit=10,
+    snap=None,
+    hotel_filter=None
+):
+    """
+    Hybrid Recommendations nhiều hotels gốc (đã xem) cho nhiều users trong 1 lượt - dùng cho smart recommendations.
+    Cùng kết quả với get_hybrid_recommendations cho từng (user, hotel gốc) rồi cộng dồn theo user, nhưng:
+    - Content-Based / Item-Based CF chỉ tính 1 lần cho mỗi hotel gốc của cả batch
+    - User-Based CF nhận sẵn từ collaborative.get_user_based_recommendations_batch (1 lần mỗi user)
+    - Các hàng (user, hotel gốc) được xếp chồng thành 1 danh sách candidates dạng cột
+      (vị trí hotel trong index chung) -> normalize, weighted average, xếp hạng, cộng dồn theo user
+      bằng các phép tính vectorized
+    - Diversity dùng chung 1 lần lấy codes location/type (hoặc content embeddings) cho tất cả kết quả
     
-    # 5. Sort và return top results
-    sorted_results = sorted(
-        hybrid_scores.values(), 
-        key=lambda x: x['hybrid_score'], 
-        reverse=True
-    )[:limit * 2]  # Lấy nhiều hơn để diversity filter
+    Args:
+        seeds_by_user: {user_id: [hotel_id đã xem, ...]} (mới nhất trước)
+        user_recs_by_user: {user_id: User-Based CF recommendations}
+        hotel_filter: Optional filters.HotelFilter - mọi nguồn candidates chỉ chọn top-K trong các hotels thỏa filter
+    
+    Returns:
+        {user_id: {hotel_id: {'hotel_id', 'hybrid_score', 'content_score', 'collab_score', 'source_hotels'}}}
+        theo thứ tự gộp (chưa sort), không gồm hotels đã xem
+    """
+    from . import collaborative
     
-    # 6. Apply diversity
-    diverse_results = apply_diversity(sorted_results, limit)
+    snap = snap or snapshot.current()
+    user_list = list(seeds_by_user)
+    results = {user_id: {} for user_id in user_list}
     
-    return diverse_results
+    seed_ids = list(dict.fromkeys(hid for seeds in seeds_by_user.values() for hid in seeds))
+    if not seed_ids:
+        return results
+    cf_data = _cf_data(snap)
+    index = hotel_index.get_index(snap.content, cf_data)
+    n_hotels = max(len(index), 1)
+    allowed = hotel_filter.index_mask(index) if hotel_filter else None
+    allowed_rows = allowed[index.content_pos] if allowed is not None else None
+    allowed_cols = allowed[index.cf_pos] if allowed is not None else None
+    content_by_seed = {hid: _content_candidates(snap, index, hid, limit * 2 - 1, allowed_rows) for hid in seed_ids}
+    item_by_seed = {
+        hid: _cf_candidates(index, *collaborative.item_based_scores(cf_data, hid, limit*2, allowed_cols))
+        if cf_data else _NO_CANDIDATES
+        for hid in seed_ids
+    }
+    user_by_user = {
+        user_id: _rec_candidates(index, user_recs_by_user.get(user_id, []), allowed) if cf_data else _NO_CANDIDATES
+        for user_id in user_list
+    }
+    
+    # 1. Mỗi hàng = 1 (user, hotel gốc); candidates lưu dạng cột (row, vị trí hotel, score)
+    row_user, row_seed = [], []
+    for u, user_id in enumerate(user_list):
+        for hid in seeds_by_user[user_id]:
+            row_user.append(u)
+            row_seed.append(hid)
+    n_rows = len(row_seed)
+    row_user = np.asarray(row_user, dtype=np.int64)
+    row_seed = np.asarray(row_seed, dtype=np.int64)
+    row_seed_pos = index.positions(row_seed)
+    
+    def stack(parts):
+        parts = list(parts)
+        rows = np.repeat(np.arange(len(parts), dtype=np.int64), [pos.size for pos, _ in parts])
+        return rows, np.concatenate([pos for pos, _ in parts]), np.concatenate([scores for _, scores in parts])
+    
+    content = stack(content_by_seed[hid] for hid in row_seed.tolist())
+    item = stack(item_by_seed[hid] for hid in row_seed.tolist())
+    user = stack(user_by_user[user_list[u]] for u in row_user.tolist())
+    
+    # 2. Collab = max(item-based, user-based) cho mỗi (row, hotel)
+    collab = _dedupe_max(*(np.concatenate(parts) for parts in zip(item, user)))
+    
+    # 3. Normalize (0-1) theo từng hàng, trên tất cả candidates của hàng (kể cả hotel gốc)
+    content_norm = _normalize_rows(content[0], content[2], n_rows)
+    collab_norm = _normalize_rows(collab[0], collab[2], n_rows)
+    
+    # 4. Hợp 2 nguồn theo key (row, hotel), hotel thiếu ở 1 nguồn có score 0, bỏ hotel gốc
+    content_keys = content[0] * n_hotels + content[1]
+    collab_keys = collab[0] * n_hotels + collab[1]
+    keys = np.union1d(content_keys, collab_keys)
+    rows, hotels = keys // n_hotels, keys % n_hotels
+    
+    content_score = np.zeros(keys.size)
+    content_score[np.searchsorted(keys, content_keys)] = content_norm
+    collab_score = np.zeros(keys.size)
+    collab_score[np.searchsorted(keys, collab_keys)] = collab_norm
+    
+    keep = hotels != row_seed_pos[rows]
+    rows, hotels, content_score, collab_score = rows[keep], hotels[keep], content_score[keep], collab_score[keep]
+    hybrid_score = _round4(content_weight * content_score + collab_weight * collab_score)
+    content_score, collab_score = _round4(content_score), _round4(collab_score)
+    
+    # 5. Xếp hạng trong từng hàng (hybrid_score giảm dần, cùng score -> hotel_id tăng dần), giữ limit*2
+    order = np.lexsort((hotels, -hybrid_score, rows))
+    rows, hotels = rows[order], hotels[order]
+    hybrid_score, content_score, collab_score = hybrid_score[order], content_score[order], collab_score[order]
+    counts = np.bincount(rows, minlength=n_rows)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    ranked = (np.arange(rows.size) - starts[rows]) < limit * 2
+    rows, hotels = rows[ranked], hotels[ranked]
+    hybrid_score, content_score, collab_score = hybrid_score[ranked], content_score[ranked], collab_score[ranked]
+    
+    # 6. Diversity cho từng hàng (codes location/type / content embeddings lấy 1 lần cho cả batch)
+    features = diversity.DiversityFeatures(index.ids[hotels], snap=snap, index=index)
+    bounds = np.cumsum(np.bincount(rows, minlength=n_rows))[:-1]
+    selected = np.concatenate([
+        features.select(positions, hybrid_score[positions], limit)
+        for positions in np.split(np.arange(rows.size), bounds)
+    ])
+    rows, hotels = rows[selected], hotels[selected]
+    hybrid_score, content_score, collab_score = hybrid_score[selected], content_score[selected], collab_score[selected]
+    
+    # 7. Cộng dồn theo (user, hotel), bỏ hotels user đã xem; thứ tự gộp = lần xuất hiện đầu tiên
+    users = row_user[rows]
+    user_hotel = users * n_hotels + hotels
+    viewed = (row_user * n_hotels + row_seed_pos)[row_seed_pos >= 0]
+    not_viewed = ~np.isin(user_hotel, viewed)
+    rows, users, hotels, user_hotel = rows[not_viewed], users[not_viewed], hotels[not_viewed], user_hotel[not_viewed]
+    scores = np.stack([hybrid_score[not_viewed], content_score[not_viewed], collab_score[not_viewed]], axis=1)
+    
+    _, first, group = np.unique(user_hotel, return_index=True, return_inverse=True)
+    totals = np.zeros((first.size, 3))
+    np.add.at(totals, group, scores)  # cộng theo thứ tự hàng (giống cộng dồn tuần tự)
+    
+    sources = [[] for _ in range(first.size)]
+    for g, seed in zip(group.tolist(), row_seed[rows].tolist()):
+        sources[g].append(seed)
+    
+    for g in np.argsort(first, kind='stable').tolist():
+        user_id, hid = user_list[users[first[g]]], int(index.ids[hotels[first[g]]])
+        hybrid_total, content_total, collab_total = totals[g].tolist()
+        results[user_id][hid] = {
+            'hotel_id': hid,
+            'hybrid_score': hybrid_total,
+            'content_score': content_total,
+            'collab_score': collab_total,
+            'source_hotels': sources[g]
+        }
+    
+    return results
+
+
+def _dedupe_max(rows, hotels, scores):
+    """Giữ score lớn nhất cho mỗi cặp (row, hotel) trùng nhau."""
+    order = np.lexsort((-scores, hotels, rows))
+    rows, hotels, scores = rows[order], hotels[order], scores[order]
+    first = np.ones(rows.size, dtype=bool)
+    first[1:] = (rows[1:] != rows[:-1]) | (hotels[1:] != hotels[:-1])
+    return rows[first], hotels[first], scores[first]
+
+
+def _normalize_rows(rows, scores, n_rows):
+    """Min-max normalize scores theo từng hàng (giống _normalize của _rank_hybrid)."""
+    if scores.size == 0:
+        return scores
+    row_max = np.full(n_rows, -np.inf)
+    row_min = np.full(n_rows, np.inf)
+    np.maximum.at(row_max, rows, scores)
+    np.minimum.at(row_min, rows, scores)
+    range_score = row_max - row_min
+    range_score[range_score == 0] = 1
+    return (scores - row_min[rows]) / range_score[rows]
+
 
+def _normalize(scores, present):
+    """Min-max normalize (0-1) in-place các scores có mặt (`present`), giữ nguyên phần còn lại."""
+    values = scores[present]
+    if values.size:
+        min_score, max_score = values.min(), values.max()
+        range_score = max_score - min_score if max_score != min_score else 1
+        scores[present] = (values - min_score) / range_score
+
+
+def _round4(scores):
+    """round(x, 4) của Python cho từng phần tử (np.round có thể lệch 1 đơn vị ở chữ số cuối)."""
+    return np.fromiter((round(x, 4) for x in scores.tolist()), dtype=np.float64, count=scores.size)
 
-def apply_diversity(recommendations, limit=10, max_per_location=3, max_per_type=4):
+
+def apply_diversity(
+    recommendations,
+    limit=10,
+    max_per_location=3,
+    max_per_type=4,
+    mode=None,
+    mmr_lambda=None,
+    snap=None,
+    index=None
+):
     """
-    Đa dạng hóa kết quả recommendations:
-    - Giới hạn số hotels cùng location
-    - Mix các loại hotels khác nhau (HOTEL, RESORT, HOMESTAY, VILLA)
+    Đa dạng hóa kết quả recommendations (trong RAM, xem diversity.py):
+    - 'cap': Giới hạn số hotels cùng location, mix các loại hotels khác nhau (HOTEL, RESORT, HOMESTAY, VILLA)
+    - 'mmr': Maximal Marginal Relevance trên content embeddings, relevance = hybrid_score
     
     Args:
-        recommendations: List of recommendation dicts
+        recommendations: List of recommendation dicts (sort giảm dần theo hybrid_score)
         limit: Số kết quả cuối cùng
         max_per_location: Max hotels cùng location
         max_per_type: Max hotels cùng type
+        mode: 'cap' / 'mmr' (mặc định RECOMMENDER_DIVERSITY_MODE)
+        mmr_lambda: λ của MMR (mặc định RECOMMENDER_MMR_LAMBDA)
+        snap, index: Snapshot / HotelIndex của request (content embeddings cho mode 'mmr')
     """
-    from .models import Hotels
-    
     if not recommendations:
         return []
     
-    # Lấy thông tin location và type của các hotels
-    hotel_ids = [rec['hotel_id'] for rec in recommendations]
-    hotels_info = Hotels.objects.filter(id__in=hotel_ids).select_related('location').values(
-        'id', 'location__name', 'type'
+    features = diversity.DiversityFeatures([rec['hotel_id'] for rec in recommendations], mode, snap, index)
+    selected = features.select(
+        np.arange(len(recommendations)), [rec.get('hybrid_score', 0.0) for rec in recommendations],
+        limit, max_per_location, max_per_type, mmr_lambda
     )
-    hotel_meta = {h['id']: {'location': h['location__name'], 'type': h['type']} for h in hotels_info}
-    
-    # Apply diversity limits
-    location_count = {}
-    type_count = {}
-    diverse_results = []
-    
-    for rec in recommendations:
-        hid = rec['hotel_id']
-        meta = hotel_meta.get(hid, {})
-        loc = meta.get('location', 'Unknown')
-        hotel_type = meta.get('type', 'HOTEL')
-        
-        # Check location limit
-        if location_count.get(loc, 0) >= max_per_location:
-            continue
-        
-        # Check type limit
-        if type_count.get(hotel_type, 0) >= max_per_type:
-            continue
-        
-        # Add to results
-        diverse_results.append(rec)
-        location_count[loc] = location_count.get(loc, 0) + 1
-        type_count[hotel_type] = type_count.get(hotel_type, 0) + 1
-        
-        # Stop if we have enough
-        if len(diverse_results) >= limit:
-            break
-    
-    return diverse_results
+    return [recommendations[i] for i in selected.tolist()]
 
 
-def get_personalized_recommendations(user_id, limit=10):
+# Thông tin hotel trả về cùng personalized recommendations: {key: cột hotel catalog}
+PERSONALIZED_FIELDS = {
+    'name': 'name',
+    'address': 'address',
+    'star_rating': 'star_rating',
+    'average_rating': 'average_rating',
+    'location': 'location_name',
+    'thumbnail': 'thumbnail',
+    'min_room_price': 'min_room_price',
+}
+
+
+def get_personalized_recommendations(user_id, limit=10, snap=None):
     """
     Personalized Recommendations cho user cụ thể
     Dựa hoàn toàn vào Collaborative Filtering
@@ -173,57 +399,27 @@ def get_personalized_recommendations(user_id, limit=10):
     Args:
         user_id: User ID
         limit: Số lượng kết quả
+        snap: Snapshot models đã pin cho request (mặc định: snapshot hiện tại)
     
     Returns:
         List of personalized recommendations
     """
-    from . import collaborative
-    from .models import Hotels, HotelImages, Rooms
-    from django.db.models import Min
+    from . import catalog, collaborative
     
     # Lấy User-Based CF recommendations
-    recs = collaborative.get_user_based_recommendations(user_id, limit)
+    recs = collaborative.get_user_based_recommendations(user_id, limit, snap=snap)
     
     if not recs:
         return []
     
-    # Enrich với hotel info
-    hotel_ids = [rec['hotel_id'] for rec in recs]
-    hotels = Hotels.objects.filter(id__in=hotel_ids).select_related('location').values(
-        'id', 'name', 'address', 'star_rating', 'average_rating', 'location__name'
-    )
-    hotels_dict = {h['id']: h for h in hotels}
-    
-    # Lấy thumbnail cho mỗi hotel (caption='Thumbnail')
-    hotel_thumbnails = {}
-    images = HotelImages.objects.filter(
-        hotel_id__in=hotel_ids, 
-        caption='Thumbnail'
-    ).values('hotel_id', 'image_url')
-    for img in images:
-        hotel_thumbnails[img['hotel_id']] = img['image_url']
-    
-    # Lấy giá phòng thấp nhất cho mỗi hotel
-    min_prices = Rooms.objects.filter(
-        hotel_id__in=hotel_ids,
-        price__isnull=False
-    ).values('hotel_id').annotate(
-        min_price=Min('price')
-    )
-    hotel_min_prices = {item['hotel_id']: item['min_price'] for item in min_prices}
+    # Enrich với hotel info, thumbnail, giá phòng thấp nhất (hotel catalog, không query DB)
+    hotel_infos = catalog.get_catalog().records([rec['hotel_id'] for rec in recs], PERSONALIZED_FIELDS)
     
     results = []
-    for rec in recs:
-        hotel_info = hotels_dict.get(rec['hotel_id'], {})
+    for rec, hotel_info in zip(recs, hotel_infos):
         results.append({
             'hotel_id': rec['hotel_id'],
-            'name': hotel_info.get('name'),
-            'address': hotel_info.get('address'),
-            'star_rating': hotel_info.get('star_rating'),
-            'average_rating': hotel_info.get('average_rating'),
-            'location': hotel_info.get('location__name'),
-            'thumbnail': hotel_thumbnails.get(rec['hotel_id']),
-            'min_room_price': hotel_min_prices.get(rec['hotel_id']),
+            **hotel_info,
             'cf_score': rec['cf_score'],
             'recommendation_type': 'personalized'
         })
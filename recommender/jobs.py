@@ -0,0 +1,259 @@
+"""
+Retrain Jobs Module
+Chạy retrain ở background executor thay vì trong request.
+
+- POST /model/retrain/ submit job -> trả về job_id ngay lập tức
+- Trạng thái job (từng stage + thời gian) ghi ra file JSON trong <artifact_dir>/jobs/
+  -> worker gunicorn nào cũng trả lời được API polling
+- Dedup: fcntl.flock trên lock file (giữ tới khi job kết thúc) -> 2 admin bấm retrain cùng lúc
+  (kể cả khác worker) chỉ chạy 1 lần full table scan, request thứ 2 nhận lại job_id đang chạy.
+  Worker chết giữa chừng -> kernel tự nhả lock, không có lock stale phải dọn
+"""
+import fcntl
+import json
+import os
+import time
+import uuid
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from . import artifacts
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED)
+
+LOCK_FILE = 'retrain.lock'
+# Số file trạng thái job cũ giữ lại
+MAX_JOB_FILES = 50
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='retrain')
+_submit_lock = threading.Lock()
+# job_id -> file descriptor đang giữ flock của lock file
+_held_locks: Dict[str, int] = {}
+
+
+def _now_iso() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def get_jobs_dir() -> Path:
+    jobs_dir = artifacts.get_artifact_root() / 'jobs'
+    jobs_dir.mkdir(parents=True, exist_ok=True)
+    return jobs_dir
+
+
+def _job_path(job_id: str) -> Path:
+    return get_jobs_dir() / f'{job_id}.json'
+
+
+def _write_job(job: Dict[str, Any]) -> None:
+    """Ghi trạng thái job (atomic qua os.replace)."""
+    path = _job_path(job['job_id'])
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    tmp_path.write_text(json.dumps(job, ensure_ascii=False, default=str), encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Trạng thái job, None nếu không tồn tại.
+    Job chưa kết thúc mà process chạy nó đã chết (OOM kill, restart worker) -> ghi lại thành failed.
+    """
+    if not job_id or not job_id.isalnum():
+        return None
+    try:
+        job = json.loads(_job_path(job_id).read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return None
+
+    if job['status'] not in FINISHED_STATUSES and not _pid_alive(job['pid']):
+        for entry in job['stages']:
+            if entry['status'] == STATUS_RUNNING:
+                entry['status'] = STATUS_FAILED
+        job.update(status=STATUS_FAILED, error='worker exited', current_stage=None, finished_at=_now_iso())
+        _write_job(job)
+    return job
+
+
+class RetrainJob:
+    """Theo dõi tiến độ 1 lần retrain: status + timings của từng stage."""
+
+    def __init__(self, job_id: str):
+        self.data: Dict[str, Any] = {
+            'job_id': job_id,
+            'status': STATUS_QUEUED,
+            'pid': os.getpid(),
+            'submitted_at': _now_iso(),
+            'started_at': None,
+            'finished_at': None,
+            'duration_seconds': None,
+            'current_stage': None,
+            'stages': [],
+            'result': None,
+            'error': None,
+        }
+        self._started = None
+
+    def save(self) -> None:
+        _write_job(self.data)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Context manager đánh dấu 1 stage: running -> done / failed kèm thời gian."""
+        entry = {'name': name, 'status': STATUS_RUNNING, 'started_at': _now_iso(), 'duration_seconds': None}
+        self.data['stages'].append(entry)
+        self.data['current_stage'] = name
+        self.save()
+
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            entry['status'] = STATUS_FAILED
+            raise
+        else:
+            entry['status'] = 'done'
+        finally:
+            entry['duration_seconds'] = round(time.perf_counter() - started, 3)
+            self.save()
+
+    def run(self) -> None:
+        from .training import train_all
+        from . import warmup
+
+        self._started = time.perf_counter()
+        self.data.update(status=STATUS_RUNNING, started_at=_now_iso())
+        self.save()
+        try:
+            result = train_all(stage=self.stage)
+            self.data.update(status=STATUS_SUCCEEDED, result=result)
+            warmup.refresh_status(result['version'])
+            print(f"✅ Retrain job {self.data['job_id']} hoàn tất (artifact {result['version']})")
+        except Exception as e:
+            self.data.update(status=STATUS_FAILED, error=str(e))
+            print(f"⚠️ Retrain job {self.data['job_id']} lỗi: {e}")
+        finally:
+            from django.db import close_old_connections
+            close_old_connections()
+
+            self.data.update(
+                current_stage=None,
+                finished_at=_now_iso(),
+                duration_seconds=round(time.perf_counter() - self._started, 3),
+            )
+            self.save()
+            _release_lock(self.data['job_id'])
+
+
+# --- LOCK (DEDUP GIỮA CÁC WORKERS) ---
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _open_lock_file() -> int:
+    # Lock file không bao giờ bị xóa -> mọi workers flock trên cùng 1 inode
+    return os.open(get_jobs_dir() / LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+
+
+def _active_job_id() -> Optional[str]:
+    """job_id đang giữ lock (None nếu không có job nào đang chạy)."""
+    fd = _open_lock_file()
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Đang bị giữ (kể cả bởi chính process này qua fd khác) -> đọc job_id của holder
+            return os.pread(fd, 64, 0).decode('utf-8').strip() or None
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return None
+    finally:
+        os.close(fd)
+
+
+def _acquire_lock(job_id: str) -> bool:
+    """flock không chờ, thành công -> ghi job_id vào lock file và giữ fd tới _release_lock."""
+    fd = _open_lock_file()
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    os.ftruncate(fd, 0)
+    os.pwrite(fd, job_id.encode('utf-8'), 0)
+    _held_locks[job_id] = fd
+    return True
+
+
+def _release_lock(job_id: str) -> None:
+    fd = _held_locks.pop(job_id, None)
+    if fd is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _prune_job_files() -> None:
+    files = sorted(get_jobs_dir().glob('*.json'), key=lambda p: p.stat().st_mtime, reverse=True)
+    for path in files[MAX_JOB_FILES:]:
+        path.unlink(missing_ok=True)
+
+
+# --- PUBLIC API ---
+
+def submit_retrain() -> Tuple[Dict[str, Any], bool]:
+    """
+    Submit retrain job (dedup nếu đã có job đang chạy).
+
+    Returns:
+        (job, deduplicated) - deduplicated=True nếu trả về job đang chạy sẵn
+    """
+    deadline = time.monotonic() + 1.0
+    with _submit_lock:
+        while True:
+            active_id = _active_job_id()
+            if active_id:
+                active_job = get_job(active_id)
+                if active_job is not None and active_job['status'] not in FINISHED_STATUSES:
+                    return active_job, True
+                # Holder vừa lấy lock nhưng chưa ghi job_id mới / job vừa xong nhưng chưa nhả lock -> thử lại
+                if time.monotonic() >= deadline:
+                    raise RuntimeError(f"Retrain lock đang bị giữ nhưng không đọc được job {active_id}")
+                time.sleep(0.01)
+                continue
+
+            job = RetrainJob(uuid.uuid4().hex[:12])
+            job.save()
+            if _acquire_lock(job.data['job_id']):
+                break
+            # Worker khác vừa lấy lock -> bỏ job này, vòng sau trả về job của worker kia
+            _job_path(job.data['job_id']).unlink(missing_ok=True)
+
+        _prune_job_files()
+        _executor.submit(job.run)
+        # Trả về bản đọc từ file, không đưa dict đang bị thread job cập nhật ra ngoài
+        return get_job(job.data['job_id']), False
+
+
+def wait_for_job(job_id: str, timeout: Optional[float] = None, poll_interval: float = 1.0) -> Optional[Dict[str, Any]]:
+    """Chờ job (có thể đang chạy ở worker khác) kết thúc, trả về trạng thái cuối."""
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        job = get_job(job_id)
+        if job is None or job['status'] in FINISHED_STATUSES:
+            return job
+        if deadline is not None and time.monotonic() >= deadline:
+            return job
+        time.sleep(poll_interval)
@@ -0,0 +1,153 @@
+"""
+Location Hierarchy Module
+Index cây Locations (self-referential parent) trong RAM, build 1 lần cho mỗi hotel catalog (mỗi lần refresh).
+
+- Euler tour (interval encoding): DFS từ các locations gốc, mỗi location nhận khoảng [tin, tout)
+  -> location Y nằm trong vùng X  <=>  tin[X] <= tin[Y] < tout[X] (so sánh hằng số, không query đệ quy)
+- Posting lists: hotels của catalog sort theo tin của location -> hotels trong vùng X là 1 đoạn liên tục
+  [searchsorted(tin[X]), searchsorted(tout[X])) của thứ tự này (hotels đúng location X: đoạn [tin[X], tin[X] + 1))
+- Region codes: location tổ tiên ở độ sâu d của từng hotel (vd: d = 0 -> tỉnh / thành phố gốc)
+  cho diversity theo vùng
+- Dùng cho: filter location (filters.py), popular hotels theo vùng (popularity.py), diversity (diversity.py)
+
+Dữ liệu lỗi có vòng parent: location đầu tiên (id nhỏ nhất) chưa được duyệt của vòng được coi là gốc.
+"""
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+class LocationIndex:
+    """
+    Index cây Locations + posting lists hotels của 1 hotel catalog, bất biến.
+
+    Attributes:
+        location_ids: Location ids (int64, tăng dần)
+        tin, tout: Khoảng Euler tour [tin, tout) của từng location
+        depth: Độ sâu (location gốc = 0)
+        parent_pos: Vị trí (trong location_ids) của location cha, -1 nếu là gốc
+        hotel_tin: tin của location của từng hotel trong catalog (-1 nếu NULL / location không tồn tại)
+    """
+
+    def __init__(self, locations: Dict[int, Optional[int]], hotel_location_ids: np.ndarray):
+        self.location_ids = np.array(sorted(locations), dtype=np.int64)
+        n = self.location_ids.size
+        pos = {location_id: i for i, location_id in enumerate(self.location_ids.tolist())}
+
+        self.parent_pos = np.full(n, -1, dtype=np.int64)
+        children = [[] for _ in range(n)]
+        for i, location_id in enumerate(self.location_ids.tolist()):
+            parent = pos.get(locations[location_id])
+            if parent is not None and parent != i:
+                self.parent_pos[i] = parent
+                children[parent].append(i)
+
+        # DFS không đệ quy: gốc thật trước, sau đó các locations còn lại (chỉ có khi dữ liệu có vòng parent)
+        self.tin = np.full(n, -1, dtype=np.int64)
+        self.tout = np.full(n, -1, dtype=np.int64)
+        self.depth = np.zeros(n, dtype=np.int64)
+        timer = 0
+        for root in [*np.flatnonzero(self.parent_pos < 0).tolist(), *range(n)]:
+            if self.tin[root] >= 0:
+                continue
+            self.parent_pos[root] = -1
+            self.depth[root] = 0
+            stack = [(root, False)]
+            while stack:
+                i, exiting = stack.pop()
+                if exiting:
+                    self.tout[i] = timer
+                    continue
+                self.tin[i] = timer
+                timer += 1
+                stack.append((i, True))
+                for child in reversed(children[i]):
+                    if self.tin[child] < 0:
+                        self.parent_pos[child] = i
+                        self.depth[child] = self.depth[i] + 1
+                        stack.append((child, False))
+
+        # Location ids theo thứ tự Euler tour -> locations trong vùng X = đoạn [tin[X], tout[X])
+        self._euler_ids = np.empty(n, dtype=np.int64)
+        self._euler_ids[self.tin] = self.location_ids
+
+        # Posting lists: vị trí hotels trong catalog, sort theo tin (hotels không có location bị bỏ)
+        hotel_location_ids = np.asarray(hotel_location_ids, dtype=np.float64)
+        hotel_pos = self._positions(np.nan_to_num(hotel_location_ids, nan=-1).astype(np.int64))
+        hotel_pos[np.isnan(hotel_location_ids)] = -1
+        self.hotel_tin = np.where(hotel_pos >= 0, self.tin[np.maximum(hotel_pos, 0)] if n else -1, -1)
+        located = np.flatnonzero(self.hotel_tin >= 0)
+        self._hotel_order = located[np.argsort(self.hotel_tin[located], kind='stable')]
+        self._sorted_tin = self.hotel_tin[self._hotel_order]
+
+        # độ sâu -> region codes, tính lazily
+        self._regions = {}
+        for array in (self.location_ids, self.tin, self.tout, self.depth, self.parent_pos, self.hotel_tin,
+                      self._euler_ids, self._hotel_order, self._sorted_tin):
+            array.flags.writeable = False
+
+    def __len__(self) -> int:
+        return self.location_ids.size
+
+    def _positions(self, location_ids: np.ndarray) -> np.ndarray:
+        if self.location_ids.size == 0:
+            return np.full(location_ids.shape, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.location_ids, location_ids), self.location_ids.size - 1)
+        return np.where(self.location_ids[pos] == location_ids, pos, -1)
+
+    def interval(self, location_id: int) -> Optional[Tuple[int, int]]:
+        """Khoảng Euler tour [tin, tout) của location (None nếu không tồn tại)."""
+        pos = int(self._positions(np.asarray([location_id], dtype=np.int64))[0])
+        if pos < 0:
+            return None
+        return int(self.tin[pos]), int(self.tout[pos])
+
+    def descendants(self, location_id: int) -> np.ndarray:
+        """Location `location_id` và tất cả location con / cháu (theo thứ tự Euler tour)."""
+        interval = self.interval(location_id)
+        if interval is None:
+            return np.empty(0, dtype=np.int64)
+        return self._euler_ids[interval[0]:interval[1]]
+
+    def hotels_in(self, location_id: int, include_descendants: bool = True) -> np.ndarray:
+        """
+        Posting list: vị trí trong catalog của các hotels thuộc location
+        (mặc định gồm cả location con), sort theo thứ tự Euler tour.
+        """
+        interval = self.interval(location_id)
+        if interval is None:
+            return np.empty(0, dtype=np.int64)
+        start, stop = interval if include_descendants else (interval[0], interval[0] + 1)
+        return self._hotel_order[np.searchsorted(self._sorted_tin, start):np.searchsorted(self._sorted_tin, stop)]
+
+    def contains(self, location_id: int, hotel_positions) -> np.ndarray:
+        """Boolean mask: hotel (vị trí trong catalog, -1 = không có) có nằm trong vùng `location_id` không."""
+        hotel_positions = np.asarray(hotel_positions, dtype=np.int64)
+        interval = self.interval(location_id)
+        if interval is None or self.hotel_tin.size == 0:
+            return np.zeros(hotel_positions.shape, dtype=bool)
+        hotel_tin = np.where(hotel_positions >= 0, self.hotel_tin[np.maximum(hotel_positions, 0)], -1)
+        return (hotel_tin >= interval[0]) & (hotel_tin < interval[1])
+
+    def region_codes(self, depth: int) -> np.ndarray:
+        """
+        Location id tổ tiên ở độ sâu `depth` của từng hotel trong catalog
+        (location nông hơn -> chính nó, hotel không có location -> -1).
+        """
+        cached = self._regions.get(depth)
+        if cached is None:
+            # Đi lên cây theo parent_pos cho tất cả locations cùng lúc
+            ancestor = np.arange(self.location_ids.size)
+            deeper = self.depth[ancestor] > depth
+            while deeper.any():
+                ancestor[deeper] = self.parent_pos[ancestor[deeper]]
+                deeper = self.depth[ancestor] > depth
+            region_by_tin = np.empty(self.location_ids.size, dtype=np.int64)
+            region_by_tin[self.tin] = self.location_ids[ancestor]
+
+            cached = np.full(self.hotel_tin.size, -1, dtype=np.int64)
+            located = self.hotel_tin >= 0
+            cached[located] = region_by_tin[self.hotel_tin[located]]
+            cached.flags.writeable = False
+            self._regions[depth] = cached
+        return cached
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recommender import materialized
+from recommender.training import load_latest
+
+
+class Command(BaseCommand):
+    help = "Tính lại smart recommendations của tất cả active users vào materialized store (model artifact CURRENT)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None, help="Số process tính song song")
+        parser.add_argument('--shard-size', type=int, default=None, help="Số users mỗi shard")
+
+    def handle(self, *args, **options):
+        version = load_latest()
+        if not version:
+            raise CommandError("Chưa có model artifact - chạy `manage.py train_models` trước")
+
+        total = materialized.rebuild(processes=options['processes'], shard_size=options['shard_size'])
+        self.stdout.write(self.style.SUCCESS(f"Đã materialize recommendations cho {total} users (artifact {version})"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recommender.training import train_all
+
+
+class Command(BaseCommand):
+    help = "Train Content-Based + Collaborative Filtering models và ghi ra model artifact mới"
+
+    def handle(self, *args, **options):
+        result = train_all()
+        if not result['version']:
+            raise CommandError("Không train được model (không có hotels trong database?)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã ghi artifact {result['version']} "
+            f"(collaborative: {'OK' if result['collaborative'] else 'không đủ dữ liệu'})"
+        ))
@@ -0,0 +1,421 @@
+"""
+Materialized Recommendations Module
+Lưu sẵn kết quả get_smart_recommendations của tất cả active users (users có trong CF model)
+vào 1 file SQLite local, gắn với version model đã dùng để tính.
+
+- Rebuild (offline): chia users theo khoảng user_id thành các shards, tính bằng
+  views.compute_smart_recommendations trong process pool (mỗi process load artifact qua mmap),
+  mỗi shard ghi vào store trong 1 transaction (WAL -> requests vẫn đọc được trong lúc rebuild)
+- Serving: endpoint đọc store trước, chỉ tính live cho users thiếu / stale:
+    * model_version khác snapshot đang serve
+    * quá RECOMMENDER_MATERIALIZED_MAX_AGE_SECONDS
+    * user có action mới (track_user_action -> invalidate) sau data cut-off của model
+      (thời điểm train bắt đầu đọc interactions, cf['data_cutoff'] - lưu theo version trong store_meta)
+    * request khác weights / limit khác top-N đã lưu - limit quyết định cả candidate pool
+      (CF limit * 2, per-seed limit của hybrid, personalized fill), cắt kết quả top-N khác với tính live
+- Rebuild chạy sau mỗi lần train (stage 'materialize') hoặc bằng lệnh
+  `python manage.py materialize_recommendations`
+- Refresh nền (maybe_refresh): mỗi RECOMMENDER_MATERIALIZED_REFRESH_SECONDS, 1 process (giữ lượt qua
+  store_meta) tính lại tối đa RECOMMENDER_MATERIALIZED_REFRESH_BATCH users stale (có action mới / quá max age)
+  bằng snapshot đang serve, users được tính lại sẽ hit store trở lại
+
+Lưu ý: rebuild dùng model base của artifact (không gồm CF delta buffer của từng worker),
+users có action mới vẫn được tính live cho tới lần refresh / rebuild sau.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+from . import artifacts, snapshot
+
+# Weights mặc định của get_smart_recommendations - chỉ request dùng đúng weights này mới đọc store
+CONTENT_WEIGHT = 0.6
+COLLAB_WEIGHT = 0.4
+
+# Giới hạn số tham số của 1 câu SQL (SQLITE_MAX_VARIABLE_NUMBER của bản SQLite cũ là 999)
+_SQL_CHUNK = 900
+
+_local = threading.local()
+_refresh_lock = threading.Lock()
+_last_refresh = time.monotonic()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS smart_recommendations (
+    user_id INTEGER PRIMARY KEY,
+    model_version TEXT NOT NULL,
+    computed_at REAL NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_events (
+    user_id INTEGER PRIMARY KEY,
+    last_event_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'RECOMMENDER_MATERIALIZED_ENABLED', True)
+
+
+def get_store_path() -> Path:
+    default_path = artifacts.get_artifact_root() / 'smart_recommendations.sqlite3'
+    return Path(getattr(settings, 'RECOMMENDER_MATERIALIZED_PATH', None) or default_path)
+
+
+def _top_n() -> int:
+    return getattr(settings, 'RECOMMENDER_MATERIALIZED_TOP_N', 10)
+
+
+def _max_age() -> float:
+    return getattr(settings, 'RECOMMENDER_MATERIALIZED_MAX_AGE_SECONDS', 86400)
+
+
+def _refresh_interval() -> int:
+    return getattr(settings, 'RECOMMENDER_MATERIALIZED_REFRESH_SECONDS', 300)
+
+
+def _refresh_batch() -> int:
+    return getattr(settings, 'RECOMMENDER_MATERIALIZED_REFRESH_BATCH', 500)
+
+
+def _connect() -> sqlite3.Connection:
+    """Connection SQLite của thread hiện tại (mở lại nếu đường dẫn store thay đổi)."""
+    path = str(get_store_path())
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.path == path:
+        return conn
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(_SCHEMA)
+    _local.conn, _local.path = conn, path
+    return conn
+
+
+def _cutoff_key(model_version: Optional[str]) -> str:
+    return f"data_cutoff:{model_version or ''}"
+
+
+def _chunks(values: List[int]):
+    for start in range(0, len(values), _SQL_CHUNK):
+        yield values[start:start + _SQL_CHUNK]
+
+
+def _payload_rows(entries: Dict[int, Dict[str, Any]], version: Optional[str], computed_at: float) -> list:
+    """Rows (user_id, model_version, computed_at, payload) của các users không phải cold start."""
+    return [
+        (user_id, version or '', computed_at, json.dumps(entry, ensure_ascii=False, default=str))
+        for user_id, entry in entries.items()
+        if not entry['is_cold_start']
+    ]
+
+
+# --- SERVING ---
+
+def lookup(
+    user_ids: List[int],
+    model_version: Optional[str],
+    limit: int,
+    content_weight: float,
+    collab_weight: float
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Kết quả đã materialize (còn fresh) của các users.
+
+    Returns:
+        {user_id: entry cùng format views.compute_smart_recommendations} - chỉ gồm users hit
+    """
+    if not is_enabled() or not user_ids or not get_store_path().exists():
+        return {}
+    if (content_weight, collab_weight) != (CONTENT_WEIGHT, COLLAB_WEIGHT):
+        return {}
+
+    try:
+        conn = _connect()
+        meta = dict(conn.execute('SELECT key, value FROM store_meta').fetchall())
+        # Chỉ đúng limit đã dùng lúc rebuild mới cho kết quả giống hệt tính live
+        if limit != int(meta.get('top_n', 0)):
+            return {}
+        # Events trước data cut-off đã có trong model (không rõ cut-off -> mọi event đều làm stale)
+        data_cutoff = float(meta.get(_cutoff_key(model_version), 0))
+
+        min_computed_at = time.time() - _max_age()
+        hits = {}
+        for chunk in _chunks(list(user_ids)):
+            rows = conn.execute(
+                f"""
+                SELECT r.user_id, r.payload FROM smart_recommendations r
+                LEFT JOIN user_events e ON e.user_id = r.user_id
+                WHERE r.user_id IN ({','.join('?' * len(chunk))})
+                  AND r.model_version = ? AND r.computed_at >= ?
+                  AND (e.last_event_at IS NULL OR e.last_event_at < ?)
+                """,
+                (*chunk, model_version or '', min_computed_at, data_cutoff)
+            ).fetchall()
+            for user_id, payload in rows:
+                hits[user_id] = json.loads(payload)
+        return hits
+    except sqlite3.Error as e:
+        print(f"⚠️ Không đọc được materialized store: {e}")
+        return {}
+
+
+def invalidate(user_id: int) -> None:
+    """Đánh dấu user vừa có action mới -> kết quả đã lưu trước thời điểm này bị stale."""
+    if not is_enabled():
+        return
+    try:
+        _connect().execute(
+            'INSERT OR REPLACE INTO user_events (user_id, last_event_at) VALUES (?, ?)',
+            (int(user_id), time.time())
+        )
+    except sqlite3.Error as e:
+        print(f"⚠️ Không ghi được invalidation cho user {user_id}: {e}")
+
+
+# --- REBUILD ---
+
+def _init_worker(version: Optional[str]) -> None:
+    """Khởi tạo process con: setup Django + load đúng artifact đang được rebuild (mmap)."""
+    import django
+    django.setup()
+
+    loaded = artifacts.load_artifact(version)
+    if loaded is not None:
+        loaded_version, sections = loaded
+        snapshot.publish(content=sections.get('content', {}), cf=sections.get('cf', {}), version=loaded_version)
+
+
+def _build_shard(
+    user_ids: List[int],
+    version: Optional[str],
+    top_n: int,
+    snap: Optional[snapshot.ModelSnapshot] = None
+) -> int:
+    """
+    Tính + ghi kết quả cho 1 shard users. Trả về số users đã ghi.
+
+    Args:
+        snap: Snapshot đã pin của rebuild() (tính trong process hiện tại);
+            None -> snapshot mà _init_worker đã load trong process con
+    """
+    from django.db import close_old_connections
+    from .views import compute_smart_recommendations
+
+    snap = snap or snapshot.current()
+    if snap.version != version:
+        # Model đã đổi giữa chừng -> rebuild của version mới sẽ tính lại
+        return 0
+
+    try:
+        computed_at = time.time()
+        entries = compute_smart_recommendations(user_ids, top_n, CONTENT_WEIGHT, COLLAB_WEIGHT, snap=snap)
+        rows = _payload_rows(entries, version, computed_at)
+
+        conn = _connect()
+        conn.execute('BEGIN IMMEDIATE')
+        conn.executemany(
+            'INSERT OR REPLACE INTO smart_recommendations (user_id, model_version, computed_at, payload) '
+            'VALUES (?, ?, ?, ?)',
+            rows
+        )
+        conn.execute('COMMIT')
+        return len(rows)
+    finally:
+        close_old_connections()
+
+
+def rebuild(
+    snap: Optional[snapshot.ModelSnapshot] = None,
+    processes: Optional[int] = None,
+    shard_size: Optional[int] = None
+) -> int:
+    """
+    Tính lại store cho tất cả users trong CF model của `snap` (mặc định: snapshot hiện tại).
+
+    Args:
+        processes: Số process tính song song (mặc định RECOMMENDER_MATERIALIZED_PROCESSES),
+            <= 1 -> tính ngay trong process hiện tại
+        shard_size: Số users mỗi shard (RECOMMENDER_MATERIALIZED_SHARD_SIZE)
+
+    Returns:
+        Số users đã ghi vào store
+    """
+    snap = snap or snapshot.current()
+    processes = processes or getattr(settings, 'RECOMMENDER_MATERIALIZED_PROCESSES', min(4, os.cpu_count() or 1))
+    shard_size = shard_size or getattr(settings, 'RECOMMENDER_MATERIALIZED_SHARD_SIZE', 2000)
+    top_n = _top_n()
+
+    # Shards theo khoảng user_id liên tiếp
+    user_ids = sorted(int(u) for u in snap.cf.get('user_ids', []))
+    shards = [user_ids[i:i + shard_size] for i in range(0, len(user_ids), shard_size)]
+    if not snap.content or not shards:
+        return 0
+
+    started = time.time()
+    data_cutoff = snap.cf.get('data_cutoff')
+    conn = _connect()
+    conn.executemany('INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)', [
+        ('model_version', snap.version or ''),
+        ('top_n', str(top_n)),
+        (_cutoff_key(snap.version), str(data_cutoff or 0)),
+    ])
+
+    if processes <= 1 or len(shards) == 1 or snap.version is None:
+        counts = [_build_shard(shard, snap.version, top_n, snap) for shard in shards]
+    else:
+        from django.db import connections
+        connections.close_all()
+
+        # 'spawn': process con không kế thừa locks / threads của worker đang chạy
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(snap.version,)
+        ) as pool:
+            counts = list(pool.map(_build_shard, shards, repeat(snap.version), repeat(top_n)))
+
+    # Dọn kết quả của version cũ + events đã có trong dữ liệu train của model (trước data cut-off)
+    # (bỏ qua nếu model mới đã được publish trong lúc rebuild)
+    if snapshot.current().version == snap.version:
+        conn.execute('DELETE FROM smart_recommendations WHERE model_version != ?', (snap.version or '',))
+        conn.execute("DELETE FROM store_meta WHERE key LIKE 'data_cutoff:%' AND key != ?", (_cutoff_key(snap.version),))
+        if data_cutoff:
+            conn.execute('DELETE FROM user_events WHERE last_event_at < ?', (data_cutoff,))
+
+    total = sum(counts)
+    print(f"💾 Đã materialize recommendations cho {total} users "
+          f"({len(shards)} shards, {time.time() - started:.1f}s)")
+    return total
+
+
+# --- BACKGROUND REFRESH ---
+
+def refresh_stale(snap: Optional[snapshot.ModelSnapshot] = None, max_users: Optional[int] = None) -> int:
+    """
+    Tính lại (trong process hiện tại) các users đã có trong store nhưng bị stale:
+    có action mới sau data cut-off hoặc quá max age. Users tính lâu nhất được ưu tiên.
+
+    Args:
+        snap: Snapshot dùng để tính (mặc định: snapshot hiện tại)
+        max_users: Số users tối đa mỗi lần (mặc định RECOMMENDER_MATERIALIZED_REFRESH_BATCH)
+
+    Returns:
+        Số users đã ghi lại vào store
+    """
+    from django.db import close_old_connections
+    from .views import compute_smart_recommendations
+
+    snap = snap or snapshot.current()
+    version = snap.version or ''
+    top_n = _top_n()
+    conn = _connect()
+    meta = dict(conn.execute('SELECT key, value FROM store_meta').fetchall())
+    # Store của model / top-N khác -> chờ rebuild
+    if not snap.content or meta.get('model_version') != version or meta.get('top_n') != str(top_n):
+        return 0
+
+    data_cutoff = float(meta.get(_cutoff_key(snap.version), 0))
+    stale = [row[0] for row in conn.execute(
+        """
+        SELECT r.user_id FROM smart_recommendations r
+        LEFT JOIN user_events e ON e.user_id = r.user_id
+        WHERE r.model_version = ? AND (r.computed_at < ? OR e.last_event_at >= ?)
+        ORDER BY r.computed_at LIMIT ?
+        """,
+        (version, time.time() - _max_age(), data_cutoff, max_users or _refresh_batch())
+    ).fetchall()]
+    if not stale:
+        return 0
+
+    try:
+        # computed_at lấy trước khi tính -> action ghi trong lúc tính vẫn làm row stale
+        computed_at = time.time()
+        entries = compute_smart_recommendations(stale, top_n, CONTENT_WEIGHT, COLLAB_WEIGHT, snap=snap)
+        rows = _payload_rows(entries, snap.version, computed_at)
+        placeholders = ','.join('?' * len(stale))
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Rebuild cho model mới đã bắt đầu trong lúc tính -> không ghi đè
+            current = conn.execute("SELECT value FROM store_meta WHERE key = 'model_version'").fetchone()
+            if current is None or current[0] != version:
+                conn.execute('ROLLBACK')
+                return 0
+            # User trở thành cold start -> bỏ kết quả cũ
+            conn.execute(f'DELETE FROM smart_recommendations WHERE user_id IN ({placeholders})', stale)
+            conn.executemany(
+                'INSERT INTO smart_recommendations (user_id, model_version, computed_at, payload) '
+                'VALUES (?, ?, ?, ?)',
+                rows
+            )
+            conn.execute(
+                f'DELETE FROM user_events WHERE user_id IN ({placeholders}) AND last_event_at < ?',
+                (*stale, computed_at)
+            )
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+
+        print(f"🔄 Đã refresh materialized recommendations cho {len(rows)}/{len(stale)} users stale")
+        return len(rows)
+    finally:
+        close_old_connections()
+
+
+def _claim_refresh(conn: sqlite3.Connection, now: float) -> bool:
+    """Giữ lượt refresh của chu kỳ hiện tại - các processes dùng chung store chỉ 1 process chạy."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute("SELECT value FROM store_meta WHERE key = 'refreshed_at'").fetchone()
+        if row is not None and now - float(row[0]) < _refresh_interval():
+            return False
+        conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES ('refreshed_at', ?)", (str(now),))
+        return True
+    finally:
+        conn.execute('COMMIT')
+
+
+def _refresh_in_background() -> int:
+    global _last_refresh
+
+    if not _refresh_lock.acquire(blocking=False):
+        return 0
+    try:
+        _last_refresh = time.monotonic()
+        if not _claim_refresh(_connect(), time.time()):
+            return 0
+        return refresh_stale()
+    except Exception as e:
+        print(f"⚠️ Lỗi refresh materialized store: {e}")
+        return 0
+    finally:
+        _refresh_lock.release()
+
+
+def maybe_refresh() -> bool:
+    """Chạy refresh_stale ở background thread nếu đã đến lịch (RECOMMENDER_MATERIALIZED_REFRESH_SECONDS)."""
+    interval = _refresh_interval()
+    if not is_enabled() or interval <= 0 or _refresh_lock.locked():
+        return False
+    if time.monotonic() - _last_refresh < interval or not get_store_path().exists():
+        return False
+    threading.Thread(target=_refresh_in_background, name='materialized-refresh', daemon=True).start()
+    return True
@@ -0,0 +1,83 @@
+"""
+Neighbor Index Module
+Thay thế ma trận similarity N×N dày đặc bằng bảng top-K neighbors cho mỗi item.
+Bảng gồm 2 mảng compact:
+- neighbor_idx: int32 (N x K) - index của K items tương tự nhất (đã bỏ chính nó)
+- neighbor_scores: float32 (N x K) - similarity tương ứng, sắp xếp giảm dần
+Bảng được tính theo từng block hàng nên ma trận N×N không bao giờ tồn tại trong RAM.
+Ô không có neighbor hợp lệ (không đủ support) có index = -1, score = 0.
+"""
+import numpy as np
+from scipy.sparse import issparse
+from typing import Optional, Tuple
+from .ranking import top_k_rows
+
+# Số phần tử tối đa của 1 block similarity (block_rows x N) -> ~32MB với float32
+MAX_BLOCK_ELEMENTS = 8_000_000
+
+
+def _auto_block_size(n_items: int) -> int:
+    return max(1, MAX_BLOCK_ELEMENTS // max(n_items, 1))
+
+
+def build_topk_neighbors(
+    matrix,
+    k: int,
+    block_size: Optional[int] = None,
+    support_matrix=None,
+    min_support: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Tính top-K neighbors theo cosine (dot product) giữa các hàng của `matrix`.
+
+    Args:
+        matrix: Ma trận features (sparse hoặc dense), mỗi hàng là 1 item.
+            Các hàng nên được L2-normalize (TF-IDF mặc định đã normalize)
+            để dot product chính là cosine similarity.
+        k: Số neighbors giữ lại cho mỗi item (tự động giới hạn ở N-1)
+        block_size: Số hàng xử lý mỗi lần (mặc định tự tính theo N)
+        support_matrix: Ma trận 0/1 cùng số hàng với `matrix` (vd: item x users đã tương tác).
+            Support của 2 items = số cột chung (co-occurrence)
+        min_support: Bỏ các cặp có support < min_support (cần support_matrix)
+
+    Returns:
+        (neighbor_idx, neighbor_scores) - shape (N, K), scores giảm dần theo hàng
+    """
+    n_items = matrix.shape[0]
+    k = max(0, min(int(k), n_items - 1))
+
+    neighbor_idx = np.empty((n_items, k), dtype=np.int32)
+    neighbor_scores = np.empty((n_items, k), dtype=np.float32)
+    if k == 0:
+        return neighbor_idx, neighbor_scores
+
+    block_size = block_size or _auto_block_size(n_items)
+    matrix_t = matrix.T.tocsc() if issparse(matrix) else matrix.T
+    use_support = support_matrix is not None and min_support > 0
+    if use_support:
+        support_t = support_matrix.T.tocsc() if issparse(support_matrix) else support_matrix.T
+
+    for start in range(0, n_items, block_size):
+        stop = min(start + block_size, n_items)
+
+        # Similarity của block hàng [start, stop) với tất cả items -> (B x N)
+        block = matrix[start:stop] @ matrix_t
+        block = block.toarray() if issparse(block) else np.asarray(block)
+        block = block.astype(np.float32, copy=False)
+
+        # Loại bỏ chính nó
+        rows = np.arange(stop - start)
+        block[rows, rows + start] = -np.inf
+
+        if use_support:
+            support = support_matrix[start:stop] @ support_t
+            support = support.toarray() if issparse(support) else np.asarray(support)
+            block[support < min_support] = -np.inf
+
+        # Partial selection O(N) thay vì sort toàn bộ O(N log N)
+        neighbor_idx[start:stop], neighbor_scores[start:stop] = top_k_rows(block, k)
+
+    invalid = ~np.isfinite(neighbor_scores)
+    neighbor_idx[invalid] = -1
+    neighbor_scores[invalid] = 0
+    return neighbor_idx, neighbor_scores
@@ -0,0 +1,234 @@
+"""
+Popularity Leaderboard Module
+Bảng xếp hạng popular hotels tính sẵn (cold start users, fallback lúc warm-up),
+thay cho việc quét toàn bộ Hotels + 3 GROUP BY + cộng cột CF Matrix ở mỗi request.
+
+- Build lúc train (stage 'popularity'), lưu trong artifact section 'popularity'
+- Mỗi hotel (có average_rating) giữ các signals thô theo cột:
+    cf (tổng ratings đã decay trong User-Item Matrix), booking / view / favorite (số lượt),
+    average_rating, total_reviews
+- Score = Σ weight x component, component = signal đã normalize (chia max / thang điểm)
+  -> đổi weights chỉ là 1 phép tính vectorized trên các cột, không query lại DB
+- track_user_action cộng dồn view / favorite / booking vào leaderboard (incremental),
+  thứ tự xếp hạng được tính lại lazily ở lần đọc sau
+- Popular theo vùng (filter location): chỉ xếp hạng các hotels trong posting list của vùng
+  (locations.py) theo hạng đã tính sẵn, không quét toàn bộ leaderboard
+
+Lưu ý: cập nhật incremental nằm trong từng process (giống delta.py);
+lần retrain tiếp theo tất cả workers đều thấy. Cột cf / rating chỉ đổi khi train lại.
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Weights mặc định của hybrid popularity score
+WEIGHTS = {
+    'cf': 3.0,
+    'booking': 5.0,
+    'view': 1.0,
+    'favorite': 3.0,
+    'rating': 2.0,
+    'review': 1.5,
+}
+
+# Signals đếm được, normalize bằng max của toàn bộ hotels
+COUNT_SIGNALS = ('cf', 'booking', 'view', 'favorite')
+
+# track_user_action action_type -> signal được cộng thêm 1
+ACTION_SIGNALS = {
+    'view': 'view',
+    'favorite': 'favorite',
+    'book': 'booking',
+}
+
+# Số reviews để review component đạt tối đa
+REVIEW_CAP = 100.0
+
+
+class Leaderboard:
+    """
+    Signals popularity theo cột (cùng thứ tự với hotel_ids, tăng dần).
+    Các cột đếm được sửa in-place khi có event mới -> mọi thao tác giữ `_lock` của module.
+    """
+
+    def __init__(self, section: Dict[str, Any]):
+        # Copy: section load từ artifact là mmap read-only
+        self.hotel_ids = np.array(section['hotel_ids'], dtype=np.int64)
+        self.signals = {
+            name: np.array(section[name], dtype=np.float64)
+            for name in (*COUNT_SIGNALS, 'average_rating', 'total_reviews')
+        }
+        self.maxima = dict(zip(COUNT_SIGNALS, np.asarray(section['maxima'], dtype=np.float64).tolist()))
+        self.generation = 0
+        # (generation, weights) -> (thứ tự xếp hạng, hạng của từng hotel) của lần tính gần nhất
+        self._ranked = None
+
+    def components(self) -> Dict[str, np.ndarray]:
+        """Score breakdown chưa nhân weight: {component: array}."""
+        components = {}
+        for name in COUNT_SIGNALS:
+            max_value = self.maxima[name]
+            column = self.signals[name]
+            components[name] = column / max_value if max_value > 0 else np.zeros_like(column)
+        components['rating'] = self.signals['average_rating'] / 5.0
+        components['review'] = np.minimum(self.signals['total_reviews'] / REVIEW_CAP, 1.0)
+        return components
+
+    def scores(self, weights: Dict[str, float]) -> np.ndarray:
+        components = self.components()
+        return sum(weights[name] * components[name] for name in WEIGHTS)
+
+    def ranked(self, weights: Dict[str, float]) -> np.ndarray:
+        """Vị trí hotels theo popularity score giảm dần (cache tới event / weights tiếp theo)."""
+        key = (self.generation, tuple(weights[name] for name in WEIGHTS))
+        if self._ranked is None or self._ranked[0] != key:
+            scores = np.round(self.scores(weights), 4)
+            # Cùng score -> rating cao hơn, nhiều reviews hơn, id nhỏ hơn
+            order = np.lexsort((self.hotel_ids, -self.signals['total_reviews'],
+                                -self.signals['average_rating'], -scores))
+            ranks = np.empty(order.size, dtype=np.int64)
+            ranks[order] = np.arange(order.size)
+            self._ranked = (key, order, ranks)
+        return self._ranked[1]
+
+    def ranks(self, weights: Dict[str, float]) -> np.ndarray:
+        """Hạng (0 = popular nhất) của từng hotel, cùng thứ tự với hotel_ids."""
+        self.ranked(weights)
+        return self._ranked[2]
+
+    def add(self, hotel_id: int, signal: str, amount: float = 1.0) -> bool:
+        pos = int(np.searchsorted(self.hotel_ids, hotel_id))
+        if pos >= self.hotel_ids.size or self.hotel_ids[pos] != hotel_id:
+            return False
+        column = self.signals[signal]
+        column[pos] += amount
+        self.maxima[signal] = max(self.maxima[signal], float(column[pos]))
+        self.generation += 1
+        return True
+
+
+_lock = threading.Lock()
+_board: Optional[Leaderboard] = None
+
+
+def build_leaderboard(cf_data: Optional[Dict[str, Any]] = None) -> Dict[str, np.ndarray]:
+    """
+    Tính signals popularity từ DB (+ CF model nếu có).
+
+    Returns:
+        Section cho artifact: hotel_ids + 1 array cho mỗi signal + maxima (theo COUNT_SIGNALS)
+    """
+    from django.db.models import Count
+    from . import collaborative
+    from .models import Bookings, FavoriteHotels, Hotels, ViewHistories
+
+    hotels = np.array(list(Hotels.objects.filter(average_rating__isnull=False).order_by('id').values_list(
+        'id', 'average_rating', 'total_reviews'
+    )), dtype=np.float64).reshape(-1, 3)
+    hotel_ids = hotels[:, 0].astype(np.int64)
+    section = {
+        'hotel_ids': hotel_ids,
+        'average_rating': hotels[:, 1],
+        'total_reviews': np.nan_to_num(hotels[:, 2]),
+    }
+    maxima = {}
+
+    def align(counts: Dict[int, float]) -> np.ndarray:
+        column = np.zeros(hotel_ids.size, dtype=np.float64)
+        if counts:
+            keys = np.fromiter(counts, dtype=np.int64, count=len(counts))
+            values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+            pos = np.minimum(np.searchsorted(hotel_ids, keys), max(hotel_ids.size - 1, 0))
+            found = hotel_ids[pos] == keys if hotel_ids.size else np.zeros(keys.size, dtype=bool)
+            column[pos[found]] = values[found]
+        return column
+
+    # CF: tổng ratings (đã decay) của mỗi hotel trong User-Item Matrix
+    cf_counts = {}
+    if cf_data and cf_data.get('hotel_ids'):
+        hotel_popularity = np.asarray(collaborative.decayed_ratings(cf_data).sum(axis=0)).ravel()
+        cf_counts = dict(zip((int(h) for h in cf_data['hotel_ids']), hotel_popularity.tolist()))
+    section['cf'] = align(cf_counts)
+    maxima['cf'] = max(cf_counts.values(), default=0.0)
+
+    for name, queryset, field in (
+        ('booking', Bookings.objects, 'room__hotel_id'),
+        ('view', ViewHistories.objects, 'hotel_id'),
+        ('favorite', FavoriteHotels.objects, 'hotel_id'),
+    ):
+        counts = dict(queryset.values(field).annotate(count=Count('id')).values_list(field, 'count'))
+        section[name] = align(counts)
+        maxima[name] = max(counts.values(), default=1)
+
+    section['maxima'] = np.array([maxima[name] for name in COUNT_SIGNALS], dtype=np.float64)
+    return section
+
+
+def publish(section: Optional[Dict[str, Any]]) -> None:
+    """Dùng leaderboard mới (None / rỗng -> tính lại lazily ở lần đọc sau)."""
+    global _board
+    board = Leaderboard(section) if section else None
+    with _lock:
+        _board = board
+
+
+def _get_board(cf_data: Optional[Dict[str, Any]] = None) -> Leaderboard:
+    """Leaderboard hiện tại; chưa có (artifact cũ / chưa train) -> tính từ DB 1 lần."""
+    board = _board
+    if board is None:
+        publish(build_leaderboard(cf_data))
+        board = _board
+    return board
+
+
+def record_event(hotel_id: int, action_type: str) -> bool:
+    """
+    Cộng dồn 1 action của track_user_action vào leaderboard.
+
+    Returns:
+        True nếu leaderboard thay đổi (hotel có trong leaderboard + action được tính)
+    """
+    signal = ACTION_SIGNALS.get(action_type)
+    if signal is None:
+        return False
+    with _lock:
+        if _board is None:
+            return False
+        return _board.add(int(hotel_id), signal)
+
+
+def get_top_hotel_ids(
+    limit: int = 10,
+    weights: Optional[Dict[str, float]] = None,
+    exclude_ids: Iterable[int] = (),
+    cf_data: Optional[Dict[str, Any]] = None,
+    hotel_filter: Any = None
+) -> List[int]:
+    """
+    Top `limit` popular hotel ids.
+
+    Args:
+        weights: Ghi đè 1 phần WEIGHTS (vd: {'booking': 8.0})
+        cf_data: CF model để tính leaderboard nếu chưa có
+        hotel_filter: Optional filters.HotelFilter - xếp hạng chỉ trong các hotels thỏa filter
+    """
+    weights = {**WEIGHTS, **(weights or {})}
+    board = _get_board(cf_data)
+    with _lock:
+        order = board.ranked(weights)
+        ranks = board.ranks(weights)
+        hotel_ids = board.hotel_ids
+    if hotel_filter:
+        region_ids = hotel_filter.region_hotel_ids()
+        if region_ids is not None:
+            # Popular theo vùng: chỉ sort các hotels của vùng theo hạng đã tính
+            pos = np.minimum(np.searchsorted(hotel_ids, region_ids), max(hotel_ids.size - 1, 0))
+            pos = pos[hotel_ids[pos] == region_ids] if hotel_ids.size else pos[:0]
+            order = pos[np.argsort(ranks[pos], kind='stable')]
+        order = order[hotel_filter.allows(hotel_ids[order])]
+    exclude_ids = set(exclude_ids)
+    if not exclude_ids:
+        return hotel_ids[order[:limit]].tolist()
+    return [hid for hid in hotel_ids[order[:limit + len(exclude_ids)]].tolist() if hid not in exclude_ids][:limit]
+
@@ -0,0 +1,137 @@
+"""
+Ranking Module
+Kernel chọn top-K dùng chung cho tất cả recommendation paths
+(Content-Based, Item-Based CF, User-Based CF, Hybrid).
+
+- Partial selection (np.argpartition): O(N + K log K) thay vì sort toàn bộ O(N log N)
+- Exclusion mask: bỏ chính nó, hotels đã xem, hotels đã rate...
+- Score threshold: chỉ giữ score > threshold
+- Trả về arrays (indices, scores), không tạo list of tuples
+- Batch: top-K theo hàng cho ma trận dense (top_k_rows) và Sparse Matrix (top_k_sparse_rows)
+"""
+import numpy as np
+from scipy.sparse import csr_matrix
+from typing import List, Optional, Tuple
+
+
+def _exclusion_mask(exclude, n: int, candidates: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    """
+    Chuyển `exclude` (boolean mask hoặc mảng indices trên không gian items)
+    thành boolean mask trên các vị trí của `scores`.
+    """
+    if exclude is None:
+        return None
+    exclude = np.asarray(exclude)
+    if exclude.size == 0:
+        return None
+
+    if exclude.dtype == bool:
+        return exclude[candidates] if candidates is not None else exclude
+
+    if candidates is not None:
+        return np.isin(candidates, exclude)
+    mask = np.zeros(n, dtype=bool)
+    mask[exclude] = True
+    return mask
+
+
+def top_k(
+    scores,
+    k: int,
+    exclude=None,
+    threshold: Optional[float] = None,
+    candidates=None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Chọn top-K items có score cao nhất.
+
+    Args:
+        scores: 1-D array scores
+        k: Số kết quả tối đa
+        exclude: Items cần loại bỏ - boolean mask hoặc mảng indices
+        threshold: Chỉ giữ items có score > threshold (None = giữ tất cả)
+        candidates: Optional - item index tương ứng với từng vị trí của `scores`
+            (vd: 1 hàng của bảng neighbors). Khi có, `exclude` và kết quả
+            trả về đều tính theo item index.
+
+    Returns:
+        (indices, scores) sắp xếp giảm dần theo score
+    """
+    scores = np.asarray(scores).ravel()
+    if candidates is not None:
+        candidates = np.asarray(candidates).ravel()
+    n = scores.shape[0]
+    k = min(int(k), n)
+    if k <= 0:
+        empty_idx = np.empty(0, dtype=candidates.dtype if candidates is not None else np.int64)
+        return empty_idx, np.empty(0, dtype=scores.dtype)
+
+    mask = _exclusion_mask(exclude, n, candidates)
+    if mask is not None:
+        scores = np.where(mask, -np.inf, scores)
+
+    if k < n:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(n)
+    top = top[np.argsort(-scores[top], kind='stable')]
+    top_scores = scores[top]
+
+    # -inf = bị exclude; threshold loại các score quá thấp
+    keep = top_scores > (threshold if threshold is not None else -np.inf)
+    top, top_scores = top[keep], top_scores[keep]
+
+    if candidates is not None:
+        top = candidates[top]
+    return top, top_scores
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-K cho từng hàng của ma trận dense 2-D (vd: 1 block similarity).
+    Exclusion được xử lý bởi caller bằng cách gán -inf.
+
+    Returns:
+        (indices, scores) shape (n_rows, K), giảm dần theo hàng
+    """
+    k = min(int(k), scores.shape[1])
+    if k <= 0:
+        n_rows = scores.shape[0]
+        return np.empty((n_rows, 0), dtype=np.int64), np.empty((n_rows, 0), dtype=scores.dtype)
+
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def top_k_sparse_rows(matrix, k: int, threshold: Optional[float] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Top-K cho từng hàng của Sparse Matrix (vd: scores của 1 batch users), vectorized trên `.data`:
+    1 lần lexsort theo (hàng, -score) rồi cắt K phần tử đầu của mỗi hàng.
+    Các ô không lưu trong matrix được coi như không phải ứng viên.
+
+    Returns:
+        List (indices, scores) cho từng hàng, giảm dần theo score
+    """
+    matrix = csr_matrix(matrix)
+    n_rows = matrix.shape[0]
+    rows = np.repeat(np.arange(n_rows), np.diff(matrix.indptr))
+    cols, data = matrix.indices, matrix.data
+
+    keep = data > (threshold if threshold is not None else -np.inf)
+    rows, cols, data = rows[keep], cols[keep], data[keep]
+
+    order = np.lexsort((-data, rows))
+    rows, cols, data = rows[order], cols[order], data[order]
+
+    counts = np.bincount(rows, minlength=n_rows)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    keep = (np.arange(rows.size) - starts[rows]) < max(int(k), 0)
+    cols, data = cols[keep], data[keep]
+
+    bounds = np.cumsum(np.minimum(counts, max(int(k), 0)))[:-1]
+    return list(zip(np.split(cols, bounds), np.split(data, bounds)))
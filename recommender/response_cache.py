@@ -0,0 +1,150 @@
+"""
+Response Cache Module
+Cache response của get_smart_recommendations trên Django cache framework
+(settings.CACHES['recommender']: locmem mặc định, file / Redis tùy chọn).
+
+- Key = user_id + generation của user + limit + weights + model version (+ filters của request)
+  -> retrain / reload artifact mới tự động không dùng lại response cũ
+- Entry hết hạn theo TTL (TIMEOUT của cache alias)
+- Invalidation theo event: track_user_action tăng generation của user
+  -> mọi response đã cache của user đó (mọi limit / weights) không còn được đọc
+- Counters hit / miss / set / invalidation / eviction cho API stats (để chọn MAX_ENTRIES / TTL)
+
+Lưu ý: counters tính theo từng process. Với backend locmem mỗi gunicorn worker có cache riêng,
+invalidation chỉ có hiệu lực ở worker nhận event (worker khác hết hạn theo TTL);
+dùng backend file / Redis để các workers dùng chung cache.
+"""
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.backends import filebased, locmem
+
+KEY_PREFIX = 'smart'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'sets': 0, 'invalidations': 0, 'evictions': 0}
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+# --- CACHE BACKENDS (đếm số entries bị cull khi đầy MAX_ENTRIES) ---
+
+class LocMemCache(locmem.LocMemCache):
+    def _cull(self):
+        before = len(self._cache)
+        super()._cull()
+        _count('evictions', before - len(self._cache))
+
+
+class FileBasedCache(filebased.FileBasedCache):
+    def _cull(self):
+        before = len(self._list_cache_files())
+        super()._cull()
+        _count('evictions', max(before - len(self._list_cache_files()), 0))
+
+
+# --- PUBLIC API ---
+
+def _alias() -> str:
+    return getattr(settings, 'RECOMMENDER_RESPONSE_CACHE_ALIAS', 'recommender')
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'RECOMMENDER_RESPONSE_CACHE_ENABLED', True)
+
+
+def _cache():
+    try:
+        return caches[_alias()]
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def _generation_key(user_id: int) -> str:
+    return f'{KEY_PREFIX}:gen:{user_id}'
+
+
+def lookup(
+    user_id: int,
+    limit: int,
+    content_weight: float,
+    collab_weight: float,
+    model_version: Optional[str],
+    variant: str = ''
+) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Tìm response đã cache.
+
+    Args:
+        variant: Phần key bổ sung cho các biến thể của cùng request (vd: filters.HotelFilter.cache_key())
+
+    Returns:
+        (cache key để store() sau khi tính xong, response hoặc None nếu miss);
+        key = None nếu cache bị tắt
+    """
+    if not is_enabled():
+        return None, None
+
+    cache = _cache()
+    generation = cache.get(_generation_key(user_id), 0)
+    key = f'{KEY_PREFIX}:{model_version or "none"}:{user_id}:{generation}:{limit}:{content_weight!r}:{collab_weight!r}'
+    if variant:
+        key = f'{key}:{variant}'
+
+    response = cache.get(key)
+    _count('hits' if response is not None else 'misses')
+    return key, response
+
+
+def store(key: Optional[str], response: Dict[str, Any]) -> None:
+    """Cache response với TTL mặc định của cache alias."""
+    if key is None:
+        return
+    _cache().set(key, response)
+    _count('sets')
+
+
+def invalidate_user(user_id: int) -> None:
+    """User có action mới -> tăng generation, các response đã cache của user bị bỏ qua."""
+    if not is_enabled():
+        return
+    cache = _cache()
+    key = _generation_key(user_id)
+    # Generation không hết hạn (timeout=None); nếu bị cull khi cache đầy thì response cũ sống tối đa tới hết TTL
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+    _count('invalidations')
+
+
+def get_stats() -> Dict[str, Any]:
+    """Counters của process hiện tại + cấu hình cache."""
+    cache = _cache()
+    with _stats_lock:
+        stats = dict(_stats)
+
+    lookups = stats['hits'] + stats['misses']
+    stats.update({
+        'enabled': is_enabled(),
+        'pid': os.getpid(),
+        'backend': f'{type(cache).__module__}.{type(cache).__name__}',
+        'ttl_seconds': cache.default_timeout,
+        'max_entries': getattr(cache, '_max_entries', None),
+        'entries': len(cache._cache) if isinstance(cache, locmem.LocMemCache) else None,
+        'hit_rate': round(stats['hits'] / lookups, 4) if lookups else None,
+    })
+    return stats
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
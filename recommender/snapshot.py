@@ -0,0 +1,89 @@
+"""
+Model Snapshot Module
+Trạng thái models (Content-Based + CF) được đóng gói thành 1 snapshot bất biến.
+
+- Train / load artifact tạo snapshot MỚI, publish bằng đúng 1 phép gán reference
+  -> request không bao giờ thấy `neighbor_idx` mới đi với `indices` cũ (torn read).
+- Mỗi request gọi current() 1 lần và dùng snapshot đó đến hết request (pin).
+- Snapshot cũ được giải phóng (kể cả mmap của artifact) khi request cuối cùng
+  còn giữ nó kết thúc - Python reference counting lo việc này, không cần lock phía đọc.
+"""
+import threading
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
+
+import numpy as np
+from scipy.sparse import issparse
+
+
+def _freeze_value(value: Any) -> Any:
+    """Đánh dấu read-only cho NumPy arrays / Sparse Matrices trong snapshot."""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif issparse(value):
+        for part in ('data', 'indices', 'indptr'):
+            arr = getattr(value, part, None)
+            if isinstance(arr, np.ndarray):
+                arr.flags.writeable = False
+    return value
+
+
+def _freeze(data: Optional[Mapping[str, Any]]) -> Mapping[str, Any]:
+    data = data or {}
+    return MappingProxyType({key: _freeze_value(value) for key, value in data.items()})
+
+
+@dataclass(frozen=True)
+class ModelSnapshot:
+    """
+    Snapshot bất biến của tất cả models.
+
+    Attributes:
+        version: Version artifact (None nếu chưa lưu artifact)
+        content: Content-Based model (df, indices, neighbor_idx, neighbor_scores, ...)
+        cf: Collaborative Filtering model (user_item_matrix_sparse, user_ids, hotel_ids, ...)
+    """
+    version: Optional[str] = None
+    content: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+    cf: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+
+
+_publish_lock = threading.Lock()
+_current = ModelSnapshot()
+
+
+def current() -> ModelSnapshot:
+    """Snapshot đang được publish. Gọi 1 lần mỗi request rồi truyền xuống các hàm con."""
+    return _current
+
+
+def publish(
+    content: Optional[Mapping[str, Any]] = None,
+    cf: Optional[Mapping[str, Any]] = None,
+    version: Optional[str] = None,
+    expected: Optional[ModelSnapshot] = None
+) -> Optional[ModelSnapshot]:
+    """
+    Publish snapshot mới bằng 1 phép gán reference.
+    Phần nào truyền None thì giữ nguyên từ snapshot hiện tại.
+
+    Lock chỉ serialize các writers (train / reload) với nhau, readers không bao giờ chờ.
+
+    Args:
+        expected: Nếu truyền -> chỉ publish khi snapshot hiện tại vẫn là `expected`
+            (compare-and-swap), trả về None nếu writer khác đã publish trước
+    """
+    global _current
+
+    with _publish_lock:
+        base = _current
+        if expected is not None and base is not expected:
+            return None
+        new_snapshot = ModelSnapshot(
+            version=version if version is not None else base.version,
+            content=_freeze(content) if content is not None else base.content,
+            cf=_freeze(cf) if cf is not None else base.cf,
+        )
+        _current = new_snapshot
+    return new_snapshot
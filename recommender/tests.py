@@ -1,10 +1,21 @@
-from django.test import TestCase
+import tempfile
+from pathlib import Path
+from django.test import TestCase, override_settings
+from django.core.exceptions import ImproperlyConfigured
 from unittest.mock import patch, MagicMock
 from django.utils import timezone
 import datetime
 import pandas as pd
 import numpy as np
-from . import collaborative, evaluation
+from scipy.sparse import csr_matrix, random as sparse_random
+from sklearn.metrics.pairwise import cosine_similarity
+from django.test import RequestFactory
+import threading
+import time
+import subprocess
+import sys
+import json
+from . import als, ann, artifacts, catalog, collaborative, delta, diversity, evaluation, filters, hotel_index, jobs, locations, materialized, neighbors, popularity, ranking, response_cache, snapshot, views, warm_users, warmup
 
 class RecommenderLogicTest(TestCase):
     
@@ -27,6 +38,12 @@ class RecommenderLogicTest(TestCase):
         decay_old = collaborative.calculate_time_decay(days_1000)
         self.assertGreaterEqual(decay_old, 0.1)
 
+    @staticmethod
+    def _mock_chunks(mock_qs, rows):
+        """Mock chuỗi queryset.filter(id__gt=...).order_by('id').values_list(...)[:chunk]"""
+        sliced = mock_qs.return_value.filter.return_value.order_by.return_value.values_list.return_value
+        sliced.__getitem__.return_value = rows
+
     @patch('recommender.models.ViewHistories.objects.all')
     @patch('recommender.models.FavoriteHotels.objects.all')
     @patch('recommender.models.Bookings.objects.filter')
@@ -35,27 +52,20 @@ class RecommenderLogicTest(TestCase):
         """Test matrix construction with mock data"""
         now = timezone.now()
         
-        # Mock View Data
-        mock_views.return_value.values.return_value = [
-            {
-                'account_id': 1, 'hotel_id': 1, 
-                'view_duration_seconds': 200,  # Bonus
-                'clicked_booking': False, 'clicked_favorite': False,
-                'viewed_at': now
-            }
-        ]
+        # Mock View Data: (id, account_id, hotel_id, view_duration_seconds, clicked_booking, clicked_favorite, viewed_at)
+        self._mock_chunks(mock_views, [
+            (1, 1, 1, 200, False, False, now),  # duration 200 -> Bonus
+        ])
         
         # Mock Favorite Data
-        mock_favorites.return_value.values.return_value = []
+        self._mock_chunks(mock_favorites, [])
         
-        # Mock Booking Data
-        mock_bookings.return_value.select_related.return_value.values.return_value = [
-             {
-                'user_id': 1, 'room__hotel_id': 2, 'created_at': now
-             }
-        ]
+        # Mock Booking Data: (id, user_id, room__hotel_id, created_at)
+        self._mock_chunks(mock_bookings, [
+            (1, 1, 2, now),
+        ])
         
-        mock_reviews.return_value.values.return_value = []
+        self._mock_chunks(mock_reviews, [])
         
         # Run function
         df = collaborative.build_user_item_matrix()
@@ -90,7 +100,8 @@ class RecommenderLogicTest(TestCase):
         
         # Check global data
         self.assertIn('user_item_matrix_sparse', collaborative.cf_global_data)
-        self.assertIn('user_similarity_sparse', collaborative.cf_global_data)
+        self.assertIn('user_vectors_normalized', collaborative.cf_global_data)
+        self.assertNotIn('user_similarity_sparse', collaborative.cf_global_data)
         
         sparse_mat = collaborative.cf_global_data['user_item_matrix_sparse']
         self.assertEqual(sparse_mat.shape, (2, 3)) # 2 Users, 3 Hotels (ids: 1, 2, 3)
@@ -117,3 +128,1225 @@ class RecommenderLogicTest(TestCase):
         self.assertIsNotNone(train)
         self.assertIsNotNone(test)
         self.assertTrue(len(train) + len(test) == 9)
+
+
+class NeighborIndexTest(TestCase):
+
+    def test_build_topk_neighbors_matches_dense(self):
+        """Top-K theo block phải khớp với sort toàn bộ ma trận dense"""
+        matrix = sparse_random(50, 30, density=0.3, format='csr', random_state=0)
+        dense_sim = (matrix @ matrix.T).toarray()
+        np.fill_diagonal(dense_sim, -np.inf)
+
+        nb_idx, nb_scores = neighbors.build_topk_neighbors(matrix, k=5, block_size=7)
+
+        self.assertEqual(nb_idx.shape, (50, 5))
+        self.assertEqual(nb_idx.dtype, np.int32)
+        self.assertEqual(nb_scores.dtype, np.float32)
+        for row in range(50):
+            self.assertNotIn(row, nb_idx[row])
+            expected = np.sort(dense_sim[row])[::-1][:5]
+            np.testing.assert_allclose(nb_scores[row], expected, rtol=1e-5)
+
+    def test_build_topk_neighbors_caps_k(self):
+        matrix = np.eye(3)
+        nb_idx, nb_scores = neighbors.build_topk_neighbors(matrix, k=10)
+        self.assertEqual(nb_idx.shape, (3, 2))
+
+
+class RankingTest(TestCase):
+
+    def test_top_k_exclude_and_threshold(self):
+        scores = np.array([0.1, 0.9, 0.0, 0.5, 0.7, -0.2])
+        idx, vals = ranking.top_k(scores, 4, exclude=[1], threshold=0)
+        np.testing.assert_array_equal(idx, [4, 3, 0])
+        np.testing.assert_allclose(vals, [0.7, 0.5, 0.1])
+
+        # Boolean mask tương đương với mảng indices
+        mask = np.zeros(6, dtype=bool)
+        mask[[1, 4]] = True
+        idx, _ = ranking.top_k(scores, 2, exclude=mask)
+        np.testing.assert_array_equal(idx, [3, 0])
+
+    def test_top_k_with_candidates(self):
+        """Exclude và kết quả tính theo item index của candidates"""
+        candidates = np.array([7, 3, 5], dtype=np.int32)
+        scores = np.array([0.9, 0.8, 0.1], dtype=np.float32)
+        idx, vals = ranking.top_k(scores, 2, exclude=[7], candidates=candidates)
+        np.testing.assert_array_equal(idx, [3, 5])
+        self.assertEqual(idx.dtype, np.int32)
+
+    def test_top_k_sparse_rows(self):
+        matrix = csr_matrix(np.array([
+            [0.0, 0.5, 0.9, 0.1],
+            [0.0, 0.0, 0.0, 0.0],
+            [0.3, -1.0, 0.0, 0.7],
+        ]))
+        rows = ranking.top_k_sparse_rows(matrix, 2, threshold=0)
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0][0].tolist(), [2, 1])
+        self.assertEqual(rows[1][0].size, 0)
+        self.assertEqual(rows[2][0].tolist(), [3, 0])
+        np.testing.assert_allclose(rows[2][1], [0.7, 0.3])
+
+    @patch('recommender.collaborative.build_user_item_matrix')
+    def test_cf_recommendations_use_ranking(self, mock_build):
+        mock_build.return_value = pd.DataFrame({
+            'user_id': [1, 1, 2, 2, 2],
+            'hotel_id': [10, 20, 10, 20, 30],
+            'rating': [5.0, 4.0, 5.0, 4.0, 3.0]
+        })
+        collaborative.train_collaborative_model()
+
+        user_recs = collaborative.get_user_based_recommendations(1, limit=5)
+        self.assertEqual([r['hotel_id'] for r in user_recs], [30])
+
+        item_recs = collaborative.get_item_based_recommendations(10, limit=5)
+        self.assertEqual(item_recs[0]['hotel_id'], 20)
+        self.assertNotIn(10, [r['hotel_id'] for r in item_recs])
+
+
+class ArtifactTest(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        override = override_settings(RECOMMENDER_ARTIFACT_DIR=self.tmp_dir.name, RECOMMENDER_ARTIFACT_KEEP=2)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_save_and_load_roundtrip(self):
+        df = pd.DataFrame({'id': [3, 7], 'name': ['A', 'B']})
+        matrix = csr_matrix(np.array([[0.0, 1.5], [2.0, 0.0]]))
+        version = artifacts.save_artifact({
+            'content': {
+                'df': df,
+                'indices': pd.Series(df.index, index=df['id']),
+                'neighbor_idx': np.array([[1], [0]], dtype=np.int32),
+            },
+            'cf': {'user_item_matrix_sparse': matrix, 'user_ids': [10, 20]},
+        })
+
+        self.assertEqual(artifacts.current_version(), version)
+        loaded_version, sections = artifacts.load_artifact()
+        self.assertEqual(loaded_version, version)
+
+        content, cf = sections['content'], sections['cf']
+        pd.testing.assert_frame_equal(content['df'], df)
+        self.assertEqual(content['indices'][7], 1)
+        self.assertIsInstance(content['neighbor_idx'], np.memmap)
+        np.testing.assert_array_equal(cf['user_item_matrix_sparse'].toarray(), matrix.toarray())
+        self.assertEqual(cf['user_ids'], [10, 20])
+
+    def test_json_values_keep_types_and_reject_unsupported(self):
+        artifacts.save_artifact({'cf': {'ann_recall': np.float32(0.5), 'meta': {'n': np.int64(3)}, 'engine': 'als'}})
+        cf = artifacts.load_artifact()[1]['cf']
+        self.assertEqual((cf['ann_recall'], cf['meta'], cf['engine']), (0.5, {'n': 3}, 'als'))
+        self.assertIsInstance(cf['meta']['n'], int)
+
+        with self.assertRaises(TypeError):
+            artifacts.save_artifact({'cf': {'trained_at': datetime.datetime.now()}})
+        self.assertEqual(len([p for p in Path(self.tmp_dir.name).iterdir() if p.name.startswith('.tmp-')]), 0)
+
+    def test_prune_keeps_latest(self):
+        versions = [artifacts.save_artifact({'content': {'x': np.arange(3)}}) for _ in range(3)]
+        self.assertIsNone(artifacts.load_artifact(versions[0]))
+        self.assertIsNotNone(artifacts.load_artifact(versions[-1]))
+
+
+class WarmupTest(TestCase):
+
+    def setUp(self):
+        previous = snapshot.current()
+        self.addCleanup(snapshot.publish, content=previous.content, cf=previous.cf)
+        self.addCleanup(warmup._popular_fallback.clear)
+        snapshot.publish(content={}, cf={})
+
+    @patch('recommender.training.load_latest', return_value=None)
+    @patch('recommender.training.reload_if_stale', return_value=None)
+    @patch('recommender.jobs.wait_for_job', return_value={'status': 'failed', 'error': 'no data'})
+    @patch('recommender.jobs.submit_retrain', return_value=({'job_id': 'abc'}, False))
+    @patch('recommender.views.get_popular_hotels_list')
+    def test_warmup_without_model_is_degraded(self, mock_popular, mock_submit, mock_wait, mock_reload, mock_load):
+        mock_popular.return_value = [{'id': 1, 'name': 'A'}, {'id': 2, 'name': 'B'}]
+        warmup._run()
+
+        status = warmup.get_status()
+        self.assertEqual(status['status'], warmup.STATUS_DEGRADED)
+        self.assertFalse(status['content_loaded'])
+        self.assertEqual([h['id'] for h in warmup.get_fallback_hotels(5, exclude_ids={1})], [2])
+
+    def test_recommendations_served_from_fallback_while_loading(self):
+        warmup._popular_fallback[:] = [{'id': 1, 'name': 'A'}, {'id': 2, 'name': 'B'}]
+
+        request = RequestFactory().get('/api/recommend/1/')
+        response = views.get_recommendations(request, 1)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['recommendation_type'], 'popular_fallback')
+        self.assertEqual([h['id'] for h in response.data['recommendations']], [2])
+
+    @patch('recommender.views.get_popular_hotels_list')
+    def test_filtered_fallback_while_loading_respects_filter(self, mock_popular):
+        # Danh sách tính sẵn không xét filter -> không được dùng cho request có filter
+        warmup._popular_fallback[:] = [{'id': 1, 'name': 'A'}, {'id': 2, 'name': 'B'}]
+        mock_popular.return_value = [{'id': 1, 'name': 'A'}, {'id': 3, 'name': 'C'}, {'id': 4, 'name': 'D'}]
+
+        content = views.get_recommendations(RequestFactory().get('/api/recommend/1/?max_price=1000000&limit=1'), 1)
+        smart = views.get_smart_recommendations(RequestFactory().get('/api/recommend/smart/7/?min_star=4'), 7)
+
+        self.assertEqual([h['id'] for h in content.data['recommendations']], [3])
+        self.assertEqual([h['id'] for h in smart.data['recommendations']], [1, 3, 4])
+        filters_used = [c.kwargs['hotel_filter'] for c in mock_popular.call_args_list]
+        self.assertEqual(filters_used, [filters.HotelFilter(max_price=1000000.0), filters.HotelFilter(min_star=4)])
+
+
+class SnapshotTest(TestCase):
+
+    def setUp(self):
+        previous = snapshot.current()
+        self.addCleanup(snapshot.publish, content=previous.content, cf=previous.cf, version=previous.version)
+
+    def test_publish_swaps_reference_and_keeps_pinned_snapshot(self):
+        snapshot.publish(content={'neighbor_idx': np.array([[1], [0]])}, cf={}, version='v1')
+        pinned = snapshot.current()
+
+        snapshot.publish(cf={'user_ids': [1]}, version='v2')
+        latest = snapshot.current()
+
+        self.assertEqual(pinned.version, 'v1')
+        self.assertEqual(dict(pinned.cf), {})
+        self.assertEqual(latest.version, 'v2')
+        # Phần không truyền vào được giữ nguyên từ snapshot cũ
+        self.assertIs(latest.content, pinned.content)
+        self.assertEqual(collaborative.cf_global_data['user_ids'], [1])
+
+    def test_snapshot_is_read_only(self):
+        snap = snapshot.publish(content={'neighbor_idx': np.zeros((2, 1))})
+        with self.assertRaises(TypeError):
+            snap.content['df'] = None
+        with self.assertRaises(ValueError):
+            snap.content['neighbor_idx'][0, 0] = 1
+
+
+class RetrainJobTest(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        override = override_settings(RECOMMENDER_ARTIFACT_DIR=self.tmp_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_job_records_stages_and_deduplicates(self):
+        release = threading.Event()
+
+        def fake_train_all(stage):
+            with stage('content_based'):
+                release.wait(5)
+            with stage('collaborative'):
+                pass
+            return {'content_based': True, 'collaborative': True, 'version': 'v1'}
+
+        with patch('recommender.training.train_all', side_effect=fake_train_all), \
+                patch('recommender.warmup.refresh_status'):
+            job, deduplicated = jobs.submit_retrain()
+            self.assertFalse(deduplicated)
+
+            # Job đang chạy -> submit lần 2 trả về cùng job_id
+            second, deduplicated = jobs.submit_retrain()
+            self.assertTrue(deduplicated)
+            self.assertEqual(second['job_id'], job['job_id'])
+
+            release.set()
+            final = jobs.wait_for_job(job['job_id'], timeout=5, poll_interval=0.01)
+
+        self.assertEqual(final['status'], jobs.STATUS_SUCCEEDED)
+        self.assertEqual([st['name'] for st in final['stages']], ['content_based', 'collaborative'])
+        self.assertTrue(all(st['duration_seconds'] is not None for st in final['stages']))
+        self.assertEqual(final['result']['version'], 'v1')
+        self.assertIsNone(jobs._active_job_id())
+
+    def test_lock_released_when_holder_process_dies(self):
+        lock_path = jobs.get_jobs_dir() / jobs.LOCK_FILE
+        holder = subprocess.Popen([sys.executable, '-c', (
+            'import fcntl, os, sys, time\n'
+            'fd = os.open(sys.argv[1], os.O_RDWR | os.O_CREAT)\n'
+            'fcntl.flock(fd, fcntl.LOCK_EX)\n'
+            'os.pwrite(fd, b"deadbeef0000", 0)\n'
+            'print("locked", flush=True)\n'
+            'time.sleep(60)\n'
+        ), str(lock_path)], stdout=subprocess.PIPE, text=True)
+        self.addCleanup(holder.wait)
+        self.addCleanup(holder.kill)
+        holder.stdout.readline()
+
+        self.assertEqual(jobs._active_job_id(), 'deadbeef0000')
+        self.assertFalse(jobs._acquire_lock('fresh0000000'))
+
+        holder.kill()
+        holder.wait()
+        self.assertIsNone(jobs._active_job_id())
+        self.assertTrue(jobs._acquire_lock('fresh0000000'))
+        self.assertEqual(jobs._active_job_id(), 'fresh0000000')
+        jobs._release_lock('fresh0000000')
+        self.assertIsNone(jobs._active_job_id())
+
+    def test_job_of_dead_worker_reported_failed(self):
+        worker = subprocess.Popen([sys.executable, '-c', 'pass'])
+        worker.wait()
+        stages = [{'name': 'content_based', 'status': 'done', 'started_at': None, 'duration_seconds': 1.0},
+                  {'name': 'collaborative', 'status': jobs.STATUS_RUNNING, 'started_at': None, 'duration_seconds': None}]
+        jobs._write_job({
+            'job_id': 'dead00000000', 'status': jobs.STATUS_RUNNING, 'pid': worker.pid, 'finished_at': None,
+            'current_stage': 'collaborative', 'stages': stages, 'result': None, 'error': None,
+        })
+
+        job = jobs.get_job('dead00000000')
+        self.assertEqual((job['status'], job['error']), (jobs.STATUS_FAILED, 'worker exited'))
+        self.assertEqual([st['status'] for st in job['stages']], ['done', jobs.STATUS_FAILED])
+        self.assertIsNotNone(job['finished_at'])
+        # Đã ghi lại vào file -> workers khác cũng thấy failed
+        persisted = json.loads(jobs._job_path('dead00000000').read_text(encoding='utf-8'))
+        self.assertEqual(persisted['status'], jobs.STATUS_FAILED)
+        self.assertEqual(jobs.wait_for_job('dead00000000', timeout=0)['status'], jobs.STATUS_FAILED)
+
+    def test_unknown_job(self):
+        self.assertIsNone(jobs.get_job('doesnotexist'))
+        self.assertIsNone(jobs.get_job('../etc'))
+
+
+class StreamingExtractionTest(TestCase):
+
+    def test_interaction_buffer_grows_and_keeps_max(self):
+        buffer = collaborative._InteractionBuffer(capacity=2)
+        buffer.extend(np.array([1, 1, 2, 0]), np.array([10, 10, 10, 5]), np.array([2.0, 4.5, 3.0, 9.0]))
+        buffer.extend(np.array([2, 1]), np.array([10, 20]), np.array([1.0, 5.0]))
+
+        # Dòng thiếu user (0) bị bỏ
+        self.assertEqual(buffer.size, 5)
+        users, hotels, ratings, _ = buffer.max_by_pair()
+        self.assertEqual(list(zip(users, hotels, ratings)), [(1, 10, 4.5), (1, 20, 5.0), (2, 10, 3.0)])
+
+    def test_iter_value_chunks_uses_keyset_pagination(self):
+        queryset = MagicMock()
+        sliced = queryset.filter.return_value.order_by.return_value.values_list.return_value
+        sliced.__getitem__.side_effect = [[(1, 'a'), (4, 'b')], [(9, 'c')]]
+
+        chunks = list(collaborative._iter_value_chunks(queryset, ('name',), chunk_size=2))
+
+        self.assertEqual(chunks, [(('a', 'b'),), (('c',),)])
+        self.assertEqual([c.kwargs for c in queryset.filter.call_args_list], [{'id__gt': 0}, {'id__gt': 4}])
+
+
+class VectorizedScoringTest(TestCase):
+
+    def test_time_decay_factors_match_scalar(self):
+        now = timezone.now()
+        times = [now - datetime.timedelta(days=d, hours=5) for d in (0, 3, 10, 500)] + [now + datetime.timedelta(days=2), None]
+
+        factors = collaborative.time_decay_factors(collaborative._timestamp_column(times), now.timestamp())
+
+        expected = [collaborative.calculate_time_decay(t) for t in times]
+        np.testing.assert_allclose(factors, expected)
+        self.assertEqual(factors[3], collaborative.MIN_DECAY_FACTOR)
+
+    def test_view_engagement_scores(self):
+        scores = collaborative.view_engagement_scores(
+            np.array([10.0, 90.0, 200.0, 200.0]),
+            np.array([False, False, False, True]),
+            np.array([False, True, False, True]),
+        )
+        np.testing.assert_allclose(scores, [2.0, 3.5, 3.5, 5.0])
+
+    def test_weight_config_validated(self):
+        with self.assertRaises(ImproperlyConfigured):
+            collaborative.CFWeightConfig(decay_rate=-0.1)
+        with self.assertRaises(ImproperlyConfigured):
+            collaborative.CFWeightConfig(min_decay_factor=0)
+        with override_settings(RECOMMENDER_CF_WEIGHTS={'decay_rat': 0.1}):
+            with self.assertRaises(ImproperlyConfigured):
+                collaborative.CFWeightConfig.from_settings()
+        with override_settings(RECOMMENDER_CF_WEIGHTS={'decay_rate': 0.1}):
+            self.assertEqual(collaborative.CFWeightConfig.from_settings().decay_rate, 0.1)
+
+    def test_max_by_pair_picks_highest_decayed_event(self):
+        buffer = collaborative._InteractionBuffer()
+        # Booking cũ (5.0, 100 ngày trước -> 1.0) vs view mới (3.0, hôm nay)
+        buffer.extend(np.array([1, 1]), np.array([10, 10]), np.array([5.0, 3.0]), np.array([900, 1000], dtype=np.int32))
+
+        _, _, base, day = buffer.max_by_pair(now_day=1000)
+
+        self.assertEqual((base[0], day[0]), (3.0, 1000))
+
+    @patch('recommender.collaborative.build_user_item_matrix')
+    def test_decay_applied_at_query_time(self, mock_build):
+        today = int(timezone.now().timestamp() // collaborative.SECONDS_PER_DAY)
+        mock_build.return_value = pd.DataFrame({
+            'user_id': [2, 1, 1],
+            'hotel_id': [1, 2, 1],
+            'rating': [0.0, 0.0, 0.0],
+            'base_rating': [4.0, 2.0, 5.0],
+            'interaction_day': np.array([today, today - 10, today], dtype=np.int32),
+        })
+        cf_model = collaborative.build_collaborative_model()
+
+        # Ratings lưu trữ là base score, chưa decay
+        np.testing.assert_allclose(cf_model['user_item_matrix_sparse'].toarray(), [[5.0, 2.0], [4.0, 0.0]])
+
+        now_ts = timezone.now().timestamp()
+        fresh = collaborative.decayed_ratings(cf_model, rows=[0], now_ts=now_ts).toarray()
+        later = collaborative.decayed_ratings(cf_model, rows=[0], now_ts=now_ts + 10 * 86400).toarray()
+        np.testing.assert_allclose(fresh, [[5.0, 2.0 / 1.5]])
+        np.testing.assert_allclose(later, [[5.0 / 1.5, 2.0 / 2.0]])
+
+
+class DeltaBufferTest(TestCase):
+
+    def setUp(self):
+        delta.clear()
+        today = int(timezone.now().timestamp() // collaborative.SECONDS_PER_DAY)
+        self.today = today
+        cf_model = collaborative.cf_model_from_interactions(
+            np.array([1, 1, 2, 2]), np.array([10, 20, 10, 30]),
+            np.array([5.0, 4.0, 5.0, 3.0]), np.full(4, today, dtype=np.int32)
+        )
+        snapshot.publish(cf=cf_model)
+
+    def tearDown(self):
+        delta.clear()
+
+    def test_new_user_and_hotel_merged_on_read(self):
+        self.assertEqual(collaborative.get_user_based_recommendations(3), [])
+
+        delta.add_event(3, 10, 5.0, self.today)
+        delta.add_event(3, 40, 4.0, self.today)
+        delta.add_event(1, 40, 4.0, self.today)
+
+        recs = collaborative.get_user_based_recommendations(3)
+        self.assertEqual({r['hotel_id'] for r in recs}, {20, 30})
+        # Hotel mới (40) có item-based neighbors ngay (10 có 2 users chung >= min support)
+        item_recs = collaborative.get_item_based_recommendations(40)
+        self.assertEqual(item_recs[0]['hotel_id'], 10)
+        # Snapshot base không đổi
+        self.assertNotIn(3, snapshot.current().cf['user_ids'])
+
+    def test_delta_item_similarity_matches_full_cosine(self):
+        delta.add_event(3, 10, 5.0, self.today)
+        delta.add_event(3, 30, 4.0, self.today)
+        delta.add_event(1, 30, 1.0, self.today)
+        cf_data = delta.merged_cf(snapshot.current().cf)
+        h_idx = cf_data['hotel_ids'].index(30)
+
+        idx, scores = collaborative._similar_items_from_ratings(cf_data, h_idx, 5)
+
+        items = collaborative.decayed_ratings(cf_data).T.toarray()
+        expected = cosine_similarity(items[[h_idx]], items).ravel()
+        np.testing.assert_allclose(scores, expected[idx])
+        self.assertEqual(idx.tolist(), [cf_data['hotel_ids'].index(10)])
+
+    def test_compaction_folds_into_base(self):
+        delta.add_event(3, 10, 5.0, self.today)
+        delta.add_event(1, 30, 2.0, self.today)
+
+        self.assertTrue(delta.compact())
+
+        cf_data = snapshot.current().cf
+        self.assertEqual(delta.pending_events(), 0)
+        self.assertEqual(cf_data['user_ids'], [1, 2, 3])
+        self.assertEqual(cf_data['user_item_matrix_sparse'].shape, (3, 3))
+        self.assertEqual(cf_data['user_item_matrix_sparse'][0, 2], 2.0)
+
+    def test_compaction_matches_full_retrain_on_touched_rows(self):
+        rng = np.random.default_rng(0)
+        events = collaborative._InteractionBuffer()
+        events.extend(rng.integers(1, 40, 300), rng.integers(1, 25, 300), rng.uniform(1, 5, 300),
+                      np.full(300, self.today, dtype=np.int32))
+        base = collaborative.cf_model_from_interactions(*events.max_by_pair(self.today))
+        new = collaborative._InteractionBuffer()
+        new.extend(np.array([5, 41, 41]), np.array([3, 3, 26]), np.array([5.0, 4.0, 2.0]),
+                   np.full(3, self.today, dtype=np.int32))
+
+        merged = collaborative.fold_in_interactions(base, *new.max_by_pair(self.today), now_day=self.today)
+
+        events.extend(new.user_id[:3], new.hotel_id[:3], new.rating[:3], new.day[:3])
+        full = collaborative.cf_model_from_interactions(*events.max_by_pair(self.today))
+        self.assertEqual(merged['user_ids'], full['user_ids'])
+        self.assertEqual((merged['user_item_matrix_sparse'] != full['user_item_matrix_sparse']).nnz, 0)
+        np.testing.assert_allclose(
+            merged['user_vectors_normalized'].toarray(), full['user_vectors_normalized'].toarray(), rtol=1e-6
+        )
+        touched = [full['hotel_ids'].index(3), full['hotel_ids'].index(26)]
+        np.testing.assert_allclose(
+            merged['item_neighbor_scores'][touched], full['item_neighbor_scores'][touched], rtol=1e-5
+        )
+
+    def test_compaction_skipped_when_snapshot_replaced(self):
+        delta.add_event(3, 10, 5.0, self.today)
+        stale = snapshot.current()
+        snapshot.publish(version='reloaded')
+
+        self.assertIsNone(snapshot.publish(cf={}, expected=stale))
+        self.assertEqual(delta.pending_events(), 1)
+
+
+class UserNeighborTest(TestCase):
+
+    def test_on_demand_neighbors_match_cosine(self):
+        rng = np.random.default_rng(0)
+        ratings = sparse_random(30, 12, density=0.3, format='csr', random_state=1) * 5
+        rows, cols = ratings.nonzero()
+        cf_model = collaborative.cf_model_from_interactions(
+            rows + 1, cols + 1, np.asarray(ratings[rows, cols]).ravel(),
+            np.full(rows.size, collaborative.NO_INTERACTION_DAY, dtype=np.int32)
+        )
+        u_idx = int(rng.integers(0, cf_model['user_item_matrix_sparse'].shape[0]))
+
+        idx, scores = collaborative.find_similar_users(cf_model, u_idx, k=5)
+
+        matrix = cf_model['user_item_matrix_sparse']
+        expected = cosine_similarity(matrix[u_idx], matrix).ravel()
+        expected[u_idx] = 0
+        np.testing.assert_allclose(scores, np.sort(expected)[::-1][:len(scores)], rtol=1e-5)
+        np.testing.assert_allclose(expected[idx], scores, rtol=1e-5)
+
+    def test_neighbor_cache_bounded_and_reset_per_model(self):
+        cache = collaborative._NeighborCache(max_size=2)
+        owner = object()
+        for key in range(3):
+            cache.put(owner, key, key)
+
+        self.assertIsNone(cache.get(owner, 0))
+        self.assertEqual(cache.get(owner, 2), 2)
+        self.assertIsNone(cache.get(object(), 2))
+
+
+class ItemNeighborTableTest(TestCase):
+
+    def test_min_support_prunes_pairs(self):
+        # Users x Hotels: hotel 0 & 1 có 2 users chung, hotel 2 chỉ chung 1 user với hotel 0
+        ratings = np.array([
+            [5.0, 4.0, 0.0],
+            [3.0, 5.0, 0.0],
+            [4.0, 0.0, 5.0],
+        ])
+        items = csr_matrix(ratings.T)
+        idx, scores = neighbors.build_topk_neighbors(
+            items, 2, support_matrix=(items > 0).astype(np.float32), min_support=2
+        )
+
+        self.assertEqual(idx.dtype, np.int32)
+        self.assertEqual(idx[0].tolist(), [1, -1])
+        self.assertEqual(idx[2].tolist(), [-1, -1])
+        self.assertEqual(scores[2].tolist(), [0.0, 0.0])
+
+    @override_settings(RECOMMENDER_ITEM_TOP_K=2, RECOMMENDER_ITEM_MIN_SUPPORT=1)
+    def test_item_based_reads_neighbor_table(self):
+        cf_model = collaborative.cf_model_from_interactions(
+            np.array([1, 1, 2, 2, 3]), np.array([10, 20, 10, 20, 30]),
+            np.array([5.0, 4.0, 3.0, 5.0, 4.0]), np.full(5, collaborative.NO_INTERACTION_DAY, dtype=np.int32)
+        )
+        self.assertNotIn('item_similarity_sparse', cf_model)
+        self.assertEqual(cf_model['item_neighbor_idx'].shape, (3, 2))
+
+        recs = collaborative.get_item_based_recommendations(10, snap=snapshot.ModelSnapshot(cf=cf_model))
+        self.assertEqual([r['hotel_id'] for r in recs], [20])
+
+
+class ImplicitALSTest(TestCase):
+
+    def test_conjugate_gradient_matches_exact_solve(self):
+        rng = np.random.default_rng(0)
+        confidence = sparse_random(8, 6, density=0.5, format='csr', random_state=3)
+        confidence.data = 1.0 + 10.0 * confidence.data
+        Y = rng.normal(size=(6, 4))
+        X = np.zeros((8, 4))
+
+        als.solve_factors(confidence, X, Y, regularization=0.1, cg_steps=10, block_nnz=5)
+
+        for u in range(8):
+            row = confidence[u]
+            Y_obs = Y[row.indices]
+            a = Y.T @ Y + (Y_obs.T * (row.data - 1)) @ Y_obs + 0.1 * np.eye(4)
+            np.testing.assert_allclose(X[u], np.linalg.solve(a, Y_obs.T @ row.data), atol=1e-6)
+
+    @override_settings(RECOMMENDER_CF_ENGINE='als', RECOMMENDER_ALS_FACTORS=4, RECOMMENDER_ALS_ITERATIONS=15)
+    def test_als_engine_separates_groups(self):
+        # Users 1-4 thích hotels 10-13, users 5-8 thích hotels 20-23; mỗi user thiếu 1 hotel của nhóm mình
+        users, hotels = [], []
+        for group, hotel_base in ((range(1, 5), 10), (range(5, 9), 20)):
+            for i, user in enumerate(group):
+                for h in range(4):
+                    if h != i:
+                        users.append(user)
+                        hotels.append(hotel_base + h)
+        cf_model = collaborative.cf_model_from_interactions(
+            np.array(users), np.array(hotels), np.full(len(users), 5.0),
+            np.full(len(users), collaborative.NO_INTERACTION_DAY, dtype=np.int32)
+        )
+        snap = snapshot.ModelSnapshot(cf=cf_model)
+
+        self.assertEqual(cf_model['engine'], collaborative.CF_ENGINE_ALS)
+        self.assertEqual(cf_model['als_item_factors'].shape, (8, 4))
+        recs = collaborative.get_user_based_recommendations(1, limit=1, snap=snap)
+        self.assertEqual(recs, [{'hotel_id': 10, 'cf_score': recs[0]['cf_score']}])
+        item_recs = collaborative.get_item_based_recommendations(20, limit=3, snap=snap)
+        self.assertTrue(all(20 < r['hotel_id'] < 24 for r in item_recs))
+
+    @override_settings(RECOMMENDER_CF_ENGINE='svd')
+    def test_unknown_engine_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            collaborative.get_cf_engine()
+
+
+class ANNIndexTest(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(20, 16))
+        points = centers[rng.integers(0, 20, 600)] + 0.3 * rng.normal(size=(600, 16))
+        self.vectors = (points / np.linalg.norm(points, axis=1, keepdims=True)).astype(np.float32)
+
+    def test_full_probe_matches_exact_search(self):
+        index = ann.IVFIndex.build(self.vectors, n_lists=16)
+
+        self.assertEqual(index.offsets[-1], 600)
+        self.assertEqual(ann.measure_recall(index, self.vectors, k=10, nprobe=16), 1.0)
+        recall_low = ann.measure_recall(index, self.vectors, k=10, nprobe=1)
+        self.assertGreater(recall_low, 0.3)
+        self.assertLessEqual(recall_low, 1.0)
+
+        restored = ann.IVFIndex.from_arrays(index.to_arrays('ivf'), 'ivf')
+        idx, _ = restored.search(self.vectors, self.vectors[[5]], 3, nprobe=16, exclude_ids=[5])
+        exact, _ = ann.exact_search(self.vectors, self.vectors[[5]], 3, exclude_ids=np.array([5]))
+        self.assertEqual(idx[0].tolist(), exact[0].tolist())
+
+    def test_queries_only_score_their_own_probed_lists(self):
+        index = ann.IVFIndex.build(self.vectors, n_lists=16)
+        list_of = np.repeat(np.arange(index.n_lists), np.diff(index.offsets))[np.argsort(index.items)]
+        queries = np.random.default_rng(1).normal(size=(50, 16)).astype(np.float32)
+
+        idx, _ = index.search(self.vectors, queries, 30, nprobe=2)
+
+        probes = index._probes(queries, 2)
+        for row, probed in zip(idx, probes):
+            self.assertTrue(set(list_of[row[row >= 0]].tolist()) <= set(probed.tolist()))
+
+    def test_sparse_neighbor_table_with_support(self):
+        matrix = csr_matrix(np.abs(self.vectors[:100]))
+        support = (matrix > 0.2).astype(np.float32)
+        index = ann.IVFIndex.build(matrix, n_lists=4)
+
+        idx, scores = index.neighbor_table(matrix, 5, nprobe=4, support_matrix=support, min_support=3)
+        exact_idx, exact_scores = neighbors.build_topk_neighbors(matrix, 5, support_matrix=support, min_support=3)
+
+        self.assertIsNotNone(index.projection)
+        np.testing.assert_allclose(scores, exact_scores, rtol=1e-5)
+        self.assertTrue(np.all(idx[idx >= 0] != np.repeat(np.arange(100), 5).reshape(100, 5)[idx >= 0]))
+
+
+def _diversity_catalog(hotels):
+    """Hotel catalog chỉ có location_name / type: {hotel_id: (location, type)}."""
+    rows = {}
+    for hotel_id, (location, hotel_type) in hotels.items():
+        row = {field: None for field in catalog._HOTEL_FIELDS.values()}
+        row.update(location__name=location, type=hotel_type, updated_at=None)
+        rows[hotel_id] = row
+    watermarks = {'hotels_updated_at': None, 'rooms_updated_at': None, 'image_id': 0, 'full_loaded_at': 0}
+    return catalog._build(rows, {}, {}, watermarks)
+
+
+class BatchRecommendationTest(TestCase):
+
+    def _cf_model(self, **kwargs):
+        ratings = sparse_random(40, 25, density=0.2, format='csr', random_state=3) * 5
+        rows, cols = ratings.nonzero()
+        with override_settings(RECOMMENDER_ITEM_MIN_SUPPORT=1, **kwargs):
+            return collaborative.cf_model_from_interactions(
+                rows + 1, cols + 100, np.asarray(ratings[rows, cols]).ravel(),
+                np.full(rows.size, collaborative.NO_INTERACTION_DAY, dtype=np.int32)
+            )
+
+    def _assert_batch_matches_single(self, cf_model):
+        snap = snapshot.ModelSnapshot(cf=cf_model)
+        user_ids = [1, 5, 17, 40, 12345]
+        batch = collaborative.get_user_based_recommendations_batch(user_ids, limit=5, snap=snap)
+
+        self.assertEqual(list(batch), user_ids)
+        self.assertEqual(batch[12345], [])
+        for user_id in user_ids[:-1]:
+            single = collaborative.get_user_based_recommendations(user_id, limit=5, snap=snap)
+            self.assertEqual(
+                [(r['hotel_id'], r['cf_score']) for r in batch[user_id]],
+                [(r['hotel_id'], r['cf_score']) for r in single]
+            )
+
+    def test_user_based_batch_matches_single(self):
+        self._assert_batch_matches_single(self._cf_model())
+
+    def test_als_batch_matches_single(self):
+        self._assert_batch_matches_single(self._cf_model(RECOMMENDER_CF_ENGINE=collaborative.CF_ENGINE_ALS))
+
+    def _content_model(self):
+        hotel_ids = np.arange(100, 125)
+        df = pd.DataFrame({'id': hotel_ids})
+        rng = np.random.default_rng(0)
+        neighbor_idx = np.array([rng.permutation(np.delete(np.arange(25), i))[:8] for i in range(25)], dtype=np.int32)
+        # Scores làm tròn -> có nhiều hotels cùng score
+        neighbor_scores = np.sort(np.round(rng.random((25, 8)), 1).astype(np.float32), axis=1)[:, ::-1].copy()
+        return {'df': df, 'indices': pd.Series(df.index, index=df['id']),
+                'neighbor_idx': neighbor_idx, 'neighbor_scores': neighbor_scores}
+
+    def test_multi_seed_hybrid_matches_per_seed(self):
+        from . import hybrid
+
+        snap = snapshot.ModelSnapshot(content=self._content_model(), cf=self._cf_model())
+        hotel_catalog = _diversity_catalog({
+            hid: (f'L{hid % 3}', 'HOTEL' if hid % 2 else 'VILLA') for hid in range(100, 125)
+        })
+        seeds_by_user = {1: [100, 107, 100, 131], 5: [103], 17: [], 12345: [110, 111]}
+        limit = 4
+
+        with patch.object(catalog, '_current', hotel_catalog), \
+                patch('recommender.diversity.hotel_codes', wraps=diversity.hotel_codes) as mock_codes:
+            user_recs = collaborative.get_user_based_recommendations_batch(list(seeds_by_user), limit * 2, snap=snap)
+            merged = hybrid.get_multi_seed_hybrid_batch(seeds_by_user, user_recs, 0.6, 0.4, limit, snap=snap)
+            self.assertEqual(mock_codes.call_count, 1)
+
+            for user_id, seeds in seeds_by_user.items():
+                # Cách cũ: get_hybrid_recommendations cho từng hotel đã xem rồi cộng dồn
+                expected = {}
+                for seed in seeds:
+                    recs = hybrid.get_hybrid_recommendations(seed, user_id, 0.6, 0.4, limit, snap=snap)
+                    for rec in recs:
+                        if rec['hotel_id'] in seeds:
+                            continue
+                        entry = expected.setdefault(rec['hotel_id'], {
+                            'hotel_id': rec['hotel_id'], 'hybrid_score': 0.0, 'content_score': 0.0,
+                            'collab_score': 0.0, 'source_hotels': []
+                        })
+                        for key in ('hybrid_score', 'content_score', 'collab_score'):
+                            entry[key] += rec[key]
+                        entry['source_hotels'].append(seed)
+                self.assertEqual(list(merged[user_id].items()), list(expected.items()))
+        self.assertTrue(merged[1])
+
+    @patch('recommender.views.get_min_room_prices', return_value={})
+    @patch('recommender.views.get_hotel_thumbnails', return_value={})
+    @patch('recommender.training.reload_if_stale', return_value=None)
+    def test_content_batch_endpoint(self, mock_reload, mock_thumbnails, mock_prices):
+        df = pd.DataFrame({
+            'id': [1, 2, 3], 'name': ['A', 'B', 'C'], 'address': ['x', 'y', 'z'], 'star_rating': [3, 4, 5],
+            'location__name': ['L1', 'L2', 'L1'], 'location__parent__name': [None, None, None],
+        })
+        content = {
+            'df': df,
+            'indices': pd.Series(df.index, index=df['id']),
+            'neighbor_idx': np.array([[2, 1], [0, 2], [0, 1]], dtype=np.int32),
+            'neighbor_scores': np.array([[0.9, 0.2], [0.5, 0.4], [0.8, 0.1]], dtype=np.float32),
+        }
+        previous = snapshot.current()
+        self.addCleanup(snapshot.publish, content=previous.content, cf=previous.cf)
+        snapshot.publish(content=content, cf={})
+
+        request = RequestFactory().post(
+            '/api/recommend/batch/', {'hotel_ids': [1, 3, 99], 'limit': 1}, content_type='application/json'
+        )
+        response = views.get_recommendations_batch(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['not_found'], [99])
+        self.assertEqual([r['id'] for r in response.data['results'][1]['recommendations']], [3])
+        self.assertEqual([r['id'] for r in response.data['results'][3]['recommendations']], [1])
+        # Thumbnail / giá phòng của cả batch: 1 query mỗi loại
+        self.assertEqual(mock_thumbnails.call_count, 1)
+        self.assertEqual(sorted(mock_thumbnails.call_args[0][0]), [1, 3])
+
+    def test_batch_size_limit(self):
+        request = RequestFactory().post('/api/recommend/smart/batch/', {'user_ids': [1, 2, 3]}, content_type='application/json')
+        with override_settings(RECOMMENDER_BATCH_MAX_IDS=2):
+            response = views.get_smart_recommendations_batch(request)
+        self.assertEqual(response.status_code, 400)
+
+
+class MaterializedStoreTest(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        override = override_settings(
+            RECOMMENDER_MATERIALIZED_PATH=f'{self.tmp_dir.name}/store.sqlite3',
+            RECOMMENDER_MATERIALIZED_TOP_N=3,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    @staticmethod
+    def _entries(user_ids, limit, content_weight, collab_weight, snap=None, hotel_filter=None):
+        return {uid: {
+            'is_cold_start': uid == 99,
+            'recommendation_type': 'hybrid',
+            'recommendations': [{'hotel_id': uid * 10 + i} for i in range(limit)],
+        } for uid in user_ids}
+
+    def test_rebuild_shards_and_lookup(self):
+        snap = snapshot.ModelSnapshot(version='v1', content={'df': 1}, cf={'user_ids': [3, 1, 2, 99]})
+        with patch('recommender.views.compute_smart_recommendations', side_effect=self._entries) as mock_compute, \
+                patch('recommender.snapshot.current', return_value=snap):
+            total = materialized.rebuild(snap, processes=1, shard_size=2)
+
+        # Shards theo khoảng user_id liên tiếp, user cold start không được lưu
+        self.assertEqual([c.args[0] for c in mock_compute.call_args_list], [[1, 2], [3, 99]])
+        self.assertEqual(total, 3)
+
+        hits = materialized.lookup([1, 2, 99, 7], 'v1', 3, materialized.CONTENT_WEIGHT, materialized.COLLAB_WEIGHT)
+        self.assertEqual(sorted(hits), [1, 2])
+        self.assertEqual([r['hotel_id'] for r in hits[1]['recommendations']], [10, 11, 12])
+
+        self.assertEqual(materialized.lookup([1], 'v2', 3, 0.6, 0.4), {})
+        self.assertEqual(materialized.lookup([1], 'v1', 3, 0.5, 0.5), {})
+        self.assertEqual(materialized.lookup([1], 'v1', 5, 0.6, 0.4), {})
+
+        materialized.invalidate(1)
+        self.assertEqual(sorted(materialized.lookup([1, 2], 'v1', 3, 0.6, 0.4)), [2])
+
+    def test_store_hit_matches_live_computation_at_same_limit(self):
+        # Candidate pool phụ thuộc limit: top-2 tính live không phải là prefix của top-3
+        def pool_entries(user_ids, limit, content_weight, collab_weight, snap=None, hotel_filter=None):
+            return {uid: {
+                'is_cold_start': False,
+                'recommendation_type': 'hybrid',
+                'recommendations': [{'hotel_id': uid * 100 + limit * 10 + i} for i in range(limit)],
+            } for uid in user_ids}
+
+        snap = snapshot.ModelSnapshot(version='v1', content={'df': 1}, cf={'user_ids': [1]})
+        with patch('recommender.views.compute_smart_recommendations', side_effect=pool_entries), \
+                patch('recommender.snapshot.current', return_value=snap):
+            materialized.rebuild(snap, processes=1)
+
+        live = pool_entries([1], 3, 0.6, 0.4)[1]
+        hit = materialized.lookup([1], 'v1', 3, 0.6, 0.4)[1]
+        self.assertEqual(hit['recommendations'], live['recommendations'])
+        # Limit khác top-N -> tính live thay vì cắt kết quả đã lưu
+        self.assertEqual(materialized.lookup([1], 'v1', 2, 0.6, 0.4), {})
+
+    def test_in_process_rebuild_uses_pinned_snapshot(self):
+        snap = snapshot.ModelSnapshot(version='v1', content={'df': 1}, cf={'user_ids': [1, 2]})
+        newer = snapshot.ModelSnapshot(version='v2', content={'df': 2}, cf={'user_ids': [1, 2]})
+        with patch('recommender.views.compute_smart_recommendations', side_effect=self._entries) as mock_compute, \
+                patch('recommender.snapshot.current', return_value=newer):
+            total = materialized.rebuild(snap, processes=1)
+
+        self.assertEqual(total, 2)
+        self.assertIs(mock_compute.call_args.kwargs['snap'], snap)
+
+    def test_events_compared_against_data_cutoff(self):
+        cutoff = time.time() - 60
+        snap = snapshot.ModelSnapshot(version='v1', content={'df': 1}, cf={'user_ids': [1, 2], 'data_cutoff': cutoff})
+        conn = materialized._connect()
+        # User 1: event đã có trong dữ liệu train, user 2: event sau cut-off (trước khi rebuild bắt đầu)
+        conn.executemany('INSERT INTO user_events (user_id, last_event_at) VALUES (?, ?)',
+                         [(1, cutoff - 10), (2, cutoff + 10)])
+        with patch('recommender.views.compute_smart_recommendations', side_effect=self._entries), \
+                patch('recommender.snapshot.current', return_value=snap):
+            materialized.rebuild(snap, processes=1)
+
+        self.assertEqual(conn.execute('SELECT user_id FROM user_events').fetchall(), [(2,)])
+        self.assertEqual(sorted(materialized.lookup([1, 2], 'v1', 3, 0.6, 0.4)), [1])
+
+    def test_refresh_recomputes_only_stale_users(self):
+        snap = snapshot.ModelSnapshot(version='v1', content={'df': 1}, cf={'user_ids': [1, 2, 3], 'data_cutoff': 1.0})
+        with patch('recommender.views.compute_smart_recommendations', side_effect=self._entries), \
+                patch('recommender.snapshot.current', return_value=snap):
+            materialized.rebuild(snap, processes=1)
+        conn = materialized._connect()
+        # User 1: action mới, user 3: quá max age, user 2: còn fresh
+        materialized.invalidate(1)
+        conn.execute('UPDATE smart_recommendations SET computed_at = 0 WHERE user_id = 3')
+        self.assertEqual(sorted(materialized.lookup([1, 2, 3], 'v1', 3, 0.6, 0.4)), [2])
+
+        with patch('recommender.views.compute_smart_recommendations', side_effect=self._entries) as mock_compute, \
+                patch('recommender.snapshot.current', return_value=snap):
+            self.assertEqual(materialized._refresh_in_background(), 2)
+            # Process khác (hoặc lần gọi sau) trong cùng chu kỳ không refresh lại
+            self.assertEqual(materialized._refresh_in_background(), 0)
+
+        mock_compute.assert_called_once()
+        self.assertEqual(sorted(mock_compute.call_args.args[0]), [1, 3])
+        self.assertEqual(sorted(materialized.lookup([1, 2, 3], 'v1', 3, 0.6, 0.4)), [1, 2, 3])
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM user_events').fetchone()[0], 0)
+
+    @patch('recommender.training.reload_if_stale', return_value=None)
+    def test_endpoint_computes_only_missing_users(self, mock_reload):
+        snap = snapshot.ModelSnapshot(version='v1', content={'df': 1}, cf={'user_ids': [1]})
+        with patch('recommender.views.compute_smart_recommendations', side_effect=self._entries), \
+                patch('recommender.snapshot.current', return_value=snap):
+            materialized.rebuild(snap, processes=1)
+
+            with patch('recommender.views.compute_smart_recommendations', side_effect=self._entries) as mock_compute:
+                request = RequestFactory().post(
+                    '/api/recommend/smart/batch/', {'user_ids': [1, 2], 'limit': 3}, content_type='application/json'
+                )
+                response = views.get_smart_recommendations_batch(request)
+
+        self.assertEqual(response.status_code, 200)
+        mock_compute.assert_called_once()
+        self.assertEqual(mock_compute.call_args.args[0], [2])
+        self.assertTrue(response.data['results'][1]['materialized'])
+        self.assertFalse(response.data['results'][2]['materialized'])
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'recommender': {
+        'BACKEND': 'recommender.response_cache.LocMemCache',
+        'LOCATION': 'recommender-test',
+        'TIMEOUT': 60,
+        'OPTIONS': {'MAX_ENTRIES': 4, 'CULL_FREQUENCY': 2},
+    },
+})
+class ResponseCacheTest(TestCase):
+
+    def setUp(self):
+        response_cache.reset_stats()
+        self.addCleanup(response_cache._cache().clear)
+
+    def test_hit_miss_and_user_invalidation(self):
+        key, cached = response_cache.lookup(1, 10, 0.6, 0.4, 'v1')
+        self.assertIsNone(cached)
+        response_cache.store(key, {'user_id': 1})
+
+        self.assertEqual(response_cache.lookup(1, 10, 0.6, 0.4, 'v1')[1], {'user_id': 1})
+        self.assertIsNone(response_cache.lookup(1, 10, 0.6, 0.4, 'v2')[1])
+        self.assertIsNone(response_cache.lookup(1, 5, 0.6, 0.4, 'v1')[1])
+
+        response_cache.invalidate_user(1)
+        self.assertIsNone(response_cache.lookup(1, 10, 0.6, 0.4, 'v1')[1])
+
+        stats = response_cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['invalidations']), (1, 4, 1))
+        self.assertEqual(stats['hit_rate'], 0.2)
+
+    def test_evictions_counted(self):
+        for user_id in range(6):
+            key, _ = response_cache.lookup(user_id, 10, 0.6, 0.4, 'v1')
+            response_cache.store(key, {'user_id': user_id})
+
+        stats = response_cache.get_stats()
+        self.assertGreater(stats['evictions'], 0)
+        self.assertLessEqual(stats['entries'], 4)
+
+    @patch('recommender.training.reload_if_stale', return_value=None)
+    def test_endpoint_served_from_cache(self, mock_reload):
+        snap = snapshot.ModelSnapshot(version='v1', content={'df': 1})
+        entry = {'is_cold_start': False, 'recommendation_type': 'hybrid', 'recommendations': []}
+        with patch('recommender.snapshot.current', return_value=snap), \
+                patch('recommender.views._serve_smart_recommendations', return_value={7: entry}) as mock_serve:
+            first = views.get_smart_recommendations(RequestFactory().get('/api/recommend/smart/7/'), 7)
+            second = views.get_smart_recommendations(RequestFactory().get('/api/recommend/smart/7/'), 7)
+
+        self.assertEqual(mock_serve.call_count, 1)
+        self.assertEqual(first.data, second.data)
+
+
+
+class HotelCatalogTest(TestCase):
+
+    def _hotel(self, name, stars, location=None):
+        row = {field: None for field in catalog._HOTEL_FIELDS.values()}
+        row.update(name=name, star_rating=stars, location__name=location, updated_at=None)
+        return row
+
+    def _catalog(self):
+        hotels = {3: self._hotel('C', 3, 'Hanoi'), 1: self._hotel('A', 5, 'Hue')}
+        watermarks = {'hotels_updated_at': None, 'rooms_updated_at': None, 'image_id': 0, 'full_loaded_at': 0}
+        return catalog._build(hotels, {1: 'a.jpg'}, {3: 250.0}, watermarks)
+
+    def test_lookup_and_incremental_merge(self):
+        base = self._catalog()
+        self.assertEqual(base.ids.tolist(), [1, 3])
+        self.assertEqual(base.values('star_rating', [3, 99, 1]), [3, None, 5])
+        self.assertEqual(base.lookup('thumbnail', [1, 3]), {1: 'a.jpg'})
+
+        updated = catalog._build({2: self._hotel('B', 4)}, {3: 'c.jpg'}, {1: 90.0, 3: None}, base.watermarks, base=base)
+        self.assertEqual(updated.ids.tolist(), [1, 2, 3])
+        self.assertEqual(updated.records([2, 3, 1], {'name': 'name', 'thumb': 'thumbnail', 'price': 'min_room_price'}), [
+            {'name': 'B', 'thumb': None, 'price': None},
+            {'name': 'C', 'thumb': 'c.jpg', 'price': None},
+            {'name': 'A', 'thumb': 'a.jpg', 'price': 90.0},
+        ])
+        # Bản cũ không bị thay đổi (catalog bất biến)
+        self.assertEqual(base.values('min_room_price', [3]), [250.0])
+
+    def test_enrichment_without_queries(self):
+        hotel_catalog = self._catalog()
+        recs = [{'hotel_id': 3, 'hybrid_score': 1.0, 'content_score': 0.5, 'collab_score': 0.5},
+                {'hotel_id': 1, 'hybrid_score': 0.5, 'content_score': 0.5, 'collab_score': 0.0}]
+        with patch.object(catalog, '_current', hotel_catalog), self.assertNumQueries(0):
+            views._enrich_smart_recommendations(recs)
+            thumbnails = views.get_hotel_thumbnails([1, 3])
+
+        self.assertEqual((recs[0]['name'], recs[0]['location'], recs[0]['min_room_price']), ('C', 'Hanoi', 250.0))
+        self.assertEqual((recs[1]['star_rating'], recs[1]['thumbnail']), (5, 'a.jpg'))
+        self.assertEqual(thumbnails, {1: 'a.jpg'})
+
+    @override_settings(RECOMMENDER_CATALOG_REFRESH_SECONDS=0, RECOMMENDER_CATALOG_FULL_REFRESH_SECONDS=10 ** 9)
+    def test_stale_catalog_refreshed_in_background(self):
+        stale = self._catalog()
+        fresh = self._catalog()
+        started, release = threading.Event(), threading.Event()
+
+        def slow_incremental(base):
+            started.set()
+            release.wait(5)
+            return fresh
+
+        with patch.object(catalog, '_current', stale), \
+                patch('recommender.catalog.load_incremental', side_effect=slow_incremental) as mock_load:
+            # Request không chờ refresh, dùng ngay bản đang có
+            self.assertIs(catalog.get_catalog(), stale)
+            self.assertTrue(started.wait(5))
+            self.assertIs(catalog.get_catalog(), stale)
+            release.set()
+            for thread in threading.enumerate():
+                if thread.name == 'hotel-catalog-refresh':
+                    thread.join(5)
+
+            self.assertIs(catalog._current, fresh)
+            mock_load.assert_called_once_with(stale)
+
+
+class PopularityLeaderboardTest(TestCase):
+
+    def setUp(self):
+        self.addCleanup(popularity.publish, None)
+        popularity.publish({
+            'hotel_ids': np.array([1, 2, 3]),
+            'cf': np.array([0.0, 2.0, 1.0]),
+            'booking': np.array([4.0, 0.0, 1.0]),
+            'view': np.array([1.0, 2.0, 2.0]),
+            'favorite': np.array([0.0, 1.0, 0.0]),
+            'average_rating': np.array([4.0, 4.5, 3.0]),
+            'total_reviews': np.array([10.0, 150.0, 0.0]),
+            'maxima': np.array([2.0, 4.0, 2.0, 1.0]),
+        })
+
+    def test_ranking_reweighting_and_events(self):
+        # 1: 5 + 0.5 + 1.6 + 0.15 | 2: 3 + 1 + 3 + 1.8 + 1.5 | 3: 1.5 + 1.25 + 1 + 1.2
+        self.assertEqual(popularity.get_top_hotel_ids(3), [2, 1, 3])
+        self.assertEqual(popularity.get_top_hotel_ids(2, weights={'booking': 20.0}), [1, 2])
+        self.assertEqual(popularity.get_top_hotel_ids(2, exclude_ids={2}), [1, 3])
+
+        # Booking mới của hotel 3 -> max booking không đổi, hotel 3 vượt hotel 1
+        for _ in range(3):
+            self.assertTrue(popularity.record_event(3, 'book'))
+        self.assertFalse(popularity.record_event(99, 'book'))
+        self.assertFalse(popularity.record_event(3, 'review'))
+        self.assertEqual(popularity.get_top_hotel_ids(3), [2, 3, 1])
+
+    def test_popular_list_without_queries(self):
+        watermarks = {'hotels_updated_at': None, 'rooms_updated_at': None, 'image_id': 0, 'full_loaded_at': 0}
+        hotels = {hid: {**{field: None for field in catalog._HOTEL_FIELDS.values()}, 'name': f'H{hid}'}
+                  for hid in (1, 2, 3)}
+        hotel_catalog = catalog._build(hotels, {2: 'b.jpg'}, {}, watermarks)
+
+        with patch.object(catalog, '_current', hotel_catalog), self.assertNumQueries(0):
+            popular = views.get_popular_hotels_list(2)
+
+        self.assertEqual([(h['id'], h['name'], h['thumbnail']) for h in popular], [(2, 'H2', 'b.jpg'), (1, 'H1', None)])
+
+    def test_region_popularity_uses_posting_list(self):
+        watermarks = {'hotels_updated_at': None, 'rooms_updated_at': None, 'image_id': 0, 'full_loaded_at': 0}
+        hotels = {hid: {**{field: None for field in catalog._HOTEL_FIELDS.values()}, 'location_id': location_id}
+                  for hid, location_id in ((1, 11), (2, 12), (3, 13))}
+        hotel_catalog = catalog._build(hotels, {}, {}, watermarks, locations={10: None, 11: 10, 12: None, 13: 10})
+
+        with patch.object(catalog, '_current', hotel_catalog), self.assertNumQueries(0):
+            region = popularity.get_top_hotel_ids(3, hotel_filter=filters.HotelFilter(location_id=10))
+
+        self.assertEqual(region, [1, 3])
+
+
+class WarmUsersTest(TestCase):
+
+    def setUp(self):
+        self.addCleanup(warm_users.reset)
+        self.addCleanup(warm_users._pending.clear)
+        self.cf = {'user_ids': [9, 1, 5]}
+
+    def _cancel_flush(self):
+        timer, warm_users._flush_timer = warm_users._flush_timer, None
+        if timer is not None:
+            timer.cancel()
+
+    def test_membership_without_queries(self):
+        warm_users.mark_warm([42], write_back=False)
+        self.assertEqual(warm_users.is_warm([1, 2, 42, 9], self.cf).tolist(), [True, False, True, True])
+        with self.assertNumQueries(0):
+            self.assertEqual(warm_users.get_cold_start_users([1, 5, 42], self.cf), set())
+        self.assertEqual(warm_users.pending_writes(), 0)
+
+    @patch('recommender.models.HotelReviews.objects.filter')
+    @patch('recommender.models.Bookings.objects.filter')
+    @patch('recommender.models.FavoriteHotels.objects.filter')
+    @patch('recommender.models.ViewHistories.objects.filter')
+    @patch('recommender.models.Accounts.objects.filter')
+    def test_unknown_users_checked_once_and_written_back_in_batch(self, mock_accounts, mock_views, *mock_others):
+        self.addCleanup(self._cancel_flush)
+        mock_accounts.return_value.values_list.return_value = [(3, True), (4, False), (6, True)]
+        mock_views.return_value.values_list.return_value.distinct.return_value = [3]
+        for mock_filter in mock_others:
+            mock_filter.return_value.values_list.return_value.distinct.return_value = []
+
+        with patch.object(warm_users, '_flush_interval', return_value=3600):
+            cold = warm_users.get_cold_start_users([1, 3, 4, 6, 7], self.cf)
+
+        self.assertEqual(cold, {6, 7})
+        self.assertEqual(mock_accounts.call_args.kwargs['id__in'], [3, 4, 6, 7])
+        # 3 (có data) + 4 (cold_start đã False) -> lần sau không query lại
+        self.assertEqual(warm_users.get_cold_start_users([3, 4], self.cf), set())
+        self.assertEqual(mock_accounts.call_count, 1)
+
+        # Chỉ user 3 cần ghi cold_start = False, ghi bằng 1 UPDATE ở lần flush
+        self.assertEqual(warm_users.pending_writes(), 1)
+        mock_accounts.return_value.update.return_value = 1
+        self.assertEqual(warm_users.flush(), 1)
+        self.assertEqual(mock_accounts.call_args.kwargs, {'id__in': [3], 'cold_start': True})
+        mock_accounts.return_value.update.assert_called_once_with(cold_start=False)
+        self.assertEqual(warm_users.pending_writes(), 0)
+
+
+class HotelIndexTest(TestCase):
+
+    def test_index_aligns_content_and_cf(self):
+        content = {'df': pd.DataFrame({'id': [7, 3, 5]})}
+        cf = {'hotel_ids': [5, 9]}
+        index = hotel_index.get_index(content, cf)
+
+        self.assertEqual(index.ids.tolist(), [3, 5, 7, 9])
+        self.assertEqual(index.ids[index.content_pos].tolist(), [7, 3, 5])
+        self.assertEqual(index.ids[index.cf_pos].tolist(), [5, 9])
+        self.assertEqual(index.positions([9, 4, 3]).tolist(), [3, -1, 0])
+        self.assertIs(hotel_index.get_index(content, cf), index)
+        self.assertIsNot(hotel_index.get_index(content, {'hotel_ids': [5]}), index)
+
+    def test_rank_hybrid_on_shared_index(self):
+        from . import hybrid
+
+        index = hotel_index.HotelIndex([30, 10, 20], [20, 40])
+        # Content: 10, 20, 30 (hotel gốc); CF: item-based 20, 40 + user-based 40 (lấy max)
+        content = (index.content_pos[[1, 2, 0]], np.array([0.9, 0.5, 0.7]))
+        collab = [(index.cf_pos[[0, 1]], np.array([2.0, 4.0])), (index.cf_pos[[1]], np.array([1.0]))]
+
+        ranked = hybrid._rank_hybrid(index, 30, content, collab, 0.6, 0.4, limit=5)
+        self.assertEqual(ranked, [
+            {'hotel_id': 10, 'hybrid_score': 0.6, 'content_score': 1.0, 'collab_score': 0.0},
+            {'hotel_id': 40, 'hybrid_score': 0.4, 'content_score': 0.0, 'collab_score': 1.0},
+            {'hotel_id': 20, 'hybrid_score': 0.0, 'content_score': 0.0, 'collab_score': 0.0},
+        ])
+
+
+class DiversityTest(TestCase):
+
+    def test_cap_mode_uses_catalog_codes(self):
+        from . import hybrid
+
+        hotel_catalog = _diversity_catalog({1: ('Hue', 'HOTEL'), 2: ('Hue', 'VILLA'), 3: ('Hanoi', 'HOTEL'),
+                                            4: ('Unknown', 'RESORT')})
+        recs = [{'hotel_id': hid, 'hybrid_score': score} for hid, score in ((1, 0.9), (2, 0.8), (99, 0.7), (3, 0.6), (4, 0.5))]
+        with patch.object(catalog, '_current', hotel_catalog), self.assertNumQueries(0):
+            diverse = hybrid.apply_diversity(recs, limit=4, max_per_location=1, max_per_type=2, mode='cap')
+
+        # 2: Hue đã đủ; 99 (không có trong catalog) tính là 'Unknown' / 'HOTEL'
+        # -> 3 bị bỏ (đủ 2 HOTEL), 4 bị bỏ ('Unknown' đã đủ)
+        self.assertEqual([rec['hotel_id'] for rec in diverse], [1, 99])
+
+    def test_mmr_trades_relevance_for_novelty(self):
+        from . import hybrid
+
+        vectors = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+        relevance = [1.0, 0.95, 0.5]
+        self.assertEqual(diversity.mmr_select(vectors, relevance, 3, mmr_lambda=1.0).tolist(), [0, 1, 2])
+        self.assertEqual(diversity.mmr_select(vectors, relevance, 3, mmr_lambda=0.5).tolist(), [0, 2, 1])
+
+        df = pd.DataFrame({'id': [30, 10, 20]})
+        snap = snapshot.ModelSnapshot(content={'df': df, 'content_embeddings': vectors[[2, 0, 1]]})
+        recs = [{'hotel_id': hid, 'hybrid_score': score} for hid, score in zip((10, 20, 30), relevance)]
+        diverse = hybrid.apply_diversity(recs, limit=2, mode='mmr', mmr_lambda=0.5, snap=snap)
+        self.assertEqual([rec['hotel_id'] for rec in diverse], [10, 30])
+
+
+class FilterTest(TestCase):
+
+    def test_catalog_mask_includes_child_locations(self):
+        rows = {}
+        for hotel_id, (location_id, star, hotel_type) in {
+            10: (3, 4, 'HOTEL'), 11: (4, 5, 'HOTEL'), 12: (2, 3, 'VILLA'), 13: (1, 5, 'RESORT')
+        }.items():
+            row = {field: None for field in catalog._HOTEL_FIELDS.values()}
+            row.update(location_id=location_id, star_rating=star, type=hotel_type, updated_at=None)
+            rows[hotel_id] = row
+        watermarks = {'hotels_updated_at': None, 'rooms_updated_at': None, 'image_id': 0, 'full_loaded_at': 0}
+        # Cây Locations: 1 > 2 > 3, 4 độc lập; hotel 13 không có phòng có giá
+        hotel_catalog = catalog._build(rows, {}, {10: 500.0, 11: 400.0, 12: 900.0}, watermarks,
+                                       locations={1: None, 2: 1, 3: 2, 4: None})
+
+        def allowed(**params):
+            hotel_filter = filters.from_query_params(params)
+            return [hid for hid in (10, 11, 12, 13, 99) if hotel_filter.allows([hid], hotel_catalog)[0]]
+
+        self.assertEqual(allowed(location='1'), [10, 12, 13])
+        self.assertEqual(allowed(location='1', max_price='800'), [10])
+        self.assertEqual(allowed(min_star='4', type='hotel, resort'), [10, 11, 13])
+        self.assertIsNone(filters.from_query_params({'limit': '5'}))
+        with self.assertRaises(ValueError):
+            filters.from_query_params({'max_price': 'abc'})
+
+    def test_content_top_k_falls_back_to_exact_cosine(self):
+        from sklearn.preprocessing import normalize
+
+        tfidf_matrix = csr_matrix(normalize(np.array([[1.0, 0, 0], [0.9, 0.1, 0], [0.5, 0.5, 0], [0, 0, 1.0]])))
+        # Bảng neighbors chỉ giữ 1 neighbor mỗi hàng
+        content = {'neighbor_idx': np.array([[1], [0], [1], [0]]), 'neighbor_scores': np.ones((4, 1), dtype=np.float32),
+                   'tfidf_matrix': tfidf_matrix}
+        allowed_rows = np.array([True, False, True, True])
+
+        rows, scores = filters.content_top_k(content, 0, 2, allowed_rows)
+        self.assertEqual(rows.tolist(), [2, 3])
+        self.assertAlmostEqual(scores[0], tfidf_matrix[0].dot(tfidf_matrix[2].T).toarray()[0, 0])
+
+        # Neighbor thỏa filter đủ -> không cần exact cosine
+        rows, _ = filters.content_top_k(content, 2, 1, allowed_rows[::-1].copy())
+        self.assertEqual(rows.tolist(), [1])
+
+
+class LocationIndexTest(TestCase):
+
+    def test_euler_intervals_and_posting_lists(self):
+        # 1 > 2 > 3, 1 > 5, 4 độc lập, 6 <-> 7 là vòng parent (dữ liệu lỗi)
+        index = locations.LocationIndex(
+            {1: None, 2: 1, 3: 2, 4: None, 5: 1, 6: 7, 7: 6},
+            np.array([3, 4, np.nan, 2, 5, 99, 7], dtype=np.float64)
+        )
+
+        self.assertEqual(sorted(index.descendants(1).tolist()), [1, 2, 3, 5])
+        self.assertEqual(sorted(index.hotels_in(1).tolist()), [0, 3, 4])
+        self.assertEqual(index.hotels_in(2, include_descendants=False).tolist(), [3])
+        self.assertEqual(index.contains(2, [0, 1, 3, 4, -1]).tolist(), [True, False, True, False, False])
+        self.assertEqual(index.region_codes(0).tolist(), [1, 4, -1, 1, 1, -1, 6])
+        self.assertEqual(index.region_codes(1).tolist(), [2, 4, -1, 2, 5, -1, 7])
+        self.assertEqual(index.hotels_in(99).tolist(), [])
+
+    def test_diversity_caps_by_region(self):
+        watermarks = {'hotels_updated_at': None, 'rooms_updated_at': None, 'image_id': 0, 'full_loaded_at': 0}
+        hotels = {hid: {**{field: None for field in catalog._HOTEL_FIELDS.values()},
+                        'location_id': location_id, 'location__name': f'L{location_id}', 'type': 'HOTEL'}
+                  for hid, location_id in ((1, 11), (2, 13), (3, 12))}
+        hotel_catalog = catalog._build(hotels, {}, {}, watermarks, locations={10: None, 11: 10, 12: None, 13: 10})
+
+        by_location, _ = diversity.hotel_codes([1, 2, 3], hotel_catalog)
+        by_region, _ = diversity.hotel_codes([1, 2, 3, 99], hotel_catalog, region_depth=0)
+
+        self.assertEqual(len(set(by_location.tolist())), 3)
+        self.assertEqual(by_region.tolist(), [10, 10, 12, -1])
@@ -0,0 +1,119 @@
+"""
+Training Module
+Điều phối việc train Content-Based (views.py) + Collaborative Filtering (collaborative.py)
++ popularity leaderboard (popularity.py),
+lưu / load trạng thái đã train qua model artifacts (artifacts.py)
+và rebuild kết quả smart recommendations đã materialize (materialized.py).
+"""
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from django.conf import settings
+from . import artifacts, materialized, popularity, snapshot, warm_users
+
+_reload_lock = threading.Lock()
+_last_reload_check = 0.0
+
+
+@contextmanager
+def _no_stage(name: str):
+    yield
+
+
+def train_all(stage=_no_stage) -> Dict[str, Any]:
+    """
+    Train lại tất cả models, ghi ra 1 artifact mới và publish snapshot mới.
+    Content-Based + CF được publish cùng lúc bằng 1 phép swap.
+
+    Args:
+        stage: Context manager factory `stage(name)` để theo dõi tiến độ từng bước
+            (xem jobs.RetrainJob.stage)
+
+    Returns:
+        Dict kết quả: content_based, collaborative (bool) và version artifact
+    """
+    from . import views, collaborative
+
+    with stage('content_based'):
+        content = views.build_content_model()
+    with stage('collaborative'):
+        cf_model = collaborative.build_collaborative_model()
+    with stage('popularity'):
+        leaderboard = popularity.build_leaderboard(cf_model)
+
+    version = None
+    if content is not None:
+        with stage('save_artifact'):
+            version = artifacts.save_artifact({
+                'content': content,
+                'cf': cf_model or {},
+                'popularity': leaderboard,
+            })
+        with stage('publish'):
+            published = snapshot.publish(content=content, cf=cf_model or {}, version=version)
+            popularity.publish(leaderboard)
+            warm_users.reset()
+        if cf_model:
+            with stage('cold_start_flags'):
+                warm_users.sync_cold_start_flags(cf_model)
+        if cf_model and materialized.is_enabled() and getattr(settings, 'RECOMMENDER_MATERIALIZE_ON_TRAIN', True):
+            # Requests đã dùng model mới từ bước publish; trong lúc rebuild users chưa có kết quả mới được tính live
+            with stage('materialize'):
+                materialized.rebuild(published)
+
+    return {
+        'content_based': content is not None,
+        'collaborative': cf_model is not None,
+        'version': version,
+    }
+
+
+def load_latest() -> Optional[str]:
+    """
+    Load artifact CURRENT (mmap, không train) và publish thành snapshot mới.
+
+    Returns:
+        Version đã load, hoặc None nếu chưa có artifact
+    """
+    loaded = artifacts.load_artifact()
+    if loaded is None:
+        return None
+
+    version, sections = loaded
+    snapshot.publish(content=sections.get('content', {}), cf=sections.get('cf', {}), version=version)
+    popularity.publish(sections.get('popularity'))
+    warm_users.reset()
+    return version
+
+
+def reload_if_stale(force: bool = False) -> Optional[str]:
+    """
+    Load lại artifact nếu CURRENT đã đổi (vd: worker khác vừa retrain xong).
+    Chỉ kiểm tra tối đa 1 lần mỗi RECOMMENDER_RELOAD_CHECK_SECONDS, không bao giờ block request.
+
+    Returns:
+        Version mới nếu vừa reload, None nếu không
+    """
+    global _last_reload_check
+
+    interval = getattr(settings, 'RECOMMENDER_RELOAD_CHECK_SECONDS', 10)
+    now = time.monotonic()
+    if not force and now - _last_reload_check < interval:
+        return None
+    if not _reload_lock.acquire(blocking=force):
+        return None
+    try:
+        _last_reload_check = now
+        latest = artifacts.current_version()
+        if latest is None or latest == snapshot.current().version:
+            return None
+        version = load_latest()
+        if version:
+            print(f"🔄 Đã reload model artifact {version}")
+        return version
+    except Exception as e:
+        print(f"⚠️ Không thể reload model artifact: {e}")
+        return None
+    finally:
+        _reload_lock.release()
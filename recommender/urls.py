@@ -4,14 +4,25 @@ from . import views
 urlpatterns = [
     # Content-Based: Gợi ý hotels tương tự dựa trên hotel_id
     path('recommend/<int:hotel_id>/', views.get_recommendations, name='recommendations'),
+    path('recommend/batch/', views.get_recommendations_batch, name='recommendations-batch'),
     
     # Smart Recommendations: API CHÍNH cho giao diện hotel
     # Tích hợp hybrid algorithms (Content-Based + Collaborative Filtering)
     path('recommend/smart/<int:user_id>/', views.get_smart_recommendations, name='smart-recommendations'),
     
+    # Batch: nhiều hotels / users trong 1 request (POST, kết quả theo id)
+    path('recommend/smart/batch/', views.get_smart_recommendations_batch, name='smart-recommendations-batch'),
+    
     # Real-time Personalization: Track user actions
     path('user/action/', views.track_user_action, name='track-action'),
     
     # Admin: Retrain models
     path('model/retrain/', views.retrain_model, name='retrain-model'),
+    path('model/retrain/<str:job_id>/', views.get_retrain_status, name='retrain-status'),
+    
+    # Readiness: trạng thái warm-up của models (loading | ready | degraded)
+    path('model/status/', views.get_model_status, name='model-status'),
+    
+    # Response cache của smart recommendations: hit / miss / eviction counters
+    path('model/cache/stats/', views.get_cache_stats, name='cache-stats'),
 ]
@@ -3,17 +3,35 @@ from rest_framework.response import Response
 from .models import Hotels, HotelsAmenities, Amenities, Locations, HotelViews, ViewHistories, FavoriteHotels, Bookings, HotelReviews, SearchHistory, HotelImages, Rooms
 from collections import Counter
 import pandas as pd
+import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
-from django.db.models import Min
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from .ranking import top_k, top_k_rows
+from . import ann, catalog, diversity, filters, hotel_index, snapshot
 
-# --- BIẾN TOÀN CỤC ĐỂ LƯU MODEL (CACHE) ---
-global_data = {}
+# --- MODEL (CACHE) ---
+# Model được giữ trong snapshot bất biến (snapshot.py), mỗi request pin 1 snapshot.
+
+
+def __getattr__(name):
+    # Tương thích ngược: views.global_data = Content-Based model của snapshot hiện tại (read-only)
+    if name == 'global_data':
+        return snapshot.current().content
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _pin_snapshot():
+    """Snapshot cho 1 request; trước đó load artifact mới nếu worker khác vừa retrain."""
+    from .training import reload_if_stale
+    reload_if_stale()
+    return snapshot.current()
 
 
 def get_min_room_prices(hotel_ids):
     """
-    Helper: Lấy giá phòng thấp nhất cho mỗi hotel
+    Helper: Lấy giá phòng thấp nhất cho mỗi hotel (từ hotel catalog, không query DB)
     
     Args:
         hotel_ids: List of hotel IDs
@@ -24,15 +42,7 @@ def get_min_room_prices(hotel_ids):
     if not hotel_ids:
         return {}
     
-    # Query lấy giá phòng thấp nhất cho mỗi hotel
-    min_prices = Rooms.objects.filter(
-        hotel_id__in=hotel_ids,
-        price__isnull=False
-    ).values('hotel_id').annotate(
-        min_price=Min('price')
-    )
-    
-    return {item['hotel_id']: item['min_price'] for item in min_prices}
+    return catalog.get_values('min_room_price', hotel_ids)
 
 
 def get_hotel_amenities():
@@ -62,8 +72,11 @@ def get_hotel_views():
         hotel_views[hotel_id].append(view_type)
     return {k: ' '.join(v) for k, v in hotel_views.items()}
 
-def train_model():
-    
+def build_content_model():
+    """
+    Train Content-Based model, trả về dict model mới (chưa publish).
+    Trả về None nếu không có hotels.
+    """
     print("🔄 Đang huấn luyện AI...")
     
     # 1. Lấy dữ liệu Hotels kèm Location
@@ -76,7 +89,7 @@ def train_model():
     
     if df_hotels.empty:
         print("⚠️ Không có hotels trong database!")
-        return
+        return None
     
     # 2. Lấy amenities
     hotel_amenities = get_hotel_amenities()
@@ -106,44 +119,160 @@ def train_model():
         df_hotels['views']
     )
     
-    # 4. Tính TF-IDF và Cosine Similarity
+    # 4. Tính TF-IDF và top-K Cosine Similarity
     VIETNAMESE_STOP_WORDS = [
     'là', 'và', 'của', 'những', 'cái', 'việc', 'tại', 'trong', 'các', 'cho', 'được', 'với', 
     'khách sạn', 'hotel', 'phòng', 'nơi' # Những từ này khách sạn nào cũng có -> nên bỏ
     ]
     tfidf = TfidfVectorizer(min_df=1, ngram_range=(1, 2), stop_words=VIETNAMESE_STOP_WORDS)
     tfidf_matrix = tfidf.fit_transform(df_hotels['soup'])
-    cosine_sim = linear_kernel(tfidf_matrix, tfidf_matrix)
-    
-    # 5. Lưu vào cache
-    global_data['df'] = df_hotels
-    global_data['sim'] = cosine_sim
-    global_data['indices'] = pd.Series(df_hotels.index, index=df_hotels['id']).drop_duplicates()
+    # Chỉ giữ top-K neighbors cho mỗi hotel (tính theo block), không giữ ma trận N×N
+    # Catalog lớn -> tìm neighbors bằng ANN index (ann.py) thay vì so với mọi hotel
+    content_top_k = getattr(settings, 'RECOMMENDER_CONTENT_TOP_K', 100)
+    neighbor_idx, neighbor_scores, ann_recall = ann.build_neighbor_table(tfidf_matrix, content_top_k, label='content')
     
     print(f"✅ AI đã sẵn sàng! Đã load {len(df_hotels)} hotels.")
+    
+    return {
+        'df': df_hotels,
+        'neighbor_idx': neighbor_idx,
+        'neighbor_scores': neighbor_scores,
+        'indices': pd.Series(df_hotels.index, index=df_hotels['id']).drop_duplicates(),
+        # Exact cosine khi bảng neighbors không đủ hotels thỏa filter (filters.py)
+        'tfidf_matrix': tfidf_matrix.tocsr(),
+        # TF-IDF giảm chiều cho diversity mode 'mmr'
+        'content_embeddings': diversity.build_embeddings(tfidf_matrix),
+        'ann_recall': ann_recall,
+    }
+
+
+def train_model():
+    """Train Content-Based model và publish snapshot mới (giữ nguyên CF model)."""
+    content = build_content_model()
+    if content is not None:
+        snapshot.publish(content=content)
+    return content is not None
+
+# Model không còn được train khi import module.
+# Worker warm-up model ở background lúc khởi động (xem warmup.start_warmup trong wsgi.py),
+# train mới bằng `python manage.py train_models` hoặc POST /model/retrain/.
+
+
+# Thông tin hotel trả về cùng popular / smart recommendations: {key: cột hotel catalog}
+ENRICH_FIELDS = {
+    'name': 'name',
+    'address': 'address',
+    'star_rating': 'star_rating',
+    'average_rating': 'average_rating',
+    'total_reviews': 'total_reviews',
+    'location': 'location_name',
+    'thumbnail': 'thumbnail',
+    'min_room_price': 'min_room_price',
+}
+
+
+def get_hotel_thumbnails(hotel_ids):
+    """Helper: Lấy thumbnail (caption='Thumbnail') cho mỗi hotel từ hotel catalog -> Dict {hotel_id: image_url}"""
+    if not hotel_ids:
+        return {}
+    
+    return catalog.get_values('thumbnail', hotel_ids)
+
 
-# Gọi train khi server khởi động
-try:
-    train_model()
-except Exception as e:
-    print(f"⚠️ Chưa thể train model: {e}")
+def _content_result_lists(df, index_lists):
+    """
+    Helper: Chuyển các list hotel indices (vị trí trong df) thành kết quả trả về cho client.
+    Thumbnail + giá phòng thấp nhất của tất cả lists được lấy 1 lần từ hotel catalog.
+    """
+    import math
+    
+    unique_indices = np.unique(np.concatenate([np.asarray(idx, dtype=np.int64) for idx in index_lists] or [[]]))
+    records_df = df.iloc[unique_indices][['id', 'name', 'address', 'star_rating', 'location__name',
+                                          'location__parent__name']]
+    records = records_df.to_dict('records')
+    
+    result_hotel_ids = [r['id'] for r in records]
+    hotel_thumbnails = get_hotel_thumbnails(result_hotel_ids)
+    min_room_prices = get_min_room_prices(result_hotel_ids)
+    
+    by_index = {}
+    for position, result in zip(unique_indices.tolist(), records):
+        result['thumbnail'] = hotel_thumbnails.get(result['id'])
+        result['min_room_price'] = min_room_prices.get(result['id'])
+        
+        # Thay NaN bằng None để JSON serialize được
+        for key, value in list(result.items()):
+            if isinstance(value, float) and math.isnan(value):
+                result[key] = None
+        by_index[position] = result
+    
+    return [[dict(by_index[position]) for position in np.asarray(idx).tolist()] for idx in index_lists]
+
+
+def _batch_max_ids():
+    return getattr(settings, 'RECOMMENDER_BATCH_MAX_IDS', 5000)
+
+
+def _parse_batch_ids(request, field):
+    """
+    Helper: Đọc list ids từ body của batch request.
+    
+    Returns:
+        (ids đã bỏ trùng, giữ thứ tự, None) hoặc (None, Response lỗi 400)
+    """
+    raw_ids = request.data.get(field)
+    if not isinstance(raw_ids, list) or not raw_ids:
+        return None, Response({"error": f"'{field}' phải là list ids không rỗng"}, status=400)
+    try:
+        ids = list(dict.fromkeys(int(x) for x in raw_ids))
+    except (TypeError, ValueError):
+        return None, Response({"error": f"'{field}' chỉ được chứa số nguyên"}, status=400)
+    
+    max_ids = _batch_max_ids()
+    if len(ids) > max_ids:
+        return None, Response({"error": f"Tối đa {max_ids} ids mỗi batch request"}, status=400)
+    return ids, None
 
 
 # --- API ENDPOINTS ---
 
 @api_view(['GET'])
 def get_recommendations(request, hotel_id):
-    """API gợi ý hotels tương tự"""
+    """
+    API gợi ý hotels tương tự
+    
+    Query params:
+        - limit: Số lượng kết quả (mặc định 10)
+        - max_price, min_star, type, location: Filters (xem filters.py)
+    """
     try:
         hotel_id = int(hotel_id)
+        try:
+            hotel_filter = filters.from_query_params(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        
+        # Pin snapshot cho cả request
+        content = _pin_snapshot().content
+        
+        # Check model đã train chưa -> đang warm-up thì trả về popular hotels
+        if not content:
+            from . import warmup
+            limit = int(request.query_params.get('limit', 10))
+            fallback = warmup.get_fallback_hotels(limit, exclude_ids={hotel_id}, hotel_filter=hotel_filter)
+            if not fallback and not hotel_filter:
+                return Response({"error": "Model chưa được train"}, status=503)
+            return Response({
+                "source_hotel_id": hotel_id,
+                "recommendation_type": "popular_fallback",
+                "model_status": warmup.get_status()['status'],
+                "recommendations": fallback
+            })
         
-        # Check model đã train chưa
-        if not global_data:
-            return Response({"error": "Model chưa được train"}, status=503)
-        
-        indices = global_data['indices']
-        cosine_sim = global_data['sim']
-        df = global_data['df']
+        indices = content['indices']
+        neighbor_idx = content['neighbor_idx']
+        neighbor_scores = content['neighbor_scores']
+        df = content['df']
         
         if hotel_id not in indices.index:
             return Response({"message": "Hotel not found"}, status=404)
@@ -151,56 +280,22 @@ def get_recommendations(request, hotel_id):
         # Lấy index của hotel
         idx = indices[hotel_id]
         
-        # Tính điểm similarity
-        # lấy số điểm tương đồng của hotel_id trong 1 hàng của ma trận và convert về dạng chỉ mục(cột, giá trị)
-        sim_scores = list(enumerate(cosine_sim[idx]))
-        # sắp xếp
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-        
-        # Lấy top 10 (bỏ chính nó)
+        # Lấy top hotels tương tự từ bảng neighbors (đã sắp xếp giảm dần, đã bỏ chính nó)
+        # limit tối đa = RECOMMENDER_CONTENT_TOP_K
         limit = int(request.query_params.get('limit', 10))
-        sim_scores = sim_scores[1:limit+1]
-        hotel_indices = [i[0] for i in sim_scores]
+        if hotel_filter:
+            # Mask trên các hàng df trước top-K (không đủ trong bảng neighbors -> exact cosine)
+            index = hotel_index.get_index(content, None)
+            allowed_rows = hotel_filter.index_mask(index)[index.content_pos]
+            hotel_indices, _ = filters.content_top_k(content, idx, limit, allowed_rows)
+        else:
+            hotel_indices, _ = top_k(neighbor_scores[idx], limit, candidates=neighbor_idx[idx])
         
         # Lấy thông tin source hotel
         source_row = df[df['id'] == hotel_id].iloc[0]
         
-        # Lấy thông tin hotels
-        result_df = df.iloc[hotel_indices][['id', 'name', 'address', 'star_rating', 'location__name', 
-                                             'price_range', 'type', 'design_style', 'location__parent__name']]
-        results = result_df.to_dict('records')
-        
-        # Lấy thumbnail cho mỗi hotel
-        result_hotel_ids = [r['id'] for r in results]
-        hotel_thumbnails = {}
-        thumbnail_images = HotelImages.objects.filter(
-            hotel_id__in=result_hotel_ids,
-            caption='Thumbnail'
-        ).values('hotel_id', 'image_url')
-        for img in thumbnail_images:
-            hotel_thumbnails[img['hotel_id']] = img['image_url']
-        
-        # Lấy giá phòng thấp nhất cho mỗi hotel
-        min_room_prices = get_min_room_prices(result_hotel_ids)
-        
-        # Xử lý kết quả
-        import math
-        for i, result in enumerate(results):
-            # Thêm thumbnail
-            result['thumbnail'] = hotel_thumbnails.get(result['id'])
-            
-            # Thêm min_room_price
-            result['min_room_price'] = min_room_prices.get(result['id'])
-            
-            # Xóa các field phụ không cần trả về
-            del result['price_range']
-            del result['type']
-            del result['design_style']
-            
-            # Thay NaN bằng None để JSON serialize được
-            for key, value in list(result.items()):
-                if isinstance(value, float) and math.isnan(value):
-                    result[key] = None
+        # Lấy thông tin hotels + thumbnail + min_room_price
+        results = _content_result_lists(df, [hotel_indices])[0]
         
         return Response({
             "source_hotel_id": hotel_id,
@@ -212,27 +307,122 @@ def get_recommendations(request, hotel_id):
         return Response({"error": str(e)}, status=500)
 
 
-
 @api_view(['POST'])
-def retrain_model(request):
-    """API để retrain tất cả models (Content-Based + Collaborative)"""
+def get_recommendations_batch(request):
+    """
+    Batch API gợi ý hotels tương tự cho nhiều hotels trong 1 request
+    (vd: các widget "hotels tương tự" của 1 trang listing).
+    
+    Request Body:
+    {
+        "hotel_ids": [1, 2, 3],
+        "limit": 10
+    }
+    
+    Response: results theo hotel_id, hotel không có trong model -> not_found
+    """
     try:
-        # Retrain Content-Based (Phase 1)
-        train_model()
+        hotel_ids, error = _parse_batch_ids(request, 'hotel_ids')
+        if error is not None:
+            return error
+        limit = int(request.data.get('limit', 10))
         
-        # Retrain Collaborative Filtering (Phase 2)
-        from .collaborative import train_collaborative_model
-        cf_success = train_collaborative_model()
+        content = _pin_snapshot().content
+        
+        # Model đang warm-up -> popular hotels cho từng hotel (bỏ chính nó)
+        if not content:
+            from . import warmup
+            return Response({
+                "recommendation_type": "popular_fallback",
+                "model_status": warmup.get_status()['status'],
+                "results": {
+                    hid: {"recommendations": warmup.get_fallback_hotels(limit, exclude_ids={hid})}
+                    for hid in hotel_ids
+                },
+                "not_found": []
+            })
+        
+        indices = content['indices']
+        df = content['df']
+        
+        found = [hid for hid in hotel_ids if hid in indices.index]
+        not_found = [hid for hid in hotel_ids if hid not in indices.index]
+        
+        index_lists = []
+        if found:
+            # Gather các hàng của bảng neighbors cho cả batch -> top-K theo hàng
+            rows = indices.loc[found].to_numpy()
+            candidates = np.asarray(content['neighbor_idx'][rows])
+            top_pos, _ = top_k_rows(np.asarray(content['neighbor_scores'][rows]), limit)
+            top_indices = np.take_along_axis(candidates, top_pos, axis=1)
+            index_lists = [row[row >= 0] for row in top_indices]
+        
+        # Enrich tất cả kết quả bằng 1 lần query
+        result_lists = _content_result_lists(df, index_lists) if index_lists else []
+        
+        names = df['name'].to_numpy()
+        results = {
+            hid: {
+                "source_hotel_name": names[row],
+                "recommendations": recs
+            }
+            for hid, row, recs in zip(found, indices.loc[found].tolist() if found else [], result_lists)
+        }
         
         return Response({
-            "message": "Tất cả models đã được train lại!",
-            "content_based": "✅ Success",
-            "collaborative": "✅ Success" if cf_success else "⚠️ Không đủ dữ liệu"
+            "results": results,
+            "not_found": not_found
         })
+        
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
 
+@api_view(['POST'])
+def retrain_model(request):
+    """
+    API để retrain tất cả models (Content-Based + Collaborative)
+    Retrain chạy ở background job -> trả về job_id ngay, poll trạng thái qua /model/retrain/<job_id>/
+    """
+    try:
+        from . import jobs
+        job, deduplicated = jobs.submit_retrain()
+        
+        return Response({
+            "message": "Retrain đang chạy" if deduplicated else "Đã tạo retrain job",
+            "job_id": job['job_id'],
+            "status": job['status'],
+            "deduplicated": deduplicated,
+            "status_url": f"/api/model/retrain/{job['job_id']}/"
+        }, status=202)
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
+
+
+@api_view(['GET'])
+def get_retrain_status(request, job_id):
+    """API polling trạng thái retrain job (từng stage + thời gian)"""
+    from . import jobs
+    job = jobs.get_job(job_id)
+    if job is None:
+        return Response({"error": "Job not found"}, status=404)
+    return Response(job)
+
+
+@api_view(['GET'])
+def get_model_status(request):
+    """API readiness: loading | ready | degraded"""
+    from . import warmup
+    return Response(warmup.get_status())
+
+
+@api_view(['GET'])
+def get_cache_stats(request):
+    """API thống kê response cache của smart recommendations (hit / miss / eviction của worker hiện tại)"""
+    from . import response_cache
+    return Response(response_cache.get_stats())
+
+
 # --- REAL-TIME PERSONALIZATION API ---
 
 @api_view(['POST'])
@@ -256,7 +446,7 @@ def track_user_action(request):
     """
     try:
         from .models import Accounts
-        from . import collaborative
+        from . import collaborative, delta, materialized, popularity, response_cache, warm_users
         
         data = request.data
         user_id = data.get('user_id')
@@ -286,26 +476,30 @@ def track_user_action(request):
                 cold_start_updated = True
         except Accounts.DoesNotExist:
             return Response({"error": "User not found"}, status=404)
+        warm_users.mark_warm([user_id], write_back=False)
         
-        # 2. Incremental update CF model
-        cf_updated = False
-        if collaborative.cf_global_data:
-            # Tính rating score dựa trên action_type
-            rating_map = {
-                'view': 2.0 + min(metadata.get('view_duration', 0) / 180, 1.0),  # 2-3
-                'favorite': 4.0,
-                'book': 5.0,
-                'review': metadata.get('rating', 4.0)
-            }
-            rating = rating_map.get(action_type, 2.0)
-            
-            # Update user-item matrix
-            # Note: With Sparse Matrix implementation, incremental update is complex.
-            # We rely on periodic retraining or assume the new action will be picked up next train.
-            # Ideally, we could add to a 'recent_actions' buffer.
-            # For now, we simply skip immediate model update to ensure stability.
-            pass
-
+        # 2. Incremental update CF model: ghi vào delta buffer, CF scorers merge ngay ở request sau
+        config = collaborative.CF_WEIGHTS
+        if action_type == 'view':
+            rating = float(collaborative.view_engagement_scores(
+                np.array([float(metadata.get('view_duration', 0) or 0)]),
+                np.array([bool(metadata.get('clicked_booking', False))]),
+                np.array([bool(metadata.get('clicked_favorite', False))]),
+                config
+            )[0])
+        elif action_type == 'favorite':
+            rating = config.favorite
+        elif action_type == 'book':
+            rating = config.booking
+        else:
+            rating = float(metadata.get('rating', config.review_default))
+        
+        delta.add_event(int(user_id), int(hotel_id), rating)
+        delta.maybe_compact()
+        cf_updated = True
+        
+        # Kết quả smart recommendations đã cache của user không còn đúng
+        response_cache.invalidate_user(user_id)
         
         # 3. Lưu vào view_histories nếu là action view
         view_history_saved = False
@@ -349,6 +543,14 @@ def track_user_action(request):
             )
             favorite_saved = created  # True nếu tạo mới, False nếu đã tồn tại
         
+        # Kết quả đã materialize không còn đúng - ghi sau khi đã lưu DB
+        # -> thời điểm invalidate luôn sau khi event có trong DB (so với data cut-off của model)
+        materialized.invalidate(user_id)
+        
+        # 5. Cập nhật popularity leaderboard (chỉ tính actions đã thực sự ghi nhận)
+        if action_type == 'book' or view_history_saved or favorite_saved:
+            popularity.record_event(hotel_id, action_type)
+        
         return Response({
             "status": "success",
             "user_id": user_id,
@@ -383,155 +585,220 @@ def is_cold_start_user(user_id):
     - HotelReviews
     
     Nếu có ít nhất 1 loại dữ liệu -> không phải cold start
-    Đồng thời cập nhật cột cold_start trong accounts nếu phát hiện có data
+    (xem get_cold_start_users: warm users được trả lời từ RAM, cột cold_start ghi lại ở background)
     """
-    from .models import Accounts, ViewHistories, FavoriteHotels, Bookings, HotelReviews
-    
-    try:
-        account = Accounts.objects.get(id=user_id)
-    except Accounts.DoesNotExist:
-        return True  # User không tồn tại -> coi như cold start
-    
-    # Nếu cold_start đã = False trong DB thì không cần check thêm
-    if not account.cold_start:
-        return False
+    return user_id in get_cold_start_users([user_id])
+
+
+def get_cold_start_users(user_ids, snap=None):
+    """
+    Batch version của is_cold_start_user.
+    Users có trong CF model / vừa có action mới được trả lời từ RAM (warm_users.py),
+    chỉ các users còn lại mới kiểm tra DB (5 queries cho cả batch).
     
-    # Kiểm tra có dữ liệu behavior không
-    has_views = ViewHistories.objects.filter(account_id=user_id).exists()
-    has_favorites = FavoriteHotels.objects.filter(account_id=user_id).exists()
-    has_bookings = Bookings.objects.filter(user_id=user_id).exists()
-    has_reviews = HotelReviews.objects.filter(user_id=user_id).exists()
+    Returns:
+        Set user_ids vẫn là cold start (kể cả users không tồn tại)
+    """
+    from . import warm_users
     
-    # Có ít nhất 1 loại dữ liệu -> không phải cold start
-    has_data = has_views or has_favorites or has_bookings or has_reviews
+    return warm_users.get_cold_start_users(user_ids, (snap or snapshot.current()).cf)
+
+
+def get_recent_views(user_ids, per_user=5):
+    """
+    ViewHistory gần nhất của nhiều users bằng 1 query (ROW_NUMBER() theo từng user).
     
-    if has_data:
-        # Cập nhật cold_start = False trong DB
-        account.cold_start = False
-        account.save(update_fields=['cold_start'])
-        print(f"✅ User {user_id} không còn cold-start (có data: views={has_views}, favorites={has_favorites}, bookings={has_bookings}, reviews={has_reviews})")
-        return False
+    Returns:
+        Dict {user_id: [{'hotel_id', 'hotel_name', 'viewed_at'}, ...]} mới nhất trước
+    """
+    rows = ViewHistories.objects.filter(account_id__in=user_ids).annotate(
+        recent_rank=Window(RowNumber(), partition_by=[F('account_id')], order_by=F('viewed_at').desc())
+    ).filter(recent_rank__lte=per_user).order_by('account_id', 'recent_rank').values(
+        'account_id', 'hotel_id', 'hotel__name', 'viewed_at'
+    )
     
-    return True  # Vẫn là cold start
+    recent = {uid: [] for uid in user_ids}
+    for row in rows:
+        recent[row['account_id']].append({
+            'hotel_id': row['hotel_id'],
+            'hotel_name': row['hotel__name'],
+            'viewed_at': row['viewed_at'],
+        })
+    return recent
 
 
-def get_popular_hotels_list(limit=10):
+def get_popular_hotels_list(limit=10, snap=None, hotel_filter=None):
     """
     Helper: Lấy danh sách popular hotels sử dụng HYBRID APPROACH
-    Kết hợp các thuật toán đã tạo trong collaborative.py và hybrid.py:
-    - Item-Based CF scores (từ collaborative.py)
+    Đọc từ popularity leaderboard tính sẵn lúc train (popularity.py), kết hợp:
+    - Item-Based CF scores (tổng ratings trong User-Item Matrix của collaborative.py)
     - Rating-based popularity
     - Booking/View/Favorite counts để tính overall popularity
+    Hotel info, thumbnail, giá phòng thấp nhất lấy từ hotel catalog -> không query DB.
+    hotel_filter (filters.HotelFilter): xếp hạng chỉ trong các hotels thỏa filter.
     """
+    from . import popularity
+    
+    cf_data = (snap or snapshot.current()).cf
+    hotel_ids = popularity.get_top_hotel_ids(limit, cf_data=cf_data, hotel_filter=hotel_filter)
+    hotel_infos = catalog.get_catalog().records(hotel_ids, ENRICH_FIELDS)
+    
+    return [{'id': hotel_id, **hotel_info} for hotel_id, hotel_info in zip(hotel_ids, hotel_infos)]
+
+def _add_personalized_recommendations(all_hybrid_recs, viewed_hotel_ids, personalized_recs):
+    """Helper: Bổ sung kết quả personalized CF (weight thấp hơn) vào các hotels chưa có."""
+    for rec in personalized_recs:
+        hid = rec.get('hotel_id') or rec.get('id')
+        if hid and hid not in viewed_hotel_ids and hid not in all_hybrid_recs:
+            all_hybrid_recs[hid] = {
+                'hotel_id': hid,
+                'hybrid_score': rec.get('cf_score', 0) * 0.8,  # Slightly lower weight
+                'content_score': 0,
+                'collab_score': rec.get('cf_score', 0),
+                'source_hotels': [],
+                'from_cf': True
+            }
+
+
+def _enrich_smart_recommendations(recs):
+    """Helper: Thêm hotel info, thumbnail, min_room_price vào recs (in-place) từ hotel catalog."""
+    if not recs:
+        return recs
+    
+    hotel_infos = catalog.get_catalog().records([rec['hotel_id'] for rec in recs], ENRICH_FIELDS)
+    
+    for rec, hotel_info in zip(recs, hotel_infos):
+        rec.update(hotel_info)
+        rec['hybrid_score'] = round(rec['hybrid_score'], 4)
+        rec['content_score'] = round(rec['content_score'], 4)
+        rec['collab_score'] = round(rec['collab_score'], 4)
+    
+    return recs
+
+
+def compute_smart_recommendations(user_ids, limit=10, content_weight=0.6, collab_weight=0.4, snap=None, hotel_filter=None):
+    """
+    Tính smart recommendations (live) cho 1 hoặc nhiều users:
+    1. ViewHistory của user -> Lấy hotels đã xem
+    2. Đưa vào thuật toán HYBRID (hybrid.py) để tìm similar hotels
+    3. Kết hợp với Collaborative Filtering (collaborative.py)
+    4. Cold start users -> Fallback về popular hotels (hybrid approach)
+    
+    Cả batch dùng chung: 1 lần kiểm tra cold start (RAM, DB chỉ cho users chưa biết), 1 query ViewHistory,
+    1 phép nhân Sparse Matrix cho User-Based CF, Content-Based / Item-Based CF 1 lần cho mỗi hotel đã xem,
+    scoring tất cả hotels đã xem trong 1 lượt (hybrid.get_multi_seed_hybrid_batch), enrich từ hotel catalog.
+    
+    hotel_filter (filters.HotelFilter): popular / Content-Based / CF đều chỉ chọn top-K trong các hotels thỏa filter.
+    
+    Returns:
+        {user_id: entry} - entry gồm is_cold_start, recommendation_type, recommendations
+        (+ message cho cold start, user_history cho hybrid)
+    """
+    from .hybrid import get_multi_seed_hybrid_batch
     from . import collaborative
-    from django.db.models import Count
-    
-    # 1. Lấy tất cả hotels với rating
-    hotels = Hotels.objects.select_related('location').filter(
-        average_rating__isnull=False
-    ).order_by('-average_rating', '-total_reviews')
-    
-    if not hotels.exists():
-        return []
-    
-    # 2. Lấy collaborative filtering signals nếu có
-    cf_hotel_scores = {}
-    if collaborative.cf_global_data:
-        # Lấy các hotels được nhiều users yêu thích (từ user-item matrix)
-        # Lấy các hotels được nhiều users yêu thích (từ user-item matrix)
-        sparse_matrix = collaborative.cf_global_data.get('user_item_matrix_sparse')
-        hotel_ids = collaborative.cf_global_data.get('hotel_ids')
-        
-        if sparse_matrix is not None and hotel_ids:
-            # Tính tổng ratings cho mỗi hotel = popularity dựa trên CF
-            # sum(axis=0) returns a matrix [[col1, col2, ...]]
-            hotel_popularity = sparse_matrix.sum(axis=0).tolist()[0]
-            max_pop = max(hotel_popularity) if hotel_popularity else 1
-            
-            if max_pop > 0:
-                for idx, hotel_id in enumerate(hotel_ids):
-                    cf_hotel_scores[hotel_id] = float(hotel_popularity[idx]) / max_pop
-    
-    # 3. Lấy booking/view/favorite counts
-    booking_counts = dict(
-        Bookings.objects.values('room__hotel_id').annotate(
-            count=Count('id')
-        ).values_list('room__hotel_id', 'count')
-    )
-    view_counts = dict(
-        ViewHistories.objects.values('hotel_id').annotate(
-            count=Count('id')
-        ).values_list('hotel_id', 'count')
-    )
-    favorite_counts = dict(
-        FavoriteHotels.objects.values('hotel_id').annotate(
-            count=Count('id')
-        ).values_list('hotel_id', 'count')
-    )
     
-    max_booking = max(booking_counts.values()) if booking_counts else 1
-    max_view = max(view_counts.values()) if view_counts else 1
-    max_favorite = max(favorite_counts.values()) if favorite_counts else 1
-    
-    # 4. Tính hybrid popularity score
-    scored_hotels = []
-    for hotel in hotels:
-        # CF score (từ collaborative.py)
-        cf_score = cf_hotel_scores.get(hotel.id, 0) * 3.0  # Weight = 3
-        
-        # Engagement scores (normalized)
-        booking_score = (booking_counts.get(hotel.id, 0) / max_booking) * 5.0  # Weight = 5
-        view_score = (view_counts.get(hotel.id, 0) / max_view) * 1.0  # Weight = 1
-        favorite_score = (favorite_counts.get(hotel.id, 0) / max_favorite) * 3.0  # Weight = 3
-        
-        # Rating score
-        rating_score = ((hotel.average_rating or 0) / 5.0) * 2.0  # Weight = 2
-        review_score = min((hotel.total_reviews or 0) / 100.0, 1.0) * 1.5  # Cap at 100 reviews
-        
-        # Total hybrid score
-        popularity_score = cf_score + booking_score + view_score + favorite_score + rating_score + review_score
-        
-        scored_hotels.append({
-            'hotel': hotel,
-            'popularity_score': round(popularity_score, 4),
-            'breakdown': {
-                'cf_score': round(cf_score, 4),
-                'booking_score': round(booking_score, 4),
-                'view_score': round(view_score, 4),
-                'favorite_score': round(favorite_score, 4),
-                'rating_score': round(rating_score, 4),
-                'review_score': round(review_score, 4)
+    snap = snap or snapshot.current()
+    results = {}
+    
+    # 1. Cold start users -> dùng chung 1 danh sách popular hotels
+    cold_start_users = get_cold_start_users(user_ids, snap=snap)
+    if cold_start_users:
+        popular = get_popular_hotels_list(limit, snap=snap, hotel_filter=hotel_filter)
+        for uid in cold_start_users:
+            results[uid] = {
+                "is_cold_start": True,
+                "message": "Chào mừng bạn! Đây là các khách sạn phổ biến được nhiều người yêu thích.",
+                "recommendation_type": "popular_hybrid",
+                "recommendations": popular
             }
-        })
     
-    # 5. Sort by hybrid popularity score
-    scored_hotels.sort(key=lambda x: x['popularity_score'], reverse=True)
-    
-    # 6. Lấy thumbnails cho popular hotels
-    top_hotels = scored_hotels[:limit]
-    hotel_ids = [item['hotel'].id for item in top_hotels]
-    hotel_thumbnails = {}
-    images = HotelImages.objects.filter(
-        hotel_id__in=hotel_ids,
-        caption='Thumbnail'
-    ).values('hotel_id', 'image_url')
-    for img in images:
-        hotel_thumbnails[img['hotel_id']] = img['image_url']
-    
-    # 7. Lấy giá phòng thấp nhất cho popular hotels
-    min_room_prices = get_min_room_prices(hotel_ids)
-    
-    return [{
-        'id': item['hotel'].id,
-        'name': item['hotel'].name,
-        'address': item['hotel'].address,
-        'star_rating': item['hotel'].star_rating,
-        'average_rating': item['hotel'].average_rating,
-        'total_reviews': item['hotel'].total_reviews,
-        'location': item['hotel'].location.name if item['hotel'].location else None,
-        'thumbnail': hotel_thumbnails.get(item['hotel'].id),
-        'min_room_price': min_room_prices.get(item['hotel'].id)
-    } for item in top_hotels]
+    warm_users = [uid for uid in user_ids if uid not in cold_start_users]
+    if warm_users:
+        # 2. ViewHistory gần nhất (5 hotels) + User-Based CF cho cả batch
+        recent_views = get_recent_views(warm_users)
+        seeds_by_user = {
+            uid: [v['hotel_id'] for v in recent_views[uid] if v['hotel_id']]
+            for uid in warm_users
+        }
+        user_recs = collaborative.get_user_based_recommendations_batch(
+            warm_users, limit * 2, snap=snap, hotel_filter=hotel_filter
+        ) if snap.cf else {}
+        
+        # 3. Hybrid cho tất cả (user, hotel đã xem) trong 1 lượt, cộng dồn scores theo user
+        hybrid = get_multi_seed_hybrid_batch(
+            seeds_by_user, user_recs,
+            content_weight=content_weight,
+            collab_weight=collab_weight,
+            limit=limit,
+            snap=snap,
+            hotel_filter=hotel_filter
+        )
+        
+        all_recs = []
+        for uid in warm_users:
+            viewed_hotel_ids = seeds_by_user[uid]
+            all_hybrid_recs = hybrid[uid]
+            
+            # 4. Nếu không đủ kết quả từ hybrid -> Thêm personalized CF
+            if len(all_hybrid_recs) < limit:
+                _add_personalized_recommendations(
+                    all_hybrid_recs, viewed_hotel_ids, user_recs.get(uid, [])[:limit]
+                )
+            
+            # 5. Sort và lấy top results
+            sorted_recs = sorted(
+                all_hybrid_recs.values(),
+                key=lambda x: x['hybrid_score'],
+                reverse=True
+            )[:limit]
+            all_recs.extend(sorted_recs)
+            
+            # 6. Thông tin về history patterns cho response
+            results[uid] = {
+                "is_cold_start": False,
+                "recommendation_type": "hybrid",
+                "user_history": {
+                    'viewed_hotels_count': len(viewed_hotel_ids),
+                    'recently_viewed': [{
+                        'hotel_id': v['hotel_id'],
+                        'hotel_name': v['hotel_name'],
+                        'viewed_at': v['viewed_at'].isoformat() if v['viewed_at'] else None
+                    } for v in recent_views[uid][:3]]  # Top 3 gần nhất
+                },
+                "recommendations": sorted_recs
+            }
+        
+        # 7. Enrich tất cả users bằng 1 bộ queries
+        _enrich_smart_recommendations(all_recs)
+    
+    return {uid: results[uid] for uid in user_ids}
+
+
+def _serve_smart_recommendations(user_ids, limit, content_weight, collab_weight, snap, hotel_filter=None):
+    """
+    Helper: Đọc kết quả đã materialize (materialized.py), chỉ tính live cho users thiếu / stale.
+    Mỗi entry có thêm `materialized` (True nếu lấy từ store).
+    Request có filters -> luôn tính live (store chỉ có kết quả không lọc).
+    """
+    from . import materialized
+    
+    entries = materialized.lookup(user_ids, snap.version, limit, content_weight, collab_weight) \
+        if not hotel_filter else {}
+    # Tính lại users stale ở background theo chu kỳ -> các request sau hit store
+    materialized.maybe_refresh()
+    for entry in entries.values():
+        entry['materialized'] = True
+    
+    missing = [uid for uid in user_ids if uid not in entries]
+    if missing:
+        for uid, entry in compute_smart_recommendations(
+            missing, limit, content_weight, collab_weight, snap, hotel_filter=hotel_filter
+        ).items():
+            entry['materialized'] = False
+            entries[uid] = entry
+    
+    return {uid: entries[uid] for uid in user_ids}
+
 
 @api_view(['GET'])
 def get_smart_recommendations(request, user_id):
@@ -544,145 +811,121 @@ def get_smart_recommendations(request, user_id):
     3. Kết hợp với Collaborative Filtering (collaborative.py)
     4. Cold start users -> Fallback về popular hotels (hybrid approach)
     
+    Response được cache theo (user, limit, weights, model version) - xem response_cache.py;
+    khi miss, kết quả được đọc từ materialized store nếu còn fresh, ngược lại tính live
+    (xem compute_smart_recommendations).
+    
     Query params:
         - limit: Số lượng kết quả (mặc định 10)
         - content_weight: Trọng số Content-Based (mặc định 0.6)
         - collab_weight: Trọng số Collaborative (mặc định 0.4)
+        - max_price, min_star, type, location: Filters (xem filters.py)
     """
     try:
         user_id = int(user_id)
         limit = int(request.query_params.get('limit', 10))
         content_weight = float(request.query_params.get('content_weight', 0.6))
         collab_weight = float(request.query_params.get('collab_weight', 0.4))
+        try:
+            hotel_filter = filters.from_query_params(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        
+        from . import response_cache, warmup
         
-        from .hybrid import get_hybrid_recommendations, get_personalized_recommendations
-        from . import collaborative
+        # Pin snapshot cho cả request (không bị ảnh hưởng nếu retrain publish model mới giữa chừng)
+        snap = _pin_snapshot()
         
-        # 1. Kiểm tra cold start
-        if is_cold_start_user(user_id):
+        # 0. Model đang warm-up -> phục vụ popular hotels tính sẵn
+        if not snap.content:
             return Response({
                 "user_id": user_id,
-                "is_cold_start": True,
-                "message": "Chào mừng bạn! Đây là các khách sạn phổ biến được nhiều người yêu thích.",
-                "recommendation_type": "popular_hybrid",
-                "recommendations": get_popular_hotels_list(limit)
+                "is_cold_start": False,
+                "recommendation_type": "popular_fallback",
+                "model_status": warmup.get_status()['status'],
+                "recommendations": warmup.get_fallback_hotels(limit, hotel_filter=hotel_filter)
             })
         
-        # 2. Lấy ViewHistory gần nhất của user (hotels đã xem)
-        recent_views = ViewHistories.objects.filter(
-            account_id=user_id
-        ).select_related('hotel').order_by('-viewed_at')[:5]  # Lấy 5 hotels gần nhất
+        # 1. Response cache (user reload trang hotel)
+        cache_key, cached = response_cache.lookup(
+            user_id, limit, content_weight, collab_weight, snap.version,
+            variant=hotel_filter.cache_key() if hotel_filter else ''
+        )
+        if cached is not None:
+            return Response(cached)
         
-        viewed_hotel_ids = [v.hotel_id for v in recent_views if v.hotel_id]
+        entry = _serve_smart_recommendations([user_id], limit, content_weight, collab_weight, snap, hotel_filter)[user_id]
         
-        # 3. Nếu có ViewHistory -> Sử dụng HYBRID recommendations
-        all_hybrid_recs = {}
+        response = {"user_id": user_id, **entry}
+        if not entry['is_cold_start']:
+            response["algorithm_weights"] = {
+                "content_based": content_weight,
+                "collaborative": collab_weight
+            }
+        response_cache.store(cache_key, response)
+        return Response(response)
         
-        for hotel_id in viewed_hotel_ids:
-            # Gọi thuật toán hybrid.py cho từng hotel đã xem
-            hybrid_recs = get_hybrid_recommendations(
-                hotel_id=hotel_id,
-                user_id=user_id,
-                content_weight=content_weight,
-                collab_weight=collab_weight,
-                limit=limit
-            )
-            
-            # Merge results (cộng dồn scores)
-            for rec in hybrid_recs:
-                hid = rec['hotel_id']
-                if hid not in viewed_hotel_ids:  # Không gợi ý hotels đã xem
-                    if hid not in all_hybrid_recs:
-                        all_hybrid_recs[hid] = {
-                            'hotel_id': hid,
-                            'hybrid_score': rec['hybrid_score'],
-                            'content_score': rec['content_score'],
-                            'collab_score': rec['collab_score'],
-                            'source_hotels': [hotel_id]
-                        }
-                    else:
-                        # Cộng dồn scores và merge sources
-                        all_hybrid_recs[hid]['hybrid_score'] += rec['hybrid_score']
-                        all_hybrid_recs[hid]['content_score'] += rec['content_score']
-                        all_hybrid_recs[hid]['collab_score'] += rec['collab_score']
-                        all_hybrid_recs[hid]['source_hotels'].append(hotel_id)
-        
-        # 4. Nếu không đủ kết quả từ hybrid -> Thêm personalized CF
-        if len(all_hybrid_recs) < limit:
-            personalized_recs = get_personalized_recommendations(user_id, limit)
-            for rec in personalized_recs:
-                hid = rec.get('hotel_id') or rec.get('id')
-                if hid and hid not in viewed_hotel_ids and hid not in all_hybrid_recs:
-                    all_hybrid_recs[hid] = {
-                        'hotel_id': hid,
-                        'hybrid_score': rec.get('cf_score', 0) * 0.8,  # Slightly lower weight
-                        'content_score': 0,
-                        'collab_score': rec.get('cf_score', 0),
-                        'source_hotels': [],
-                        'from_cf': True
-                    }
+    except Exception as e:
+        import traceback
+        return Response({
+            "error": str(e),
+            "traceback": traceback.format_exc()
+        }, status=500)
+
+
+@api_view(['POST'])
+def get_smart_recommendations_batch(request):
+    """
+    Batch API của get_smart_recommendations cho nhiều users trong 1 request
+    (vd: Java backend chuẩn bị email campaign).
+    
+    Users có trong materialized store được trả về ngay, phần còn lại tính live cho cả batch
+    bằng compute_smart_recommendations.
+    
+    Request Body:
+    {
+        "user_ids": [1, 2, 3],
+        "limit": 10,
+        "content_weight": 0.6,
+        "collab_weight": 0.4
+    }
+    
+    Response: results theo user_id, mỗi phần tử cùng format với get_smart_recommendations
+    """
+    try:
+        user_ids, error = _parse_batch_ids(request, 'user_ids')
+        if error is not None:
+            return error
+        limit = int(request.data.get('limit', 10))
+        content_weight = float(request.data.get('content_weight', 0.6))
+        collab_weight = float(request.data.get('collab_weight', 0.4))
         
-        # 5. Sort và lấy top results
-        sorted_recs = sorted(
-            all_hybrid_recs.values(),
-            key=lambda x: x['hybrid_score'],
-            reverse=True
-        )[:limit]
-        
-        # 6. Enrich với hotel info từ database
-        if sorted_recs:
-            hotel_ids = [rec['hotel_id'] for rec in sorted_recs]
-            hotels = Hotels.objects.filter(id__in=hotel_ids).select_related('location').values(
-                'id', 'name', 'address', 'star_rating', 'average_rating', 'total_reviews', 'location__name'
-            )
-            hotels_dict = {h['id']: h for h in hotels}
-            
-            # Lấy thumbnail cho mỗi hotel
-            hotel_thumbnails = {}
-            images = HotelImages.objects.filter(
-                hotel_id__in=hotel_ids,
-                caption='Thumbnail'
-            ).values('hotel_id', 'image_url')
-            for img in images:
-                hotel_thumbnails[img['hotel_id']] = img['image_url']
-            
-            # Lấy giá phòng thấp nhất cho mỗi hotel
-            min_room_prices = get_min_room_prices(hotel_ids)
-            
-            for rec in sorted_recs:
-                hotel_info = hotels_dict.get(rec['hotel_id'], {})
-                rec['name'] = hotel_info.get('name')
-                rec['address'] = hotel_info.get('address')
-                rec['star_rating'] = hotel_info.get('star_rating')
-                rec['average_rating'] = hotel_info.get('average_rating')
-                rec['total_reviews'] = hotel_info.get('total_reviews')
-                rec['location'] = hotel_info.get('location__name')
-                rec['thumbnail'] = hotel_thumbnails.get(rec['hotel_id'])
-                rec['min_room_price'] = min_room_prices.get(rec['hotel_id'])
-                rec['hybrid_score'] = round(rec['hybrid_score'], 4)
-                rec['content_score'] = round(rec['content_score'], 4)
-                rec['collab_score'] = round(rec['collab_score'], 4)
-        
-        # 7. Lấy thông tin về history patterns cho response
-        user_history = {
-            'viewed_hotels_count': len(viewed_hotel_ids),
-            'recently_viewed': [{
-                'hotel_id': v.hotel_id,
-                'hotel_name': v.hotel.name if v.hotel else None,
-                'viewed_at': v.viewed_at.isoformat() if v.viewed_at else None
-            } for v in recent_views[:3]]  # Top 3 gần nhất
-        }
+        from . import warmup
+        
+        snap = _pin_snapshot()
+        
+        # 0. Model đang warm-up -> popular hotels tính sẵn cho tất cả users
+        if not snap.content:
+            fallback = warmup.get_fallback_hotels(limit)
+            return Response({
+                "recommendation_type": "popular_fallback",
+                "model_status": warmup.get_status()['status'],
+                "results": {
+                    uid: {
+                        "is_cold_start": False,
+                        "recommendation_type": "popular_fallback",
+                        "recommendations": fallback
+                    }
+                    for uid in user_ids
+                }
+            })
         
         return Response({
-            "user_id": user_id,
-            "is_cold_start": False,
-            "recommendation_type": "hybrid",
             "algorithm_weights": {
                 "content_based": content_weight,
                 "collaborative": collab_weight
             },
-            "user_history": user_history,
-            "recommendations": sorted_recs
+            "results": _serve_smart_recommendations(user_ids, limit, content_weight, collab_weight, snap)
         })
         
     except Exception as e:
@@ -690,4 +933,4 @@ def get_smart_recommendations(request, user_id):
         return Response({
             "error": str(e),
             "traceback": traceback.format_exc()
-        }, status=500)
\ No newline at end of file
+        }, status=500)
@@ -0,0 +1,188 @@
+"""
+Warm Users Module
+Kiểm tra cold start trong RAM thay cho 1 lần fetch Accounts + 4 queries exists() mỗi request.
+
+- Warm users = users có trong CF model (sorted user_ids của User-Item Matrix, tính sẵn lúc train)
+  + users vừa có action mới (track_user_action) / vừa được xác nhận có data từ DB
+- Chỉ users không có trong 2 tập trên (true negatives) mới phải kiểm tra DB
+- Cột accounts.cold_start được ghi lại theo batch ở background thread
+  (1 UPDATE cho nhiều users, sau tối đa RECOMMENDER_COLD_START_FLUSH_SECONDS),
+  không ghi inline trong GET request
+
+Lưu ý: tập users mới nằm trong từng process (giống delta.py); worker khác sẽ
+xác nhận lại user đó từ DB 1 lần rồi tự thêm vào tập của mình.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+from django.conf import settings
+
+from . import snapshot
+
+# Số ids tối đa mỗi câu UPDATE của write-back
+_UPDATE_CHUNK = 1000
+
+_lock = threading.Lock()
+# Users warm mới (sau lần train gần nhất) của process này
+_recent: Set[int] = set()
+# (cf model, sorted user ids) của lần build gần nhất
+_base_cache = None
+
+# Write-back cold_start = False đang chờ
+_pending: Set[int] = set()
+_flush_timer: Optional[threading.Timer] = None
+
+
+def _flush_interval() -> float:
+    return getattr(settings, 'RECOMMENDER_COLD_START_FLUSH_SECONDS', 5)
+
+
+def _base_ids(cf_data: Dict) -> np.ndarray:
+    """User ids (int64, tăng dần) của CF model - cache theo model (đổi khi train / compaction)."""
+    global _base_cache
+
+    cache = _base_cache
+    if cache is not None and cache[0] is cf_data:
+        return cache[1]
+    user_ids = np.unique(np.asarray(cf_data.get('user_ids', []) if cf_data else [], dtype=np.int64))
+    _base_cache = (cf_data, user_ids)
+    return user_ids
+
+
+def is_warm(user_ids: Iterable[int], cf_data: Optional[Dict] = None) -> np.ndarray:
+    """Boolean mask: user có chắc chắn không phải cold start (không query DB)."""
+    user_ids = np.asarray(list(user_ids), dtype=np.int64)
+    base = _base_ids(snapshot.current().cf if cf_data is None else cf_data)
+
+    warm = np.zeros(user_ids.size, dtype=bool)
+    if base.size:
+        pos = np.minimum(np.searchsorted(base, user_ids), base.size - 1)
+        warm = base[pos] == user_ids
+    if _recent:
+        warm |= np.fromiter((uid in _recent for uid in user_ids.tolist()), dtype=bool, count=user_ids.size)
+    return warm
+
+
+def mark_warm(user_ids: Iterable[int], write_back: bool = True) -> None:
+    """
+    Đánh dấu users không còn cold start.
+
+    Args:
+        write_back: True -> xếp hàng ghi accounts.cold_start = False (batch, background)
+    """
+    user_ids = {int(uid) for uid in user_ids}
+    if not user_ids:
+        return
+    with _lock:
+        _recent.update(user_ids)
+    if write_back:
+        _enqueue(user_ids)
+
+
+def reset() -> None:
+    """Bỏ tập users mới (sau khi publish CF model mới, các users này đã có trong model base)."""
+    with _lock:
+        _recent.clear()
+
+
+def get_cold_start_users(user_ids: List[int], cf_data: Optional[Dict] = None) -> Set[int]:
+    """
+    Users vẫn là cold start (kể cả users không tồn tại).
+    Warm users trả lời từ RAM; chỉ các users còn lại mới kiểm tra DB (5 queries cho cả batch).
+    """
+    from .models import Accounts, ViewHistories, FavoriteHotels, Bookings, HotelReviews
+
+    user_ids = list(user_ids)
+    warm = is_warm(user_ids, cf_data)
+    unknown = [uid for uid, is_warm_user in zip(user_ids, warm.tolist()) if not is_warm_user]
+    if not unknown:
+        return set()
+
+    accounts = dict(Accounts.objects.filter(id__in=unknown).values_list('id', 'cold_start'))
+    already_warm = {uid for uid, cold_start in accounts.items() if not cold_start}
+    candidates = [uid for uid, cold_start in accounts.items() if cold_start]
+
+    has_data = set()
+    if candidates:
+        has_data.update(ViewHistories.objects.filter(account_id__in=candidates).values_list('account_id', flat=True).distinct())
+        has_data.update(FavoriteHotels.objects.filter(account_id__in=candidates).values_list('account_id', flat=True).distinct())
+        has_data.update(Bookings.objects.filter(user_id__in=candidates).values_list('user_id', flat=True).distinct())
+        has_data.update(HotelReviews.objects.filter(user_id__in=candidates).values_list('user_id', flat=True).distinct())
+
+    mark_warm(already_warm, write_back=False)
+    if has_data:
+        # cold_start = False được ghi lại ở background (batch)
+        mark_warm(has_data)
+        print(f"✅ {len(has_data)} users không còn cold-start")
+
+    return {uid for uid in unknown if accounts.get(uid, True) and uid not in has_data}
+
+
+# --- WRITE-BACK ---
+
+def _enqueue(user_ids: Set[int]) -> None:
+    global _flush_timer
+
+    with _lock:
+        _pending.update(user_ids)
+        if _flush_timer is not None:
+            return
+        timer = _flush_timer = threading.Timer(_flush_interval(), flush)
+        timer.daemon = True
+    timer.start()
+
+
+def pending_writes() -> int:
+    return len(_pending)
+
+
+def flush() -> int:
+    """
+    Ghi accounts.cold_start = False cho các users đang chờ.
+
+    Returns:
+        Số users đã ghi (lỗi -> users được xếp hàng lại cho lần sau)
+    """
+    from django.db import close_old_connections
+
+    global _flush_timer
+
+    with _lock:
+        user_ids = sorted(_pending)
+        _pending.clear()
+        _flush_timer = None
+    if not user_ids:
+        return 0
+
+    try:
+        _write_warm(user_ids)
+        return len(user_ids)
+    except Exception as e:
+        print(f"⚠️ Không thể ghi cold_start cho {len(user_ids)} users: {e}")
+        _enqueue(set(user_ids))
+        return 0
+    finally:
+        close_old_connections()
+
+
+def _write_warm(user_ids: List[int]) -> int:
+    """UPDATE accounts SET cold_start = False theo từng chunk ids. Trả về số hàng đã đổi."""
+    from .models import Accounts
+
+    updated = 0
+    for start in range(0, len(user_ids), _UPDATE_CHUNK):
+        chunk = user_ids[start:start + _UPDATE_CHUNK]
+        updated += Accounts.objects.filter(id__in=chunk, cold_start=True).update(cold_start=False)
+    return updated
+
+
+def sync_cold_start_flags(cf_data: Dict) -> int:
+    """
+    Sau khi train: ghi cold_start = False cho mọi users có trong CF model
+    (các users này được trả lời từ RAM nên không còn được ghi lại lúc request).
+    """
+    updated = _write_warm(_base_ids(cf_data).tolist()) if cf_data else 0
+    if updated:
+        print(f"✅ {updated} users không còn cold-start")
+    return updated
@@ -0,0 +1,146 @@
+"""
+Warm-up Module
+Khởi động model ở background thread để worker không bị block lúc boot.
+
+Readiness state:
+- loading: đang load artifact / train, requests được phục vụ bằng danh sách popular hotels
+- ready: Content-Based + CF đều đã sẵn sàng
+- degraded: warm-up xong nhưng thiếu model (vd: CF không đủ dữ liệu, train lỗi)
+"""
+import threading
+import datetime
+from typing import Any, Dict, List
+
+STATUS_LOADING = 'loading'
+STATUS_READY = 'ready'
+STATUS_DEGRADED = 'degraded'
+
+# Số popular hotels (đọc từ popularity leaderboard) giữ sẵn để phục vụ trong lúc model đang warm-up
+FALLBACK_POPULAR_SIZE = 50
+
+_lock = threading.Lock()
+_thread = None
+_state: Dict[str, Any] = {
+    'status': STATUS_LOADING,
+    'model_version': None,
+    'started_at': None,
+    'ready_at': None,
+    'error': None,
+}
+_popular_fallback: List[Dict[str, Any]] = []
+
+
+def _now_iso() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _compute_popular_fallback() -> None:
+    from .views import get_popular_hotels_list
+
+    try:
+        _popular_fallback[:] = get_popular_hotels_list(FALLBACK_POPULAR_SIZE)
+        print(f"✅ Đã tính sẵn {len(_popular_fallback)} popular hotels cho fallback")
+    except Exception as e:
+        print(f"⚠️ Không thể tính popular hotels fallback: {e}")
+
+
+def refresh_status(version=None) -> str:
+    """Tính lại readiness dựa trên models đang có (gọi sau warm-up / retrain)."""
+    from . import snapshot
+
+    snap = snapshot.current()
+    status = STATUS_READY if snap.content and snap.cf else STATUS_DEGRADED
+    _state.update(status=status, ready_at=_now_iso())
+    if version:
+        _state.update(model_version=version, error=None)
+    return status
+
+
+def _run() -> None:
+    """
+    Thân của warm-up thread.
+    Có artifact -> load mmap (vài ms). Chưa có -> tính fallback trước rồi submit retrain job
+    (dedup giữa các workers: chỉ 1 worker train, các worker khác chờ rồi load artifact).
+    """
+    from django.db import close_old_connections
+    from . import catalog, jobs, snapshot
+    from .training import load_latest, reload_if_stale
+
+    try:
+        try:
+            version = load_latest()
+        except Exception as e:
+            print(f"⚠️ Không thể load model artifact: {e}")
+            version = None
+
+        if version is None:
+            _compute_popular_fallback()
+            print("⚠️ Chưa có model artifact -> train mới...")
+            job, _ = jobs.submit_retrain()
+            job = jobs.wait_for_job(job['job_id'])
+            if job and job['status'] == jobs.STATUS_FAILED:
+                _state.update(error=job['error'])
+            reload_if_stale(force=True)
+            version = snapshot.current().version
+
+        try:
+            catalog.refresh(full=True)
+        except Exception as e:
+            print(f"⚠️ Không thể load hotel catalog: {e}")
+
+        status = refresh_status(version)
+        print(f"✅ Warm-up hoàn tất: {status}")
+    except Exception as e:
+        _state.update(status=STATUS_DEGRADED, error=str(e), ready_at=_now_iso())
+        print(f"⚠️ Warm-up lỗi: {e}")
+    finally:
+        close_old_connections()
+
+
+def start_warmup(background: bool = True) -> None:
+    """
+    Bắt đầu warm-up (chỉ chạy 1 lần mỗi process).
+
+    Args:
+        background: True -> chạy trong daemon thread, False -> chạy đồng bộ
+    """
+    global _thread
+
+    with _lock:
+        if _thread is not None:
+            return
+        _state.update(status=STATUS_LOADING, started_at=_now_iso(), ready_at=None, error=None)
+        _thread = threading.Thread(target=_run, name='model-warmup', daemon=True)
+
+    if background:
+        _thread.start()
+    else:
+        _run()
+
+
+def get_status() -> Dict[str, Any]:
+    """Readiness state hiện tại (dùng cho API /model/status/)."""
+    from . import snapshot
+
+    snap = snapshot.current()
+    return {
+        **_state,
+        'content_loaded': bool(snap.content),
+        'collaborative_loaded': bool(snap.cf),
+    }
+
+
+def get_fallback_hotels(limit: int = 10, exclude_ids=(), hotel_filter=None) -> List[Dict[str, Any]]:
+    """
+    Popular hotels đã tính sẵn - dùng khi model chưa sẵn sàng.
+
+    Args:
+        hotel_filter: Optional filters.HotelFilter - xếp hạng popular chỉ trong các hotels thỏa filter
+            (popularity leaderboard + hotel catalog) thay vì danh sách tính sẵn
+    """
+    if hotel_filter:
+        from .views import get_popular_hotels_list
+
+        hotels = get_popular_hotels_list(limit + len(exclude_ids), hotel_filter=hotel_filter)
+        return [h for h in hotels if h['id'] not in exclude_ids][:limit]
+    return [h for h in _popular_fallback if h['id'] not in exclude_ids][:limit]
@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tripgo_ai_service.settings')
 
 application = get_asgi_application()
+
+# Warm-up model ở background thread: load artifact (mmap), chỉ train nếu chưa có artifact nào.
+# Trong lúc warm-up, API trả về popular hotels thay vì lỗi 503.
+from recommender.warmup import start_warmup  # noqa: E402
+
+start_warmup()
@@ -150,3 +150,95 @@ CORS_ALLOW_CREDENTIALS = True
 
 # Cho phép tất cả origins trong development (tùy chọn - chỉ dùng khi dev)
 # CORS_ALLOW_ALL_ORIGINS = True
+
+# Recommender configuration
+# Số hotels tương tự giữ lại cho mỗi hotel trong Content-Based model (top-K neighbor table)
+RECOMMENDER_CONTENT_TOP_K = int(os.environ.get('RECOMMENDER_CONTENT_TOP_K', '100'))
+
+# Thư mục lưu model artifacts (train bằng `python manage.py train_models`)
+RECOMMENDER_ARTIFACT_DIR = os.environ.get('RECOMMENDER_ARTIFACT_DIR', str(BASE_DIR / 'model_artifacts'))
+# Số artifact cũ giữ lại trên đĩa
+RECOMMENDER_ARTIFACT_KEEP = int(os.environ.get('RECOMMENDER_ARTIFACT_KEEP', '3'))
+# Chu kỳ (giây) mỗi worker kiểm tra artifact mới do worker khác train
+RECOMMENDER_RELOAD_CHECK_SECONDS = int(os.environ.get('RECOMMENDER_RELOAD_CHECK_SECONDS', '10'))
+
+# Override trọng số rating / time decay của CF (xem collaborative.CFWeightConfig), vd: {'decay_rate': 0.03}
+# Giá trị sai (âm, không phải số, key lạ) -> ImproperlyConfigured ngay khi load module
+RECOMMENDER_CF_WEIGHTS = {}
+
+# Delta buffer CF (track_user_action): compaction vào model base khi vượt số events hoặc sau mỗi chu kỳ (giây)
+RECOMMENDER_CF_DELTA_MAX_EVENTS = int(os.environ.get('RECOMMENDER_CF_DELTA_MAX_EVENTS', '5000'))
+RECOMMENDER_CF_DELTA_COMPACT_SECONDS = int(os.environ.get('RECOMMENDER_CF_DELTA_COMPACT_SECONDS', '300'))
+# Số users (hay được request) giữ cache danh sách similar users trong mỗi worker
+RECOMMENDER_USER_NEIGHBOR_CACHE_SIZE = int(os.environ.get('RECOMMENDER_USER_NEIGHBOR_CACHE_SIZE', '1024'))
+
+# Item-Based CF: số hotels tương tự giữ lại cho mỗi hotel + số users chung tối thiểu của 1 cặp
+RECOMMENDER_ITEM_TOP_K = int(os.environ.get('RECOMMENDER_ITEM_TOP_K', '50'))
+RECOMMENDER_ITEM_MIN_SUPPORT = int(os.environ.get('RECOMMENDER_ITEM_MIN_SUPPORT', '2'))
+
+# CF engine: 'neighborhood' (user/item neighbors) hoặc 'als' (implicit ALS - recommender/als.py)
+RECOMMENDER_CF_ENGINE = os.environ.get('RECOMMENDER_CF_ENGINE', 'neighborhood')
+RECOMMENDER_ALS_FACTORS = int(os.environ.get('RECOMMENDER_ALS_FACTORS', '32'))
+RECOMMENDER_ALS_ITERATIONS = int(os.environ.get('RECOMMENDER_ALS_ITERATIONS', '10'))
+RECOMMENDER_ALS_REGULARIZATION = float(os.environ.get('RECOMMENDER_ALS_REGULARIZATION', '0.05'))
+RECOMMENDER_ALS_ALPHA = float(os.environ.get('RECOMMENDER_ALS_ALPHA', '10.0'))
+RECOMMENDER_ALS_CG_STEPS = int(os.environ.get('RECOMMENDER_ALS_CG_STEPS', '3'))
+
+# ANN index (recommender/ann.py): dùng khi số vectors >= MIN_ITEMS; NPROBE càng lớn recall càng cao nhưng chậm hơn
+RECOMMENDER_ANN_MIN_ITEMS = int(os.environ.get('RECOMMENDER_ANN_MIN_ITEMS', '20000'))
+RECOMMENDER_ANN_NPROBE = int(os.environ.get('RECOMMENDER_ANN_NPROBE', '8'))
+
+# Batch endpoints (recommend/batch/, recommend/smart/batch/): số ids tối đa mỗi request
+RECOMMENDER_BATCH_MAX_IDS = int(os.environ.get('RECOMMENDER_BATCH_MAX_IDS', '5000'))
+
+# Materialized smart recommendations (recommender/materialized.py): SQLite store top-N mỗi user,
+# rebuild sau mỗi lần train bằng process pool (shard theo khoảng user_id)
+RECOMMENDER_MATERIALIZED_ENABLED = os.environ.get('RECOMMENDER_MATERIALIZED_ENABLED', 'True').lower() in ('true', '1', 'yes')
+RECOMMENDER_MATERIALIZE_ON_TRAIN = os.environ.get('RECOMMENDER_MATERIALIZE_ON_TRAIN', 'True').lower() in ('true', '1', 'yes')
+RECOMMENDER_MATERIALIZED_PATH = os.environ.get('RECOMMENDER_MATERIALIZED_PATH') or None
+# Store chỉ phục vụ request có limit đúng bằng TOP_N (mặc định = limit mặc định của recommend/smart/)
+RECOMMENDER_MATERIALIZED_TOP_N = int(os.environ.get('RECOMMENDER_MATERIALIZED_TOP_N', '10'))
+RECOMMENDER_MATERIALIZED_MAX_AGE_SECONDS = int(os.environ.get('RECOMMENDER_MATERIALIZED_MAX_AGE_SECONDS', '86400'))
+RECOMMENDER_MATERIALIZED_PROCESSES = int(os.environ.get('RECOMMENDER_MATERIALIZED_PROCESSES', str(min(4, os.cpu_count() or 1))))
+RECOMMENDER_MATERIALIZED_SHARD_SIZE = int(os.environ.get('RECOMMENDER_MATERIALIZED_SHARD_SIZE', '2000'))
+# Refresh nền users stale (có action mới / quá max age) theo chu kỳ (giây, 0 = tắt), tối đa BATCH users mỗi lần
+RECOMMENDER_MATERIALIZED_REFRESH_SECONDS = int(os.environ.get('RECOMMENDER_MATERIALIZED_REFRESH_SECONDS', '300'))
+RECOMMENDER_MATERIALIZED_REFRESH_BATCH = int(os.environ.get('RECOMMENDER_MATERIALIZED_REFRESH_BATCH', '500'))
+
+# Hotel catalog trong RAM dùng để enrich kết quả (recommender/catalog.py):
+# refresh incremental theo updated_at, load lại toàn bộ định kỳ để bắt hotels / ảnh bị xóa
+RECOMMENDER_CATALOG_REFRESH_SECONDS = int(os.environ.get('RECOMMENDER_CATALOG_REFRESH_SECONDS', '60'))
+RECOMMENDER_CATALOG_FULL_REFRESH_SECONDS = int(os.environ.get('RECOMMENDER_CATALOG_FULL_REFRESH_SECONDS', '3600'))
+
+# Số giây tối đa trước khi accounts.cold_start = False được ghi lại theo batch (recommender/warm_users.py)
+RECOMMENDER_COLD_START_FLUSH_SECONDS = float(os.environ.get('RECOMMENDER_COLD_START_FLUSH_SECONDS', '5'))
+
+# Diversity re-ranking (recommender/diversity.py): 'cap' (giới hạn theo location / type) hoặc 'mmr'
+# (Maximal Marginal Relevance trên content embeddings, λ càng nhỏ kết quả càng đa dạng)
+RECOMMENDER_DIVERSITY_MODE = os.environ.get('RECOMMENDER_DIVERSITY_MODE', 'cap')
+RECOMMENDER_MMR_LAMBDA = float(os.environ.get('RECOMMENDER_MMR_LAMBDA', '0.7'))
+# Mode 'cap' giới hạn theo vùng thay vì tên location: độ sâu trong cây Locations của vùng
+# (0 = location gốc, vd: tỉnh / thành phố); rỗng = theo location của hotel
+RECOMMENDER_DIVERSITY_REGION_DEPTH = (
+    int(os.environ['RECOMMENDER_DIVERSITY_REGION_DEPTH']) if os.environ.get('RECOMMENDER_DIVERSITY_REGION_DEPTH') else None
+)
+
+# Response cache của smart recommendations (recommender/response_cache.py)
+# Mặc định locmem (mỗi worker 1 cache); đổi RECOMMENDER_CACHE_BACKEND sang
+# 'recommender.response_cache.FileBasedCache' hoặc 'django.core.cache.backends.redis.RedisCache'
+# (kèm RECOMMENDER_CACHE_LOCATION) để các workers dùng chung cache
+RECOMMENDER_RESPONSE_CACHE_ENABLED = os.environ.get('RECOMMENDER_RESPONSE_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+RECOMMENDER_RESPONSE_CACHE_ALIAS = 'recommender'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    RECOMMENDER_RESPONSE_CACHE_ALIAS: {
+        'BACKEND': os.environ.get('RECOMMENDER_CACHE_BACKEND', 'recommender.response_cache.LocMemCache'),
+        'LOCATION': os.environ.get('RECOMMENDER_CACHE_LOCATION', 'recommender-responses'),
+        'TIMEOUT': int(os.environ.get('RECOMMENDER_CACHE_TTL_SECONDS', '300')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('RECOMMENDER_CACHE_MAX_ENTRIES', '10000')),
+        },
+    },
+}